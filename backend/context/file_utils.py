@@ -1,45 +1,69 @@
-import os
+"""
+Text extraction for uploaded context files.
+
+Extractors are registered per file extension with @register_extractor; the allowed
+upload types are the registered extensions. The parsers for binary formats (PyPDF2,
+python-docx) are imported on first use, so importing this module (and the API)
+does not pay for them until a PDF or DOCX file is uploaded.
+"""
 import io
-import re
-from typing import List
-from PyPDF2 import PdfReader
-import docx
+from typing import Callable, Dict
+
+Extractor = Callable[[bytes], str]
+
+EXTRACTORS: Dict[str, Extractor] = {}
+# Live view of the registered extensions
+ALLOWED_EXTENSIONS = EXTRACTORS.keys()
+
 
-ALLOWED_EXTENSIONS = {"pdf", "docx", "txt", "md"}
+def register_extractor(*extensions: str):
+    """
+    Decorator registering a bytes -> text extractor for one or more file extensions.
+    """
+    def register(fn: Extractor) -> Extractor:
+        for ext in extensions:
+            EXTRACTORS[ext.lower().lstrip(".")] = fn
+        return fn
+    return register
+
+
+def file_extension(filename: str) -> str:
+    return filename.rsplit(".", 1)[1].lower() if "." in filename else ""
 
 
 def allowed_file(filename: str) -> bool:
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+    return file_extension(filename) in EXTRACTORS
 
 
+@register_extractor("pdf")
 def extract_text_from_pdf(file_bytes: bytes) -> str:
+    from PyPDF2 import PdfReader
+
     reader = PdfReader(io.BytesIO(file_bytes))
     text = "\n".join(page.extract_text() or "" for page in reader.pages)
     return text
 
 
+@register_extractor("docx")
 def extract_text_from_docx(file_bytes: bytes) -> str:
+    import docx
+
     doc = docx.Document(io.BytesIO(file_bytes))
     return "\n".join([p.text for p in doc.paragraphs])
 
 
+@register_extractor("txt")
 def extract_text_from_txt(file_bytes: bytes) -> str:
     return file_bytes.decode(errors="ignore")
 
 
+@register_extractor("md")
 def extract_text_from_md(file_bytes: bytes) -> str:
     return file_bytes.decode(errors="ignore")
 
 
 def extract_text(filename: str, file_bytes: bytes) -> str:
-    ext = filename.rsplit(".", 1)[1].lower()
-    if ext == "pdf":
-        return extract_text_from_pdf(file_bytes)
-    elif ext == "docx":
-        return extract_text_from_docx(file_bytes)
-    elif ext == "txt":
-        return extract_text_from_txt(file_bytes)
-    elif ext == "md":
-        return extract_text_from_md(file_bytes)
-    else:
+    extractor = EXTRACTORS.get(file_extension(filename))
+    if extractor is None:
         raise ValueError("Unsupported file type")
+    return extractor(file_bytes)
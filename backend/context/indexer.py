@@ -3,6 +3,11 @@ from collections import Counter
 from typing import List, Dict
 from pymongo.collection import Collection
 
+try:
+    from ..telemetry.tracing import span
+except ImportError:  # imported as the top-level ``context`` package (backend/ on sys.path)
+    from telemetry.tracing import span
+
 def chunk_text(text: str, chunk_size: int = 500) -> List[str]:
     # Simple chunking by sentences, fallback to fixed size
     sentences = re.split(r'(?<=[.!?]) +', text)
@@ -38,10 +43,14 @@ def search_chunks(query: str, user_id: str, collection: Collection, top_k: int =
     query_words = set(re.findall(r'\w+', query.lower()))
     pipeline = [
         {"$match": {"user_id": user_id}},
+        # Number of query words among the chunk's (distinct) keywords
         {"$addFields": {
-            "relevance": {"$size": {"$setIntersection": ["$keywords", list(query_words)]}}
+            "relevance": {"$size": {"$filter": {"input": "$keywords", "cond": {"$in": ["$$this", list(query_words)]}}}}
         }},
         {"$sort": {"relevance": -1}},
         {"$limit": top_k}
     ]
-    return list(collection.aggregate(pipeline))
+    with span("context.search_chunks", {"context.query_words": len(query_words), "context.top_k": top_k}) as s:
+        results = list(collection.aggregate(pipeline))
+        s.set_attribute("context.results", len(results))
+    return results
@@ -7,7 +7,7 @@ This FastAPI backend provides endpoints for:
 - Conversation history retrieval
 - File upload for user context (PDF, DOCX, TXT, MD)
 - Context chunking, indexing, and secure search
-- Health and status checks
+- Health, liveness/readiness and status checks
 
 Pipeline Overview:
 ------------------
@@ -25,15 +25,32 @@ Security Practices:
 - All endpoints return sanitized, non-leaky error messages
 - MongoDB ObjectIds and internal fields are stripped from API responses
 
+Deployment:
+-----------
+create_app() builds the FastAPI app with a lifespan that connects to Mongo and runs the
+database migrations (once per database, under a lock), preloads caches and starts
+background tasks, and reports how long startup took. Importing this module opens no
+connections and defers heavy optional dependencies (PDF/DOCX parsers, Markdown,
+Pygments) to first use, so it is cheap to import and can be preloaded by a pre-fork
+server: see server/serve.py for the multi-worker entry point. Until Mongo is reachable
+the routes that need it answer 503 (see server/readiness.py).
+
 See /docs/context-retrieval.md for more details on the context system.
 """
+import time
+IMPORT_STARTED = time.perf_counter()  # start of this worker's startup profile
 import os
+import re
+import json
+import math
 import logging
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, Request, Response, status, Body
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, Response, status, Body
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient, ASCENDING
+from pymongo import MongoClient, ASCENDING, timeout as mongo_timeout
 from pydantic_settings import BaseSettings
 from pydantic import BaseModel, Field
 from pydantic import ConfigDict
@@ -42,6 +59,21 @@ from starlette.requests import Request as StarletteRequest
 from fastapi import UploadFile, File, Form
 from backend.context.file_utils import allowed_file, extract_text
 from backend.context.indexer import chunk_text, index_chunks, search_chunks
+from backend.orchestrator.orchestrator import LLMOrchestrator
+from backend.orchestrator.scheduler import OutboundScheduler, ProviderBusyError
+from backend.orchestrator.batch import checkpoint_name, load_prompts_jsonl
+from backend.ratelimit.limiter import create_rate_limiter, ensure_rate_limit_indexes, rate_limit_headers, RateLimitResult
+from backend.server.health import HealthMonitor
+from backend.server.migrations import Migration, run_migrations
+from backend.server.readiness import CONNECTING, Readiness, connect_with_retry
+from backend.telemetry import metrics
+from backend.usage.quota import Budget, QuotaDecision, QuotaExceededError, QuotaManager, parse_budgets, quota_headers
+from backend.usage.tracker import UsageTracker, usage_day
+from backend.telemetry.logs import configure_logging, request_context
+from backend.telemetry.mongo import MongoTracingListener
+from backend.telemetry.startup import StartupProfile
+from backend.telemetry.tracing import (configure_tracing, current_span, exporter_from_config, get_tracer,
+                                       parse_traceparent, span)
 
 
 
@@ -51,15 +83,73 @@ class Settings(BaseSettings):
     MONGODB_URI: str = "mongodb://localhost:27017/llmchatbot"
     ALLOWED_ORIGINS: str = "http://localhost:5173"
     GEMINI_API_KEY: str = ""
+    LLM_PROVIDER: str = "googleai"  # comma-separated for failover, e.g. "googleai,mock"
+    LLM_HEDGE: bool = False
+    LLM_ROUTING: str = "priority"  # "priority" (configured order) or "weighted" (health/latency)
+    LLM_MAX_CONCURRENCY: int = 8  # concurrent calls per provider (all workers together)
+    LLM_REQUESTS_PER_MINUTE: float = 0  # per provider, 0 = unlimited (all workers together)
+    LLM_TOKENS_PER_MINUTE: float = 0  # per provider, 0 = unlimited (all workers together)
+    LLM_QUEUE_TIMEOUT: float = 5.0  # max seconds a call waits for a provider slot before a 429
+    WORKERS: int = 1  # worker processes serving the app (set by server/serve.py)
+    MIGRATION_LOCK_TTL: float = 60.0  # seconds before a dead worker's migration lock is taken over
+    DB_CONNECT_TIMEOUT: float = 5.0  # seconds per Mongo connection attempt at startup (retried with backoff)
+    DB_STARTUP_WAIT: float = 10.0  # seconds startup waits for Mongo before serving without it (503s until ready)
+    HEALTH_PING_INTERVAL: float = 5.0  # seconds between the background Mongo pings read by the health probes
+    HEALTH_PING_TIMEOUT: float = 2.0  # seconds before a ping counts as failed
+    RATE_LIMIT_BACKEND: str = "auto"  # "memory" (single process), "mongo" (shared), "auto" (mongo when WORKERS > 1)
+    RATE_LIMIT_COUNT: int = 10
+    RATE_LIMIT_WINDOW: int = 60  # seconds
+    BATCH_MAX_ITEMS: int = 10000
+    USAGE_BATCH_SIZE: int = 500  # usage records are bulk-written once this many are buffered...
+    USAGE_FLUSH_INTERVAL: float = 1.0  # ...or after this many seconds
+    QUOTA_USER_TOKENS_PER_DAY: int = 0  # per-user LLM budgets, 0 = unlimited (UTC day / month)
+    QUOTA_USER_COST_PER_MONTH: float = 0  # USD
+    QUOTA_TENANT_TOKENS_PER_DAY: int = 0  # per-tenant budgets (tenant_id in chat requests)
+    QUOTA_TENANT_COST_PER_MONTH: float = 0
+    QUOTA_OVERRIDES: str = ""  # JSON (inline or a file): {"user:<id>": {"tokens_per_day", "cost_per_month"}, "tenant:<id>": ...}
+    QUOTA_OUTPUT_ESTIMATE: int = 512  # response tokens reserved per call until the actual count is known
+    BATCH_CONCURRENCY: int = 8
+    RESPONSE_MAX_LENGTH: int = 2048  # LLM responses are truncated (structure-aware) past this many characters
+    LINK_ALLOWLIST: str = ""  # comma-separated domains or a file with one per line; links to them are kept
+    LINK_DENYLIST: str = ""  # same format; links to them are stripped
+    LINK_KNOWN_GOOD: Optional[str] = None  # replaces the built-in known-good domains when set
+    LINK_UNKNOWN_ACTION: str = "keep"  # links to other domains: "keep", "annotate" or "strip"
+    LINK_CACHE_TTL: float = 300.0  # seconds a per-domain verdict is cached
+    TRACE_EXPORTER: str = ""  # "" (off), "memory", "file:<path>" or "otlp:<collector url>"
+    TRACE_SAMPLE_RATIO: float = 0.1  # share of traces recorded (decided at the root of each trace)
+    TRACE_SERVICE_NAME: str = "chatbot-backend"
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" (one object per line) or "text"
+    LOG_SAMPLING: str = "access=0.1"  # share of INFO lines kept per logger, "name=rate,..."; WARNING+ is never sampled
     model_config = ConfigDict(env_file=".env", extra="allow")
 
 settings = Settings()
 
+# Logging (see telemetry/logs.py): JSON lines written by a background thread, tagged with request ids
+configure_logging(settings.LOG_LEVEL, settings.LOG_SAMPLING, settings.LOG_FORMAT != "text")
+
+# Tracing (see telemetry/tracing.py): spans per request, chat stage, Mongo command and provider attempt
+configure_tracing(exporter_from_config(settings.TRACE_EXPORTER, settings.TRACE_SERVICE_NAME),
+                  settings.TRACE_SAMPLE_RATIO)
+
+
+# Routes are registered on a router; create_app() (end of this module) mounts it on the app
+router = APIRouter()
+startup = StartupProfile(started=IMPORT_STARTED)
 
-app = FastAPI()
+# Mongo readiness: connected (and migrated) by the lifespan, see connect_database()
+database = Readiness("mongo")
 
-# File upload endpoint (must be after app is defined)
-@app.post("/api/context/upload")
+def require_database():
+    """
+    Route dependency: 503 while the lifespan is still connecting to Mongo.
+    """
+    if not database.serving:
+        raise HTTPException(status_code=503, detail="Database unavailable, please retry",
+                            headers={"Retry-After": "5"})
+
+# File upload endpoint
+@router.post("/api/context/upload", dependencies=[Depends(require_database)])
 async def upload_context_file(user_id: str = Form(...), file: UploadFile = File(...)):
     """
     Upload a context file (PDF, DOCX, TXT, MD) for a user.
@@ -71,7 +161,7 @@ async def upload_context_file(user_id: str = Form(...), file: UploadFile = File(
     """
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
     if not allowed_file(file.filename):
-        logger.warning(f"Rejected upload: {file.filename} (user={user_id}) - unsupported type")
+        logger.warning("Rejected upload: %s (user=%s) - unsupported type", file.filename, user_id)
         return JSONResponse(status_code=400, content={"detail": "Unsupported file type"})
     # Prevent path traversal and ensure unique filename
     orig_filename = os.path.basename(file.filename)
@@ -79,48 +169,41 @@ async def upload_context_file(user_id: str = Form(...), file: UploadFile = File(
     save_path = os.path.join(UPLOAD_FOLDER, unique_filename)
     contents = await file.read()
     if len(contents) > MAX_FILE_SIZE:
-        logger.warning(f"Rejected upload: {orig_filename} (user={user_id}) - file too large")
+        logger.warning("Rejected upload: %s (user=%s) - file too large", orig_filename, user_id)
         return JSONResponse(status_code=400, content={"detail": "File too large (max 10MB)"})
-    try:
-        with open(save_path, "wb") as f:
-            f.write(contents)
-    except Exception as e:
-        logger.error(f"Failed to save file: {e}")
-        return JSONResponse(status_code=500, content={"detail": f"Failed to save file: {e}"})
-    try:
-        text = extract_text(orig_filename, contents)
-    except Exception as e:
-        logger.warning(f"Extraction failed for {orig_filename} (user={user_id}): {e}")
-        return JSONResponse(status_code=400, content={"detail": f"Extraction failed: {e}"})
-    try:
-        chunks = chunk_text(text)
-        index_chunks(chunks, unique_filename, user_id, context_collection)
-    except Exception as e:
-        logger.error(f"Indexing failed for {unique_filename} (user={user_id}): {e}")
-        return JSONResponse(status_code=500, content={"detail": f"Indexing failed: {e}"})
-    logger.info(f"File uploaded and indexed: {unique_filename} (user={user_id}, chunks={len(chunks)})")
+    # Uploads in progress are the ingestion queue depth reported by the readiness probe
+    with metrics.INGESTION_IN_PROGRESS.track_inprogress():
+        try:
+            with open(save_path, "wb") as f:
+                f.write(contents)
+        except Exception as e:
+            logger.error("Failed to save file: %s", e)
+            return JSONResponse(status_code=500, content={"detail": f"Failed to save file: {e}"})
+        try:
+            text = extract_text(orig_filename, contents)
+        except Exception as e:
+            logger.warning("Extraction failed for %s (user=%s): %s", orig_filename, user_id, e)
+            return JSONResponse(status_code=400, content={"detail": f"Extraction failed: {e}"})
+        try:
+            chunks = chunk_text(text)
+            index_chunks(chunks, unique_filename, user_id, context_collection)
+        except Exception as e:
+            logger.error("Indexing failed for %s (user=%s): %s", unique_filename, user_id, e)
+            return JSONResponse(status_code=500, content={"detail": f"Indexing failed: {e}"})
+    logger.info("File uploaded and indexed: %s (user=%s, chunks=%s)", unique_filename, user_id, len(chunks))
     return {"status": "ok", "chunks_indexed": len(chunks)}
 
-# CORS config
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[settings.ALLOWED_ORIGINS],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-
 # Search endpoint
-@app.post("/api/context/search")
+@router.post("/api/context/search", dependencies=[Depends(require_database)])
 async def search_context(user_id: str = Body(...), query: str = Body(...)):
     """
     Search indexed context chunks for a user.
     - Returns a list of matching chunks (internal DB fields removed).
     """
     try:
+        start = time.perf_counter()
         results = search_chunks(query, user_id, context_collection)
+        chat_stage["retrieval"].observe(time.perf_counter() - start)
         def clean(doc):
             d = dict(doc)
             d.pop('_id', None)
@@ -128,55 +211,202 @@ async def search_context(user_id: str = Body(...), query: str = Body(...)):
         clean_results = [clean(r) for r in results]
         return {"results": clean_results}
     except Exception as e:
-        logger.error(f"Context search error: {e}")
+        logger.error("Context search error: %s", e)
         return JSONResponse(status_code=500, content={"detail": "Context search failed"})
 
-# Logging config
-logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger(__name__)
-
-# MongoDB client and ensure indexes
-client = MongoClient(settings.MONGODB_URI)
+# One line per request; INFO lines are sampled (LOG_SAMPLING), errors and slow requests are not
+access_logger = logging.getLogger("access")
+SLOW_REQUEST_SECONDS = 2.0
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# MongoDB client. connect=False: no connection (or monitor thread) until the lifespan
+# connects, after a pre-fork server has forked the worker. Indexes are created by MIGRATIONS.
+client = MongoClient(settings.MONGODB_URI, connect=False, event_listeners=[MongoTracingListener()])
 db = client.get_database()
 convos = db.conversations
-convos.create_index([("user_id", ASCENDING)])
-convos.create_index([("updated_at", ASCENDING)])
 
-# Secure upload folder (must be after os and db are defined)
+# Secure upload folder (created at startup)
 UPLOAD_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '../uploads'))
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+BATCH_CHECKPOINT_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '../batch_checkpoints'))
 context_collection = db.context_chunks
 
-# In-memory rate limit tracker: {user_id: [timestamps]}
-from collections import defaultdict, deque
-import time
-rate_limit_window = 60  # seconds
-rate_limit_count = 10
-user_message_times = defaultdict(lambda: deque(maxlen=rate_limit_count))
+# Per-user message rate limiter (sliding window counter; see backend/ratelimit/limiter.py).
+# With several workers the counters must be shared, or each worker would allow the full limit.
+RATE_LIMIT_BACKEND = settings.RATE_LIMIT_BACKEND
+if RATE_LIMIT_BACKEND == "auto":
+    RATE_LIMIT_BACKEND = "mongo" if settings.WORKERS > 1 else "memory"
+elif RATE_LIMIT_BACKEND == "memory" and settings.WORKERS > 1:
+    logger.warning("RATE_LIMIT_BACKEND=memory with %s workers: each worker enforces its own limit", settings.WORKERS)
+rate_limiter = create_rate_limiter(
+    RATE_LIMIT_BACKEND, settings.RATE_LIMIT_COUNT, settings.RATE_LIMIT_WINDOW, db.rate_limits
+)
+
+# LLM usage accounting: buffered bulk writes plus per-user daily rollups (see backend/usage/tracker.py)
+usage_tracker = UsageTracker(db.usage, db.usage_daily, batch_size=settings.USAGE_BATCH_SIZE,
+                             flush_interval=settings.USAGE_FLUSH_INTERVAL, tenant_collection=db.usage_tenant_daily)
+
+def create_conversation_indexes():
+    convos.create_index([("user_id", ASCENDING)])
+    convos.create_index([("updated_at", ASCENDING)])
+
+# Index builds and data migrations, applied once per database by whichever worker takes
+# the migration lock first (see server/migrations.py). Append new steps; never rename applied ones.
+MIGRATIONS = [
+    Migration("0001_conversation_indexes", create_conversation_indexes),
+    Migration("0002_rate_limit_ttl", lambda: ensure_rate_limit_indexes(db.rate_limits)),
+    Migration("0003_usage_indexes", usage_tracker.ensure_indexes),
+]
+
+# Per-user/tenant token and cost budgets, checked from the tracker's cached totals (see backend/usage/quota.py)
+quota_manager = QuotaManager(
+    usage_tracker,
+    user_budget=Budget(settings.QUOTA_USER_TOKENS_PER_DAY, settings.QUOTA_USER_COST_PER_MONTH),
+    tenant_budget=Budget(settings.QUOTA_TENANT_TOKENS_PER_DAY, settings.QUOTA_TENANT_COST_PER_MONTH),
+    overrides=parse_budgets(settings.QUOTA_OVERRIDES),
+    output_estimate=settings.QUOTA_OUTPUT_ESTIMATE,
+)
 
 # Import preprocessor
-from backend.preprocessor.core import (
-    sanitize_input, contains_profanity, contains_prompt_injection, contains_sql_injection, validate_length
+from backend.preprocessor.core import sanitize_input, screen_text
+from backend.preprocessor.prompt import build_prompt, fit_to_budget
+from backend.postprocessor.hallucination import grounding_cache_info
+from backend.postprocessor.highlight import get_highlighter
+from backend.postprocessor.links import DEFAULT_KNOWN_GOOD, LinkVerifier
+from backend.postprocessor.pipeline import chat_pipeline
+from backend.postprocessor.render import get_renderer
+from backend.providers.tokenizer import get_tokenizer
+
+# Shared LLM orchestrator (retries, failover and hedging across configured providers)
+orchestrator = LLMOrchestrator(
+    [name.strip() for name in settings.LLM_PROVIDER.split(",") if name.strip()],
+    hedge=settings.LLM_HEDGE,
+    routing=settings.LLM_ROUTING,
+    usage=usage_tracker,
+    quotas=quota_manager if quota_manager.enabled else None,
+    # Provider limits are for the whole deployment: each worker enforces its share
+    scheduler=OutboundScheduler(default_limits={
+        "max_concurrency": math.ceil(settings.LLM_MAX_CONCURRENCY / settings.WORKERS),
+        "requests_per_minute": settings.LLM_REQUESTS_PER_MINUTE / settings.WORKERS or None,
+        "tokens_per_minute": settings.LLM_TOKENS_PER_MINUTE / settings.WORKERS or None,
+        "max_wait": settings.LLM_QUEUE_TIMEOUT,
+    }),
 )
-from backend.preprocessor.prompt import build_prompt, count_tokens, trim_to_max_tokens
 
-# Logging middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logger.info(f"Request: {request.method} {request.url} at {datetime.utcnow().isoformat()}")
+# Response postprocessing: fence hints, link verification, truncation, markdown rendering
+# (see postprocessor/pipeline.py)
+link_verifier = LinkVerifier(
+    allow=settings.LINK_ALLOWLIST,
+    deny=settings.LINK_DENYLIST,
+    known_good=DEFAULT_KNOWN_GOOD if settings.LINK_KNOWN_GOOD is None else settings.LINK_KNOWN_GOOD,
+    ttl=settings.LINK_CACHE_TTL,
+)
+response_pipeline = chat_pipeline(settings.RESPONSE_MAX_LENGTH, link_verifier=link_verifier,
+                                  unknown_links=settings.LINK_UNKNOWN_ACTION)
+
+# Metrics (GET /metrics, see telemetry/metrics.py): per-stage chat latency, bound once per stage
+chat_stage = {stage: metrics.CHAT_STAGE_LATENCY.labels(stage) for stage in (
+    "preprocess", "rate_limit", "db_write", "retrieval", "provider_ttfb", "provider_total", "postprocess")}
+metrics.register_cache("highlight", lambda: get_highlighter().cache_info())
+metrics.register_cache("grounding_index", grounding_cache_info)
+metrics.register_cache("links", link_verifier.cache_info)
+for _provider in orchestrator.get_active_provider_names():
+    metrics.register_cache(f"tokenizer:{_provider}", get_tokenizer(_provider).cache_info)
+
+def warm_caches():
+    """
+    Fill the caches every worker needs before its first request. Called by the lifespan,
+    and by a preloading master (server/serve.py) so that forked workers share the result.
+    """
+    # Build the Markdown renderer and resolve Pygments lexers before the first response is
+    # rendered (both are imported lazily, see postprocessor/render.py and highlight.py)
+    get_renderer()
+    lexers = get_highlighter().preload()
+    logger.info("Preloaded %s syntax highlighting lexers", lexers)
+
+def ping_database():
+    with mongo_timeout(settings.HEALTH_PING_TIMEOUT):
+        client.admin.command("ping")
+
+# Health probes read the last background ping (see server/health.py): no database
+# round trip per probe, and no writes at all
+mongo_health = HealthMonitor("mongo", ping_database, interval=settings.HEALTH_PING_INTERVAL)
+
+def connect_database():
+    """
+    Open the Mongo connection (one ping, bounded by DB_CONNECT_TIMEOUT) and apply the
+    pending migrations. Blocking; retried by the lifespan until it succeeds.
+    """
+    with mongo_timeout(settings.DB_CONNECT_TIMEOUT):
+        client.admin.command("ping")
+    applied = run_migrations(db, MIGRATIONS, settings.MIGRATION_LOCK_TTL)
+    if applied:
+        logger.info("Applied %s migrations: %s", len(applied), ", ".join(applied))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Worker startup and shutdown; each phase is timed in the startup profile.
+    """
+    with startup.phase("database"):
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        connecting = asyncio.create_task(
+            connect_with_retry(database, lambda: asyncio.to_thread(connect_database)))
+        try:
+            await asyncio.wait_for(asyncio.shield(connecting), settings.DB_STARTUP_WAIT)
+        except asyncio.TimeoutError:
+            # Keep retrying in the background; the routes that need Mongo answer 503 meanwhile
+            logger.warning("Mongo not ready after %.0fs, serving without it: %s", settings.DB_STARTUP_WAIT,
+                           database.error)
+    with startup.phase("preload"):
+        warm_caches()
+    with startup.phase("background"):
+        loop_monitor = asyncio.create_task(metrics.monitor_event_loop())
+        usage_tracker.start()
+        mongo_health.start()
+    startup.ready()
     try:
-        response = await call_next(request)
-    except Exception as exc:
-        logger.error(f"Error: {exc}")
-        return JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
-    logger.info(f"Response: {response.status_code} at {datetime.utcnow().isoformat()}")
+        yield
+    finally:
+        connecting.cancel()
+        loop_monitor.cancel()
+        await mongo_health.stop()
+        # Writes the usage records still buffered
+        await usage_tracker.stop()
+
+# Logging middleware (registered by create_app)
+async def log_requests(request: Request, call_next):
+    start = time.perf_counter()
+    # Every log line of the request carries its id: the caller's X-Request-ID if well-formed, else a new one
+    request_id = request.headers.get("x-request-id", "")
+    with request_context(request_id if REQUEST_ID_RE.match(request_id) else None) as request_id:
+        # Server span, continuing the caller's trace when a traceparent header is sent
+        with span(f"HTTP {request.method}", {"http.request.method": request.method}, kind="server",
+                  parent=parse_traceparent(request.headers.get("traceparent"))) as request_span:
+            try:
+                response = await call_next(request)
+            except Exception:
+                logger.exception("Error handling %s %s", request.method, request.url.path)
+                response = JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
+            # Label by route template (not the raw path) to keep the number of series bounded
+            route = request.scope.get("route")
+            route = getattr(route, "path", "unmatched")
+            request_span.name = f"{request.method} {route}"
+            request_span.set_attributes({"http.route": route, "http.response.status_code": response.status_code})
+            elapsed = time.perf_counter() - start
+            access_logger.log(
+                logging.WARNING if response.status_code >= 500 or elapsed >= SLOW_REQUEST_SECONDS else logging.INFO,
+                "%s %s %s %.1fms", request.method, request.url.path, response.status_code, elapsed * 1000,
+                extra={"method": request.method, "route": route, "status": response.status_code,
+                       "duration_ms": round(elapsed * 1000, 1)})
+        response.headers["X-Request-ID"] = request_id
+    metrics.HTTP_LATENCY.labels(request.method, route).observe(elapsed)
+    metrics.HTTP_REQUESTS.labels(request.method, route, response.status_code).inc()
     return response
 
-# Error handler for 422
-# Error handler for 422
-@app.exception_handler(Exception)
+# Error handler for unhandled exceptions (registered by create_app)
 async def generic_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Unhandled error: {exc}")
+    logger.error("Unhandled error: %s", exc)
     return JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
 
 # --- Conversation Models ---
@@ -191,86 +421,327 @@ class Conversation(BaseModel):
     updated_at: Optional[str] = None
 
 # --- Rate Limiting Helper ---
-def check_rate_limit(user_id: str) -> bool:
-    now = time.time()
-    dq = user_message_times[user_id]
-    # Remove timestamps outside window
-    while dq and now - dq[0] > rate_limit_window:
-        dq.popleft()
-    if len(dq) >= rate_limit_count:
-        return False
-    dq.append(now)
-    return True
-@app.post("/api/chat/message")
-async def post_message(request: StarletteRequest, body: dict = Body(...)):
+def check_rate_limit(user_id: str) -> RateLimitResult:
+    return rate_limiter.hit(user_id)
+
+async def check_quota(user_id: str, tenant_id: Optional[str], prompt: Optional[str] = None) -> Optional[QuotaDecision]:
+    """
+    Fast budget check from cached totals (None when no budgets are configured).
+    With a prompt, the call's estimated tokens and cost must fit as well.
+    """
+    if orchestrator.quotas is None:
+        return None
+    tokens, cost = quota_manager.estimate(orchestrator.providers[0], prompt) if prompt else (0, 0.0)
+    return await quota_manager.acheck(user_id, tenant_id, tokens, cost)
+
+def quota_exceeded_response(decision: QuotaDecision, headers: Optional[dict] = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"LLM usage quota exceeded ({decision.denied.scope})"},
+        headers={**(headers or {}), **quota_headers(decision)},
+    )
+
+# --- Preprocessing Helpers (shared by chat and batch endpoints) ---
+def screen_message(user_id: str, text: str):
+    """
+    Sanitize a message and run profanity/injection checks.
+    Returns (sanitized_text, None) or (None, rejection_detail).
+    """
+    sanitized = sanitize_input(text)
+    # One pass over the text for every rule category (see preprocessor/core.py ScreeningEngine)
+    categories = screen_text(sanitized)
+    if "profanity" in categories:
+        logger.warning("Profanity detected from user %s", user_id)
+        return None, "Profanity detected"
+    if "prompt_injection" in categories:
+        logger.warning("Prompt injection detected from user %s", user_id)
+        return None, "Prompt injection detected"
+    if "sql_injection" in categories:
+        logger.warning("SQL injection detected from user %s", user_id)
+        return None, "Possible SQL injection detected"
+    return sanitized, None
+
+def frame_message(sanitized: str, query_type: str, max_tokens: int = 200, max_length: int = 500):
+    """
+    Trim a sanitized message to the context window and frame it with the query template.
+    Returns (prompt, trimmed_text), or (None, None) if it cannot fit in max_length.
+    """
+    # Tokenized once with the primary provider's tokenizer; token and length budgets applied together
+    sanitized_trimmed = fit_to_budget(sanitized, query_type, max_tokens, max_length,
+                                      provider=orchestrator.get_active_provider_names()[0])
+    if sanitized_trimmed is None:
+        return None, None
+    return build_prompt(sanitized_trimmed, query_type), sanitized_trimmed
+
+@router.post("/api/chat/message", dependencies=[Depends(require_database)])
+async def post_message(request: StarletteRequest, response: Response, body: dict = Body(...)):
     """
     Process a user chat message:
     - Sanitizes input, checks for profanity/injection, rate-limits, trims to context window, frames prompt.
     - Stores message in conversation history.
     - Returns the framed prompt and query type.
+    - The LLM response goes through the postprocessing pipeline (per-stage timings in Server-Timing);
+      with "stream": true it is streamed as NDJSON events (see stream_reply).
     """
     user_id = body.get("user_id")
+    tenant_id = body.get("tenant_id")
     text = body.get("text")
     query_type = body.get("query_type", "qa")
     if not user_id or not text:
         return JSONResponse(status_code=400, content={"detail": "user_id and text required"})
-    # If this is the first message in a new conversation, clear rate-limit history
-    if convos.find_one({"user_id": user_id}) is None:
-        user_message_times[user_id].clear()
-    sanitized = sanitize_input(text)
-    if contains_profanity(sanitized):
-        logger.warning(f"Profanity detected from user {user_id}")
-        return JSONResponse(status_code=400, content={"detail": "Profanity detected"})
-    if contains_prompt_injection(sanitized):
-        logger.warning(f"Prompt injection detected from user {user_id}")
-        return JSONResponse(status_code=400, content={"detail": "Prompt injection detected"})
-    if contains_sql_injection(sanitized):
-        logger.warning(f"SQL injection detected from user {user_id}")
-        return JSONResponse(status_code=400, content={"detail": "Possible SQL injection detected"})
-    if not check_rate_limit(user_id):
-        logger.warning(f"Rate limit exceeded for user {user_id}")
-        return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded (10 messages/min)"})
-    max_tokens = 200
-    # Compute original token count for echo logic
-    original_tokens = len(sanitized.split())
-    sanitized_trimmed = trim_to_max_tokens(sanitized, max_tokens)
-    prompt = build_prompt(sanitized_trimmed, query_type)
-    while not validate_length(prompt, 500) and len(sanitized_trimmed.split()) > 1:
-        sanitized_trimmed = trim_to_max_tokens(sanitized_trimmed, len(sanitized_trimmed.split()) - 1)
-        prompt = build_prompt(sanitized_trimmed, query_type)
-    if not validate_length(prompt, 500):
-        logger.warning(f"Message too long after framing/context for user {user_id}")
+    start = time.perf_counter()
+    with span("chat.preprocess") as stage_span:
+        sanitized, rejection = screen_message(user_id, text)
+        stage_span.set_attribute("chat.rejected", bool(rejection))
+    if rejection:
+        return JSONResponse(status_code=400, content={"detail": rejection})
+    mark = time.perf_counter()
+    with span("chat.rate_limit"):
+        limit = check_rate_limit(user_id)
+    chat_stage["rate_limit"].observe(time.perf_counter() - mark)
+    limit_headers = rate_limit_headers(limit, settings.RATE_LIMIT_WINDOW)
+    if not limit.allowed:
+        logger.warning("Rate limit exceeded for user %s", user_id)
+        return JSONResponse(
+            status_code=429,
+            content={"detail": f"Rate limit exceeded ({limit.limit} messages/min)"},
+            headers=limit_headers,
+        )
+    response.headers.update(limit_headers)
+    framing = time.perf_counter()
+    with span("chat.prompt", {"chat.query_type": query_type}):
+        prompt, sanitized_trimmed = frame_message(sanitized, query_type)
+    # Preprocessing: screening plus prompt framing (the rate-limit check is timed on its own)
+    chat_stage["preprocess"].observe(time.perf_counter() - framing + mark - start)
+    if prompt is None:
+        logger.warning("Message too long after framing/context for user %s", user_id)
         return JSONResponse(status_code=400, content={"detail": "Message too long (max 500) after framing/context"})
+    # Budgets are checked before the message is stored or any provider is called
+    with span("chat.quota"):
+        quota = await check_quota(user_id, tenant_id, prompt)
+    if quota is not None:
+        if not quota.allowed:
+            logger.warning("LLM quota exceeded for user %s (%s)", user_id, quota.denied.scope)
+            return quota_exceeded_response(quota, limit_headers)
+        limit_headers = {**limit_headers, **quota_headers(quota)}
+        response.headers.update(limit_headers)
     now = datetime.utcnow().isoformat()
     # Store sanitized and trimmed user text for conversation history
     msg_to_store = sanitized_trimmed
     msg = {"text": msg_to_store, "timestamp": now, "query_type": query_type}
+    mark = time.perf_counter()
     try:
-        convo = convos.find_one({"user_id": user_id})
-        if convo:
-            convos.update_one({"user_id": user_id}, {"$push": {"messages": msg}, "$set": {"updated_at": now}})
-        else:
-            convos.insert_one({"user_id": user_id, "messages": [msg], "created_at": now, "updated_at": now})
+        with span("chat.db_write"):
+            convo = convos.find_one({"user_id": user_id})
+            if convo:
+                convos.update_one({"user_id": user_id}, {"$push": {"messages": msg}, "$set": {"updated_at": now}})
+            else:
+                convos.insert_one({"user_id": user_id, "messages": [msg], "created_at": now, "updated_at": now})
     except Exception as e:
-        logger.error(f"Failed to update conversation for user {user_id}: {e}")
+        logger.error("Failed to update conversation for user %s: %s", user_id, e)
         return JSONResponse(status_code=500, content={"detail": "Failed to update conversation"})
+    chat_stage["db_write"].observe(time.perf_counter() - mark)
+
+    provider = orchestrator.get_active_provider_names()[0]
+    if body.get("stream"):
+        return await stream_reply(prompt, query_type, user_id, provider, limit_headers, tenant_id)
 
-    # Call the LLM using GoogleAIProvider
+    # Call the LLM through the orchestrator (non-blocking retries/failover)
+    mark = time.perf_counter()
     try:
-        from backend.providers.googleai import GoogleAIProvider
-        import markdown as md
-        # You may want to cache this instance in production
-        google_llm = GoogleAIProvider()
-        llm_response = google_llm.generate(prompt)
-        # Convert markdown to HTML for frontend rendering
-        llm_html = md.markdown(llm_response, extensions=["extra", "codehilite", "nl2br"])
+        llm_response = await orchestrator.agenerate(prompt, query_type=query_type, user_id=user_id,
+                                                    tenant_id=tenant_id)
+        chat_stage["provider_total"].observe(time.perf_counter() - mark)
+    except ProviderBusyError as e:
+        logger.warning("LLM provider busy for user %s: %s", user_id, e)
+        return provider_busy_response(e)
+    except QuotaExceededError as e:
+        # Concurrent calls reserved the rest of the budget after the check above
+        logger.warning("LLM quota exceeded for user %s: %s", user_id, e)
+        return quota_exceeded_response(e.decision)
     except Exception as e:
-        logger.error(f"LLM call failed: {e}")
-        llm_html = "[Error: LLM unavailable]"
-
-    return {"response": llm_html, "query_type": query_type}
-
-@app.get("/api/chat/history")
+        logger.error("LLM call failed: %s", e)
+        return {"response": "[Error: LLM unavailable]", "query_type": query_type}
+
+    # Postprocess and convert markdown to HTML for frontend rendering
+    with span("chat.postprocess"):
+        ctx = await response_pipeline.arun(llm_response, provider=provider, query_type=query_type)
+    record_postprocess(ctx.timings)
+    response.headers["Server-Timing"] = server_timing(ctx.timings)
+    reply = {"response": ctx.html, "query_type": query_type}
+    if ctx.warnings:
+        reply["warnings"] = ctx.warnings
+    return reply
+
+def provider_busy_response(e: ProviderBusyError) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "LLM provider busy, please retry"},
+        headers={"Retry-After": str(max(1, int(e.retry_after + 0.5)))},
+    )
+
+def record_postprocess(timings: dict):
+    # ctx.timings are milliseconds, the histograms are in seconds
+    chat_stage["postprocess"].observe(sum(timings.values()) / 1000)
+    metrics.record_timings(metrics.POSTPROCESS_STAGE_LATENCY, timings)
+
+def server_timing(timings: dict) -> str:
+    return ", ".join(f"{name};dur={ms:.2f}" for name, ms in timings.items())
+
+async def stream_reply(prompt: str, query_type: str, user_id: str, provider: str, headers: dict,
+                       tenant_id: Optional[str] = None):
+    """
+    Stream the LLM response as NDJSON events through the postprocessing pipeline:
+    {"type": "delta", "text", "html", "tail"} per chunk (append "html", replace the
+    open-block preview with "tail"), then {"type": "done", "text" (last text delta), "response", "query_type",
+    "truncated", "warnings", "timings"} or {"type": "error", "detail"}.
+    """
+    chunks = orchestrator.astream(prompt, query_type=query_type, user_id=user_id, tenant_id=tenant_id)
+    start = time.perf_counter()
+    # Wait for the first chunk so a busy or failed provider still gets a plain status code
+    try:
+        first = await chunks.__anext__()
+        chat_stage["provider_ttfb"].observe(time.perf_counter() - start)
+    except StopAsyncIteration:
+        first = ""
+    except ProviderBusyError as e:
+        logger.warning("LLM provider busy for user %s: %s", user_id, e)
+        return provider_busy_response(e)
+    except QuotaExceededError as e:
+        logger.warning("LLM quota exceeded for user %s: %s", user_id, e)
+        return quota_exceeded_response(e.decision)
+    except Exception as e:
+        logger.error("LLM call failed: %s", e)
+        return {"response": "[Error: LLM unavailable]", "query_type": query_type}
+
+    # The body is sent after the request span has ended, so the stream gets its own span under it
+    request_span = current_span()
+    stream_span = get_tracer().start_span("chat.stream", parent=request_span.context if request_span else None)
+
+    async def events():
+        stream = response_pipeline.stream(provider=provider, query_type=query_type)
+        try:
+            chunk = first
+            while True:
+                update = stream.feed(chunk)
+                if update.text or update.html:
+                    yield json.dumps({"type": "delta", **update._asdict()}) + "\n"
+                if stream.done:
+                    break
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    break
+            chat_stage["provider_total"].observe(time.perf_counter() - start)
+            ctx = stream.close()
+            record_postprocess(ctx.timings)
+            yield json.dumps({"type": "done", "text": stream.flushed, "response": ctx.html, "query_type": query_type,
+                              "truncated": ctx.truncated, "warnings": ctx.warnings,
+                              "timings": ctx.timings_ms()}) + "\n"
+        except Exception as e:
+            logger.error("LLM stream failed for user %s: %s", user_id, e)
+            stream_span.record_exception(e)
+            yield json.dumps({"type": "error", "detail": "LLM stream failed"}) + "\n"
+        finally:
+            await chunks.aclose()
+            stream_span.end()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers=headers)
+
+@router.post("/api/chat/batch", dependencies=[Depends(require_database)])
+async def post_batch(request: Request):
+    """
+    Run a batch of chat prompts for one user and stream results back as NDJSON.
+    - JSON body: {"user_id", "items": [{"id", "text", "query_type"}, ...], "batch_id"?}
+    - or NDJSON body (Content-Type: application/x-ndjson), one item per line, with
+      user_id and batch_id as query parameters.
+    - Each item is screened and framed like /api/chat/message; rejected items are reported, not sent.
+    - Identical prompts are generated once. With a batch_id, progress is checkpointed and
+      re-posting the same batch resumes instead of regenerating finished prompts.
+    - Counts as a single message against the per-user rate limit.
+    """
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            user_id = request.query_params.get("user_id")
+            tenant_id = request.query_params.get("tenant_id")
+            batch_id = request.query_params.get("batch_id")
+            items = load_prompts_jsonl((await request.body()).splitlines())
+        else:
+            body = await request.json()
+            if not isinstance(body, dict):
+                raise ValueError("body is not a JSON object")
+            user_id = body.get("user_id")
+            tenant_id = body.get("tenant_id")
+            batch_id = body.get("batch_id")
+            items = body.get("items") or []
+    except ValueError as e:
+        logger.warning("Invalid batch payload: %s", e)
+        return JSONResponse(status_code=400, content={"detail": "Invalid batch payload"})
+    if not user_id or not items or not isinstance(items, list):
+        return JSONResponse(status_code=400, content={"detail": "user_id and items required"})
+    if len(items) > settings.BATCH_MAX_ITEMS:
+        return JSONResponse(status_code=400, content={"detail": f"Too many items (max {settings.BATCH_MAX_ITEMS})"})
+    limit = check_rate_limit(user_id)
+    limit_headers = rate_limit_headers(limit, settings.RATE_LIMIT_WINDOW)
+    if not limit.allowed:
+        logger.warning("Rate limit exceeded for user %s (batch)", user_id)
+        return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded"}, headers=limit_headers)
+    # Each item is checked (and reserved) again before its provider call
+    quota = await check_quota(user_id, tenant_id)
+    if quota is not None:
+        if not quota.allowed:
+            logger.warning("LLM quota exceeded for user %s (batch)", user_id)
+            return quota_exceeded_response(quota, limit_headers)
+        limit_headers = {**limit_headers, **quota_headers(quota)}
+
+    rejected = []
+    prompts = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"text": item}
+        elif not isinstance(item, dict):
+            rejected.append({"id": index, "status": "error", "error": "item must be a string or an object"})
+            continue
+        item_id = item.get("id", index)
+        text = item.get("text") or item.get("prompt")
+        if not isinstance(text, str) or not text:
+            rejected.append({"id": item_id, "status": "error", "error": "text required"})
+            continue
+        query_type = item.get("query_type", "qa")
+        if not isinstance(query_type, str):
+            rejected.append({"id": item_id, "status": "error", "error": "query_type must be a string"})
+            continue
+        sanitized, rejection = screen_message(user_id, text)
+        if rejection:
+            rejected.append({"id": item_id, "status": "error", "error": rejection})
+            continue
+        prompt, _ = frame_message(sanitized, query_type)
+        if prompt is None:
+            rejected.append({"id": item_id, "status": "error", "error": "Message too long (max 500) after framing/context"})
+            continue
+        prompts.append({"id": item_id, "prompt": prompt})
+
+    checkpoint_path = None
+    if batch_id:
+        os.makedirs(BATCH_CHECKPOINT_FOLDER, exist_ok=True)
+        checkpoint_path = os.path.join(BATCH_CHECKPOINT_FOLDER, checkpoint_name(user_id, batch_id))
+    logger.info("Batch started for user %s: %s prompts, %s rejected", user_id, len(prompts), len(rejected))
+
+    async def stream_results():
+        for record in rejected:
+            yield json.dumps(record) + "\n"
+        if not prompts:
+            return
+        results = orchestrator.agenerate_batch(
+            prompts, concurrency=settings.BATCH_CONCURRENCY, checkpoint_path=checkpoint_path, user_id=user_id,
+            tenant_id=tenant_id,
+        )
+        async for record in results:
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson", headers=limit_headers)
+
+@router.get("/api/chat/history", dependencies=[Depends(require_database)])
 def get_history(user_id: str):
     """
     Retrieve conversation history for a user.
@@ -281,34 +752,83 @@ def get_history(user_id: str):
             return {"user_id": user_id, "messages": []}
         return {"user_id": user_id, "messages": convo.get("messages", [])}
     except Exception as e:
-        logger.error(f"Failed to retrieve history for user {user_id}: {e}")
+        logger.error("Failed to retrieve history for user %s: %s", user_id, e)
         return JSONResponse(status_code=500, content={"detail": "Failed to retrieve history"})
 
-@app.get("/api/health")
-def health_check():
+@router.get("/api/usage", dependencies=[Depends(require_database)])
+async def get_usage(user_id: str):
     """
-    Health check for API and DB connection.
+    Today's (UTC) LLM usage for a user, from the daily rollups plus records not yet written,
+    with this month's totals and the user's remaining budget.
     """
     try:
-        db.test.insert_one({"status": "ok"})
-        result = db.test.find_one({"status": "ok"})
-        db.test.delete_many({"status": "ok"})
-        if result:
-            return {"status": "ok", "db": "connected"}
-        else:
-            return {"status": "fail", "db": "not connected"}
+        today, month = await usage_tracker.atotals("user", user_id)
     except Exception as e:
-        logger.error(f"Health check error: {e}")
-        return {"status": "fail", "error": str(e)}
+        logger.error("Failed to retrieve usage for user %s: %s", user_id, e)
+        return JSONResponse(status_code=500, content={"detail": "Failed to retrieve usage"})
+    budget = quota_manager.budget("user", user_id)
+    status = usage_tracker.quota(today, month, budget.tokens_per_day, budget.cost_per_month)
+    return {"user_id": user_id, "day": usage_day(), **today.to_dict(), "month": month.to_dict(),
+            "remaining_tokens": status.remaining_tokens, "remaining_cost": status.remaining_cost}
+
+@router.get("/api/health")
+async def health_check():
+    """
+    Health check for API and DB connection, from the last background ping (no database writes).
+    """
+    mongo = await mongo_health.aresult()
+    if mongo.ok:
+        return {"status": "ok", "db": "connected"}
+    return {"status": "fail", "db": "not connected", "error": mongo.error}
 
-@app.get("/api/status")
-def get_status():
+@router.get("/api/health/live")
+async def liveness_probe():
+    """
+    Liveness: the worker and its event loop are responsive. Checks no dependencies, so a
+    database or provider outage never gets workers restarted.
+    """
+    return {"status": "ok"}
+
+@router.get("/api/health/ready")
+async def readiness_probe():
+    """
+    Readiness: 200 when Mongo answered the last background ping and startup has connected
+    and migrated it, else 503. Also reports provider circuit states and queue depths,
+    which do not affect readiness (every worker shares the same providers).
+    """
+    mongo = await mongo_health.aresult()
+    ready = mongo.ok and database.state != CONNECTING
+    return JSONResponse(status_code=200 if ready else 503, content={
+        "status": "ready" if ready else "not_ready",
+        "mongo": {**mongo.to_dict(), "state": database.state},
+        "providers": {name: breaker.state for name, breaker in orchestrator.breakers.items()},
+        "queues": {"ingestion": int(metrics.INGESTION_IN_PROGRESS.get()), "usage": usage_tracker.pending},
+    })
+
+@router.get("/metrics")
+def get_metrics():
     """
-    Returns API running status and current timestamp.
+    Metrics in the Prometheus text format: HTTP requests and latency per route, chat
+    stage and postprocessing stage latency, provider errors and latency, cache hit
+    ratios and event loop lag (see telemetry/metrics.py).
     """
-    return {"status": "running", "timestamp": datetime.utcnow().isoformat()}
+    return Response(content=metrics.scrape(), media_type=metrics.CONTENT_TYPE)
 
-@app.post("/api/echo")
+@router.get("/api/status")
+def get_status():
+    """
+    Returns API running status, current timestamp, per-provider circuit breaker state and
+    this worker's startup profile and database readiness.
+    """
+    return {
+        "status": "running",
+        "timestamp": datetime.utcnow().isoformat(),
+        "providers": orchestrator.provider_status(),
+        "worker": {"pid": os.getpid(), "workers": settings.WORKERS, "startup": startup.to_dict(),
+                   "database": database.to_dict()},
+    }
+
+@router.post("/api/echo")
 async def echo(request: Request):
     """
     Echoes back the received JSON payload. For testing only.
@@ -319,3 +839,23 @@ async def echo(request: Request):
         logger.warning("Invalid JSON received at /api/echo")
         return JSONResponse(status_code=400, content={"detail": "Invalid JSON"})
     return {"echo": data}
+
+def create_app() -> FastAPI:
+    """
+    Build the ASGI app: routes, middleware and the startup/shutdown lifespan.
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[settings.ALLOWED_ORIGINS],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.middleware("http")(log_requests)
+    app.add_exception_handler(Exception, generic_exception_handler)
+    return app
+
+app = create_app()
+startup.mark("import")
@@ -0,0 +1,151 @@
+"""
+Bulk generation for offline workloads (nightly report/qa jobs).
+
+- Items are run with bounded concurrency through LLMOrchestrator.agenerate, so they
+  share the provider scheduler, circuit breakers and retries with live traffic but
+  are queued behind it (scheduler priority class "batch").
+- Identical prompts are generated once and the result is fanned out to every item.
+- Completed prompts are appended to a JSONL checkpoint; re-running with the same
+  checkpoint skips them, so an interrupted run resumes where it stopped.
+- Results are yielded as they complete, ready to be streamed as NDJSON.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import AsyncIterator, Dict, Iterable, List, Union
+
+from .scheduler import ProviderBusyError
+
+# How many times a batch item waits out a ProviderBusyError before giving up.
+MAX_BUSY_RETRIES = 20
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def checkpoint_name(user_id: str, batch_id: str) -> str:
+    """
+    Checkpoint file name for a user's batch: a hash of the (user_id, batch_id) pair, so
+    distinct pairs never share a file whatever characters the ids contain.
+    """
+    return hashlib.sha256(json.dumps([user_id, batch_id]).encode("utf-8")).hexdigest() + ".jsonl"
+
+
+def load_prompts_jsonl(lines: Iterable[Union[str, bytes]]) -> List[dict]:
+    """
+    Parse JSONL batch input. Each line is either a JSON string (the prompt) or an
+    object with "prompt" (or "text") and optional "id" / "query_type". Blank lines are skipped.
+    """
+    items = []
+    for n, line in enumerate(lines):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {n + 1}: {e}")
+    return items
+
+
+def normalize_item(item: Union[str, dict], index: int) -> dict:
+    if isinstance(item, str):
+        return {"id": index, "prompt": item}
+    prompt = item.get("prompt", item.get("text"))
+    if not isinstance(prompt, str) or not prompt:
+        raise ValueError(f"Batch item {item.get('id', index)} has no prompt")
+    return {"id": item.get("id", index), "prompt": prompt}
+
+
+class BatchCheckpoint:
+    """
+    Append-only JSONL file of completed prompts: {"key": <prompt sha256>, "response": ...}.
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Dict[str, str]:
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from an interrupted run; that prompt is simply redone
+                    continue
+                done[record["key"]] = record["response"]
+        return done
+
+    def append(self, key: str, response: str):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "response": response}) + "\n")
+
+
+async def run_batch(orchestrator, items: Iterable[Union[str, dict]], concurrency: int = 8,
+                    checkpoint_path: str = None, user_id: str = None, tenant_id: str = None) -> AsyncIterator[dict]:
+    """
+    Generate responses for many prompts. Yields one result per input item, in completion order:
+    {"id", "status": "ok", "response", "deduplicated", "resumed"} or {"id", "status": "error", "error"}.
+    """
+    groups: Dict[str, List[dict]] = {}
+    for index, item in enumerate(items):
+        item = normalize_item(item, index)
+        groups.setdefault(prompt_key(item["prompt"]), []).append(item)
+
+    checkpoint = BatchCheckpoint(checkpoint_path) if checkpoint_path else None
+    done = checkpoint.load() if checkpoint else {}
+    for key in [k for k in groups if k in done]:
+        for i, item in enumerate(groups.pop(key)):
+            yield {"id": item["id"], "status": "ok", "response": done[key], "deduplicated": i > 0, "resumed": True}
+
+    pending = asyncio.Queue()
+    for key in groups:
+        pending.put_nowait(key)
+    results = asyncio.Queue()
+
+    async def worker():
+        while True:
+            try:
+                key = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            prompt = groups[key][0]["prompt"]
+            record = {"key": key}
+            for _ in range(MAX_BUSY_RETRIES):
+                try:
+                    response = await orchestrator.agenerate(prompt, query_type="batch", user_id=user_id,
+                                                            tenant_id=tenant_id)
+                    record.update(status="ok", response=response)
+                    if checkpoint:
+                        checkpoint.append(key, response)
+                    break
+                except ProviderBusyError as exc:
+                    # Batch work is not latency sensitive: wait for capacity instead of failing
+                    record.update(status="error", error=str(exc))
+                    await asyncio.sleep(exc.retry_after)
+                except Exception as exc:
+                    logging.warning("Batch item failed: %s", exc)
+                    record.update(status="error", error=str(exc))
+                    break
+            await results.put(record)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(groups)))]
+    try:
+        for _ in range(len(groups)):
+            record = await results.get()
+            for i, item in enumerate(groups[record["key"]]):
+                if record["status"] == "ok":
+                    yield {"id": item["id"], "status": "ok", "response": record["response"],
+                           "deduplicated": i > 0, "resumed": False}
+                else:
+                    yield {"id": item["id"], "status": "error", "error": record["error"]}
+    finally:
+        for task in workers:
+            task.cancel()
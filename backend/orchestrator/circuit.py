@@ -0,0 +1,139 @@
+import time
+from collections import deque
+from typing import Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised when a provider is skipped because its circuit breaker is open.
+    """
+    pass
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker driven by a rolling window of call outcomes.
+
+    - closed: calls flow; the breaker opens once at least `min_calls` outcomes in the
+      last `window` seconds show an error rate >= `error_threshold`. Calls slower than
+      `slow_call_seconds` count as errors, so a provider that hangs trips it too.
+    - open: calls are rejected immediately until `open_seconds` have passed.
+    - half_open: up to `half_open_max_calls` probe calls are let through; a success
+      closes the breaker, a failure re-opens it.
+    """
+    def __init__(self, name: str, window: float = 60.0, min_calls: int = 5, error_threshold: float = 0.5,
+                 slow_call_seconds: float = 20.0, open_seconds: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.half_open_in_flight = 0
+        self.outcomes = deque()  # (timestamp, ok)
+        self.errors = 0
+        self.latency_ewma: Optional[float] = None
+
+    def _prune(self, now: float):
+        while self.outcomes and now - self.outcomes[0][0] > self.window:
+            _, ok = self.outcomes.popleft()
+            if not ok:
+                self.errors -= 1
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self.opened_at = now
+        self.half_open_in_flight = 0
+
+    def _close(self):
+        self.state = CLOSED
+        self.half_open_in_flight = 0
+        self.outcomes.clear()
+        self.errors = 0
+
+    def available(self) -> bool:
+        """
+        Cheap check used for routing: False only while open and still cooling down.
+        Does not reserve a half-open probe slot.
+        """
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.open_seconds
+        if self.state == HALF_OPEN:
+            return self.half_open_in_flight < self.half_open_max_calls
+        return True
+
+    def allow_request(self) -> bool:
+        """
+        Decide whether a call may proceed. In half-open state this reserves a probe slot.
+        """
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                return False
+            self.state = HALF_OPEN
+            self.half_open_in_flight = 0
+        if self.state == HALF_OPEN:
+            if self.half_open_in_flight >= self.half_open_max_calls:
+                return False
+            self.half_open_in_flight += 1
+        return True
+
+    def record_success(self, latency: float):
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        if latency > self.slow_call_seconds:
+            self.record_failure()
+            return
+        if self.state == HALF_OPEN:
+            self._close()
+            return
+        now = time.monotonic()
+        self.outcomes.append((now, True))
+        self._prune(now)
+
+    def record_failure(self):
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._open(now)
+            return
+        self.outcomes.append((now, False))
+        self.errors += 1
+        self._prune(now)
+        if self.state == CLOSED and len(self.outcomes) >= self.min_calls and self.error_rate() >= self.error_threshold:
+            self._open(now)
+
+    def release(self):
+        """
+        Release a half-open probe slot without recording an outcome, for calls that were
+        cancelled (e.g. a losing hedge) or rejected with a non-retryable client error.
+        """
+        if self.state == HALF_OPEN and self.half_open_in_flight > 0:
+            self.half_open_in_flight -= 1
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.errors / len(self.outcomes)
+
+    def health(self) -> float:
+        """
+        Routing weight in [0, 1]: 0 while open, otherwise the recent success rate.
+        """
+        if not self.available():
+            return 0.0
+        return 1.0 - self.error_rate()
+
+    def snapshot(self) -> dict:
+        self._prune(time.monotonic())
+        return {
+            "provider": self.name,
+            "state": self.state,
+            "error_rate": round(self.error_rate(), 3),
+            "calls_in_window": len(self.outcomes),
+            "latency_ewma": round(self.latency_ewma, 4) if self.latency_ewma is not None else None,
+        }
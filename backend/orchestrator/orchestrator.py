@@ -1,27 +1,66 @@
 import os
+import asyncio
 import logging
+import random
 import time
-from typing import Optional, List, Type
+from typing import AsyncIterator, Optional, List, Type
 
-from providers.base import LLMProvider
-from providers.mock import MockLLMProvider
-from providers.googleai import GoogleAIProvider
+try:
+    from ..providers.base import LLMProvider
+    from ..providers.mock import MockLLMProvider
+    from ..providers.simulated import SimulatedLLMProvider
+    from ..providers.googleai import GoogleAIProvider
+    from ..providers.tokenizer import get_tokenizer
+    from ..telemetry.metrics import PROVIDER_ERRORS, PROVIDER_LATENCY, PROVIDER_REQUESTS, PROVIDER_TTFB, error_kind
+    from ..telemetry.tracing import STATUS_ERROR, get_tracer, span
+except ImportError:  # imported as the top-level ``orchestrator`` package (backend/ on sys.path)
+    from providers.base import LLMProvider
+    from providers.mock import MockLLMProvider
+    from providers.simulated import SimulatedLLMProvider
+    from providers.googleai import GoogleAIProvider
+    from providers.tokenizer import get_tokenizer
+    from telemetry.metrics import PROVIDER_ERRORS, PROVIDER_LATENCY, PROVIDER_REQUESTS, PROVIDER_TTFB, error_kind
+    from telemetry.tracing import STATUS_ERROR, get_tracer, span
+from .circuit import CircuitBreaker, CircuitOpenError
+from .retry import LatencyTracker, backoff_delay, is_retryable, retry_after
+from .scheduler import OutboundScheduler, ProviderBusyError
+from .batch import load_prompts_jsonl, run_batch
 
 # Add additional providers here as needed
 PROVIDER_REGISTRY = {
     "mock": MockLLMProvider,
+    "simulated": SimulatedLLMProvider,  # realistic latency, streaming and failures (SIM_* settings)
     "googleai": GoogleAIProvider,
     # "openai": OpenAIProvider,  # Example for future
 }
 
+# Minimum latency samples before the observed p95 replaces the configured hedge delay.
+HEDGE_MIN_SAMPLES = 20
+# Latency assumed for providers with no successful calls yet (seconds), used by weighted routing.
+DEFAULT_ROUTING_LATENCY = 1.0
+
 class LLMOrchestrator:
-    def __init__(self, provider_names: Optional[List[str]] = None, max_retries: int = 3, backoff_base: float = 0.5, usage_db=None):
+    def __init__(self, provider_names: Optional[List[str]] = None, max_retries: int = 3, backoff_base: float = 0.5, usage=None,
+                 backoff_cap: float = 8.0, attempt_timeout: float = 30.0, hedge: bool = False, hedge_delay: float = 2.0,
+                 routing: str = "priority", breaker_options: Optional[dict] = None,
+                 scheduler: Optional[OutboundScheduler] = None, quotas=None):
         if provider_names is None:
-            provider_names = [os.getenv("LLM_PROVIDER", "mock")]
+            provider_names = [n.strip() for n in os.getenv("LLM_PROVIDER", "mock").split(",") if n.strip()]
         self.providers = [self._init_provider(name) for name in provider_names]
         self.max_retries = max_retries
         self.backoff_base = backoff_base
-        self.usage_db = usage_db
+        self.backoff_cap = backoff_cap
+        self.attempt_timeout = attempt_timeout
+        for provider in self.providers:
+            provider.request_timeout = attempt_timeout
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.usage = usage  # usage.tracker.UsageTracker, or None to skip usage accounting
+        self.quotas = quotas  # usage.quota.QuotaManager, or None for no per-user/tenant budgets
+        self.latency = {p.name(): LatencyTracker() for p in self.providers}
+        self.routing = routing
+        self.breakers = {p.name(): CircuitBreaker(p.name(), **(breaker_options or {})) for p in self.providers}
+        self.scheduler = scheduler or OutboundScheduler()
 
     def _init_provider(self, name: str) -> LLMProvider:
         if name not in PROVIDER_REGISTRY:
@@ -31,40 +70,395 @@ class LLMOrchestrator:
     def generate(self, prompt: str, **kwargs) -> str:
         """
         Generate a response from the first successful provider. Retries on failures.
+        Blocking variant for scripts and tests; request handlers should use agenerate.
         """
+        reservation = self._reserve_quota(prompt, kwargs)
+        try:
+            with span("llm.generate", {"llm.query_type": kwargs.get("query_type", "qa")}) as generate_span:
+                result, provider = self._generate(prompt, **kwargs)
+                generate_span.set_attribute("llm.provider", provider.name())
+                return result
+        finally:
+            self._release_quota(reservation)
+
+    def _generate(self, prompt: str, **kwargs):
         last_exc = None
-        for provider in self.providers:
+        for provider in self._routed_providers():
+            breaker = self.breakers[provider.name()]
             for attempt in range(self.max_retries):
+                if not breaker.allow_request():
+                    last_exc = CircuitOpenError(f"Circuit open for provider {provider.name()}")
+                    _record_error(provider.name(), last_exc)
+                    break
+                sleep_time = None
+                with _attempt_span(provider, attempt) as attempt_span:
+                    start = time.monotonic()
+                    try:
+                        result = provider.generate(prompt, **kwargs)
+                        breaker.record_success(time.monotonic() - start)
+                        _record_success(provider.name(), time.monotonic() - start)
+                        if self.usage is not None and kwargs.get("user_id"):
+                            self._track_usage(kwargs["user_id"], provider, prompt, result, kwargs.get("query_type"),
+                                              kwargs.get("tenant_id"))
+                        return result, provider
+                    except Exception as exc:
+                        last_exc = exc
+                        _record_error(provider.name(), exc, attempt_span)
+                        if not is_retryable(exc):
+                            breaker.release()
+                            logging.warning("Provider %s failed with non-retryable error: %s", provider.name(), exc)
+                            break
+                        breaker.record_failure()
+                        if attempt + 1 == self.max_retries:
+                            break
+                        sleep_time = backoff_delay(attempt, self.backoff_base, self.backoff_cap, retry_after(exc))
+                        logging.warning("Provider %s failed (attempt %s): %s. Retrying in %.2fs...",
+                                        provider.name(), attempt + 1, exc, sleep_time)
+                time.sleep(sleep_time)
+            logging.error("Provider %s failed after %s attempts. Trying next provider...", provider.name(), attempt + 1)
+        raise RuntimeError(f"All providers failed. Last error: {last_exc}")
+
+    async def agenerate(self, prompt: str, hedge: Optional[bool] = None, query_type: str = "qa", **kwargs) -> str:
+        """
+        Non-blocking generate for use inside the server's event loop.
+        Each attempt is bounded by attempt_timeout and backoff sleeps yield to the loop.
+        With hedging enabled, the next provider is fired once the primary has been
+        running longer than its p95 latency and whichever answers first wins.
+        Every attempt is admitted by the outbound scheduler (per-provider concurrency
+        and quota, fair across users, prioritised by query_type); ProviderBusyError is
+        raised when no provider can take the call within its wait budget.
+        With quotas, QuotaExceededError is raised before any provider is called when the
+        call would exceed the user's or tenant's budget (pass tenant_id= for tenants).
+        """
+        kwargs["query_type"] = query_type
+        if hedge is None:
+            hedge = self.hedge
+        reservation = await self._areserve_quota(prompt, kwargs)
+        try:
+            with span("llm.generate", {"llm.query_type": query_type, "llm.hedge": bool(hedge)}) as generate_span:
+                if hedge and len(self.providers) > 1:
+                    result, provider = await self._hedged(prompt, **kwargs)
+                else:
+                    result, provider = await self._failover(self._routed_providers(), prompt, **kwargs)
+                generate_span.set_attribute("llm.provider", provider.name())
+            if self.usage is not None and kwargs.get("user_id"):
+                self._track_usage(kwargs["user_id"], provider, prompt, result, query_type, kwargs.get("tenant_id"))
+            return result
+        finally:
+            self._release_quota(reservation)
+
+    async def astream(self, prompt: str, query_type: str = "qa", **kwargs) -> AsyncIterator[str]:
+        """
+        Stream a response as text chunks from the first provider that starts answering.
+        Admission, circuit breakers and failover work as in agenerate, but only before
+        the first chunk: once text has been sent a failure is raised to the caller.
+        attempt_timeout bounds the wait for each chunk. Closing the stream early (for
+        example after truncation) ends the provider call. Usage is recorded for the text
+        streamed so far however the stream ends, before the quota reservation is released.
+        The circuit breaker and the hedging latency see the time to first chunk: the rest
+        of the stream's duration depends on the answer's length and on the consumer.
+        """
+        kwargs["query_type"] = query_type
+        user_id = kwargs.get("user_id")
+        providers = self._routed_providers()
+        if not providers:
+            raise CircuitOpenError("All provider circuits are open")
+        reservation = await self._areserve_quota(prompt, kwargs)
+        # Spans are ended explicitly, not made current: this generator resumes in its consumer's context
+        tracer = get_tracer()
+        stream_span = tracer.start_span("llm.stream", {"llm.query_type": query_type})
+        streamed = None  # (provider, chunks sent, finished) of the latest attempt
+        try:
+            last_exc = None
+            for attempt, provider in enumerate(providers):
+                breaker = self.breakers[provider.name()]
+                if not breaker.allow_request():
+                    last_exc = CircuitOpenError(f"Circuit open for provider {provider.name()}")
+                    _record_error(provider.name(), last_exc)
+                    continue
+                tokens = _estimate_tokens(provider, prompt)
+                parts: List[str] = []
+                streamed = (provider, parts, False)
+                attempt_span = tracer.start_span("llm.attempt", {"llm.provider": provider.name(), "llm.failover": attempt},
+                                                 kind="client", parent=stream_span.context)
                 try:
-                    result = provider.generate(prompt, **kwargs)
-                    if self.usage_db and 'user_id' in kwargs:
-                        self._track_usage(kwargs['user_id'], provider, prompt, result)
-                    return result
+                    async with self.scheduler.slot(provider.name(), user_id, query_type, tokens) as ticket:
+                        start = time.monotonic()
+                        ttfb = None
+                        chunks = provider.astream(prompt, **kwargs)
+                        try:
+                            while True:
+                                try:
+                                    chunk = await asyncio.wait_for(chunks.__anext__(), self.attempt_timeout)
+                                except StopAsyncIteration:
+                                    break
+                                if not parts:
+                                    ttfb = time.monotonic() - start
+                                    PROVIDER_TTFB.labels(provider.name()).observe(ttfb)
+                                    attempt_span.add_event("first_chunk")
+                                parts.append(chunk)
+                                yield chunk
+                        finally:
+                            await chunks.aclose()
+                            ticket["actual_tokens"] = tokens + _estimate_tokens(provider, "".join(parts))
+                            attempt_span.set_attribute("llm.chunks", len(parts))
+                except (asyncio.CancelledError, GeneratorExit):
+                    breaker.release()
+                    raise
+                except ProviderBusyError as exc:
+                    breaker.release()
+                    _record_error(provider.name(), exc, attempt_span)
+                    last_exc = exc
+                    continue
                 except Exception as exc:
+                    _record_error(provider.name(), exc, attempt_span)
+                    if is_retryable(exc):
+                        breaker.record_failure()
+                    else:
+                        breaker.release()
+                    if parts:
+                        raise
                     last_exc = exc
-                    sleep_time = self.backoff_base * (2 ** attempt)
-                    logging.warning(
-                        f"Provider {provider.name()} failed (attempt {attempt+1}): {exc}. "
-                        f"Retrying in {sleep_time:.2f}s..."
-                    )
-                    time.sleep(sleep_time)
-            logging.error(
-                f"Provider {provider.name()} failed after {self.max_retries} attempts. Trying next provider..."
-            )
+                    logging.error("Provider %s failed before streaming: %r. Trying next provider...", provider.name(), exc)
+                    continue
+                finally:
+                    attempt_span.end()
+                elapsed = time.monotonic() - start
+                responded = elapsed if ttfb is None else ttfb  # an empty stream answered when it ended
+                breaker.record_success(responded)
+                self.latency[provider.name()].observe(responded)
+                _record_success(provider.name(), elapsed)
+                stream_span.set_attribute("llm.provider", provider.name())
+                streamed = (provider, parts, True)
+                return
+            _record_error_status(stream_span, last_exc)
+            if isinstance(last_exc, ProviderBusyError):
+                raise last_exc
+            raise RuntimeError(f"All providers failed. Last error: {last_exc}")
+        finally:
+            stream_span.end()
+            # Finished, truncated, disconnected or failed mid-stream: what was sent counts
+            if streamed is not None and (streamed[1] or streamed[2]) and self.usage is not None and user_id:
+                provider, parts, _ = streamed
+                self._track_usage(user_id, provider, prompt, "".join(parts), query_type, kwargs.get("tenant_id"))
+            self._release_quota(reservation)
+
+    async def _attempt_provider(self, provider: LLMProvider, prompt: str, **kwargs):
+        """
+        Call one provider with per-attempt timeouts and jittered exponential backoff.
+        Non-retryable errors (4xx other than 408/425/429) are raised immediately, and an
+        open circuit breaker short-circuits the call with CircuitOpenError.
+        """
+        breaker = self.breakers[provider.name()]
+        user_id = kwargs.get("user_id")
+        query_type = kwargs.get("query_type", "qa")
+        tokens = _estimate_tokens(provider, prompt)
+        last_exc = None
+        for attempt in range(self.max_retries):
+            if not breaker.allow_request():
+                _record_error(provider.name(), CircuitOpenError())
+                raise CircuitOpenError(f"Circuit open for provider {provider.name()}")
+            sleep_time = None
+            with _attempt_span(provider, attempt) as attempt_span:
+                try:
+                    async with self.scheduler.slot(provider.name(), user_id, query_type, tokens) as ticket:
+                        start = time.monotonic()
+                        result = await asyncio.wait_for(provider.agenerate(prompt, **kwargs), self.attempt_timeout)
+                        ticket["actual_tokens"] = tokens + _estimate_tokens(provider, result)
+                except asyncio.CancelledError:
+                    breaker.release()
+                    raise
+                except ProviderBusyError as exc:
+                    breaker.release()
+                    _record_error(provider.name(), exc, attempt_span)
+                    raise
+                except Exception as exc:
+                    last_exc = exc
+                    _record_error(provider.name(), exc, attempt_span)
+                    if not is_retryable(exc):
+                        breaker.release()
+                        logging.warning("Provider %s failed with non-retryable error: %s", provider.name(), exc)
+                        raise
+                    breaker.record_failure()
+                    if attempt + 1 == self.max_retries:
+                        break
+                    sleep_time = backoff_delay(attempt, self.backoff_base, self.backoff_cap, retry_after(exc))
+                    logging.warning("Provider %s failed (attempt %s): %r. Retrying in %.2fs...",
+                                    provider.name(), attempt + 1, exc, sleep_time)
+            if sleep_time is not None:
+                await asyncio.sleep(sleep_time)
+                continue
+            elapsed = time.monotonic() - start
+            breaker.record_success(elapsed)
+            self.latency[provider.name()].observe(elapsed)
+            _record_success(provider.name(), elapsed)
+            return result
+        raise last_exc
+
+    async def _failover(self, providers: List[LLMProvider], prompt: str, **kwargs):
+        if not providers:
+            raise CircuitOpenError("All provider circuits are open")
+        last_exc = None
+        for provider in providers:
+            try:
+                return await self._attempt_provider(provider, prompt, **kwargs), provider
+            except asyncio.CancelledError:
+                raise
+            except CircuitOpenError as exc:
+                last_exc = exc
+            except Exception as exc:
+                last_exc = exc
+                logging.error("Provider %s failed. Trying next provider...", provider.name())
+        if isinstance(last_exc, ProviderBusyError):
+            raise last_exc
         raise RuntimeError(f"All providers failed. Last error: {last_exc}")
 
-    def _track_usage(self, user_id, provider, prompt, output):
-        tokens = provider.count_tokens(prompt)
-        cost = provider.estimate_cost(prompt)
-        usage = {
-            "user_id": user_id,
-            "provider": provider.name(),
-            "tokens": tokens,
-            "cost": cost,
-            "timestamp": time.time(),
-        }
-        if self.usage_db:
-            self.usage_db.insert_one(usage)
+    def hedge_delay_for(self, provider: LLMProvider) -> float:
+        """
+        Delay before a hedged request is fired: the provider's observed p95 latency
+        once enough samples exist, otherwise the configured hedge_delay.
+        """
+        tracker = self.latency[provider.name()]
+        if len(tracker) < HEDGE_MIN_SAMPLES:
+            return self.hedge_delay
+        return tracker.percentile(0.95)
+
+    async def _hedged(self, prompt: str, **kwargs):
+        providers = self._routed_providers()
+        if len(providers) < 2:
+            return await self._failover(providers, prompt, **kwargs)
+        primary, rest = providers[0], providers[1:]
+        primary_task = asyncio.create_task(self._failover([primary], prompt, **kwargs))
+        pending = {primary_task}
+        last_exc = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_delay_for(primary))
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_exc = task.exception()
+            logging.info("Hedging request: firing backup provider after primary %s delay", primary.name())
+            pending.add(asyncio.create_task(self._failover(rest, prompt, **kwargs)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_exc = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        if isinstance(last_exc, ProviderBusyError):
+            raise last_exc
+        raise RuntimeError(f"All providers failed. Last error: {last_exc}")
+
+    def agenerate_batch(self, items, concurrency: int = 8, checkpoint_path: Optional[str] = None,
+                        user_id: Optional[str] = None, tenant_id: Optional[str] = None):
+        """
+        Run many prompts with bounded concurrency; returns an async iterator of results.
+        `items` is a list of prompts / {"id", "prompt"} dicts, or a path to a JSONL file of them.
+        Identical prompts are generated once; completed prompts are checkpointed to
+        `checkpoint_path` so a re-run resumes. See orchestrator/batch.py.
+        """
+        if isinstance(items, (str, os.PathLike)):
+            with open(items, "r", encoding="utf-8") as f:
+                items = load_prompts_jsonl(f)
+        return run_batch(self, items, concurrency=concurrency, checkpoint_path=checkpoint_path, user_id=user_id,
+                         tenant_id=tenant_id)
+
+    def _routed_providers(self) -> List[LLMProvider]:
+        """
+        Order providers for one request, skipping any whose breaker is open.
+        - "priority": configured order, with degraded providers (health < 0.5) moved last.
+        - "weighted": random order weighted by health / latency, so traffic spreads
+          towards fast, healthy providers while slower ones still get samples.
+        """
+        available = [p for p in self.providers if self.breakers[p.name()].available()]
+        if self.routing != "weighted":
+            return sorted(available, key=lambda p: self.breakers[p.name()].health() < 0.5)
+        known = [b.latency_ewma for b in self.breakers.values() if b.latency_ewma is not None]
+        default_latency = sum(known) / len(known) if known else DEFAULT_ROUTING_LATENCY
+        def sort_key(p):
+            breaker = self.breakers[p.name()]
+            latency = breaker.latency_ewma if breaker.latency_ewma is not None else default_latency
+            weight = max(breaker.health(), 0.01) / (latency + 0.05)
+            # Efraimidis-Spirakis weighted sampling without replacement
+            return random.random() ** (1.0 / weight)
+        return sorted(available, key=sort_key, reverse=True)
+
+    def provider_status(self) -> List[dict]:
+        """
+        Circuit breaker state, latency and scheduler load per provider, for /api/status.
+        """
+        status = []
+        for p in self.providers:
+            snap = self.breakers[p.name()].snapshot()
+            snap["latency_p95"] = self.latency[p.name()].percentile(0.95)
+            snap.update(self.scheduler.limiter_for(p.name()).snapshot())
+            status.append(snap)
+        return status
+
+    def _reserve_quota(self, prompt: str, kwargs: dict):
+        # Budgets are checked against cached totals before any provider is called;
+        # the estimate is priced with the primary provider's rates
+        if self.quotas is None or not kwargs.get("user_id"):
+            return None
+        tokens, cost = self.quotas.estimate(self.providers[0], prompt)
+        return self.quotas.reserve(self.quotas.check(kwargs["user_id"], kwargs.get("tenant_id"), tokens, cost))
+
+    async def _areserve_quota(self, prompt: str, kwargs: dict):
+        if self.quotas is None or not kwargs.get("user_id"):
+            return None
+        tokens, cost = self.quotas.estimate(self.providers[0], prompt)
+        return self.quotas.reserve(await self.quotas.acheck(kwargs["user_id"], kwargs.get("tenant_id"), tokens, cost))
+
+    def _release_quota(self, reservation):
+        # Called after _track_usage has recorded the actual usage, which replaces the estimate
+        if reservation is not None:
+            self.quotas.release(reservation)
+
+    def _track_usage(self, user_id, provider, prompt, output, query_type=None, tenant_id=None):
+        # Counts come from the provider's tokenizer cache: the scheduler already counted this prompt/output.
+        # record() only buffers; the tracker writes usage in bulk off the request path.
+        prompt_tokens = _estimate_tokens(provider, prompt)
+        completion_tokens = _estimate_tokens(provider, output)
+        cost = provider.estimate_cost(prompt_tokens, completion_tokens)
+        self.usage.record(user_id, provider.name(), prompt_tokens, completion_tokens, cost, query_type,
+                          tenant_id=tenant_id)
 
     def get_active_provider_names(self) -> List[str]:
         return [p.name() for p in self.providers]
+
+
+def _record_success(provider: str, elapsed: float):
+    PROVIDER_REQUESTS.labels(provider, "success").inc()
+    PROVIDER_LATENCY.labels(provider).observe(elapsed)
+
+
+def _record_error(provider: str, exc: BaseException, attempt_span=None):
+    kind = "busy" if isinstance(exc, ProviderBusyError) else (
+        "circuit_open" if isinstance(exc, CircuitOpenError) else error_kind(exc))
+    PROVIDER_REQUESTS.labels(provider, "error").inc()
+    PROVIDER_ERRORS.labels(provider, kind).inc()
+    if attempt_span is not None:
+        attempt_span.set_attribute("llm.error", kind)
+        _record_error_status(attempt_span, exc)
+
+
+def _record_error_status(span, exc: Optional[BaseException]):
+    if exc is not None and span.recording:
+        span.record_exception(exc)
+        span.set_status(STATUS_ERROR, type(exc).__name__)
+
+
+def _attempt_span(provider: LLMProvider, attempt: int):
+    """
+    Span for one provider call; retries show up as sibling spans with a higher llm.attempt.
+    """
+    return span("llm.attempt", {"llm.provider": provider.name(), "llm.attempt": attempt + 1}, kind="client")
+
+
+def _estimate_tokens(provider: LLMProvider, text: str) -> int:
+    if hasattr(provider, "count_tokens"):
+        return provider.count_tokens(text)
+    return get_tokenizer(provider.name()).count(text)
@@ -0,0 +1,80 @@
+import asyncio
+import random
+from collections import deque
+from typing import Optional
+
+# Statuses worth retrying: request timeout, too early, rate limited and server errors.
+RETRYABLE_STATUS_CODES = {408, 425, 429}
+
+
+def error_status(exc: Exception) -> Optional[int]:
+    """
+    Extract an HTTP status code from a provider exception, if there is one.
+    Understands ProviderError (status_code) and requests.HTTPError (response.status_code).
+    """
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def retry_after(exc: Exception) -> Optional[float]:
+    """
+    Return the server-requested delay (seconds) for a failed call, if provided.
+    """
+    delay = getattr(exc, "retry_after", None)
+    if delay is not None:
+        return float(delay)
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    Classify a provider failure. Network errors, timeouts, 408/425/429 and 5xx
+    are transient; any other 4xx means the request itself is bad and retrying
+    the same provider will only fail again.
+    """
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = error_status(exc)
+    if status is None:
+        return True
+    return status >= 500 or status in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt: int, base: float, cap: float, server_delay: Optional[float] = None) -> float:
+    """
+    Exponential backoff with full jitter: uniform(0, min(cap, base * 2**attempt)).
+    A server-provided Retry-After acts as a floor.
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if server_delay is not None:
+        delay = max(delay, min(server_delay, cap))
+    return delay
+
+
+class LatencyTracker:
+    """
+    Rolling window of call latencies (seconds) for a single provider.
+    """
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[idx]
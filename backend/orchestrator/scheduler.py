@@ -0,0 +1,203 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+# Lower value = served first. Interactive query types beat long reports and bulk jobs.
+QUERY_PRIORITIES = {
+    "qa": 0,
+    "code": 0,
+    "technical": 1,
+    "report": 2,
+    "batch": 3,
+}
+DEFAULT_PRIORITY = 1
+
+
+class ProviderBusyError(RuntimeError):
+    """
+    Raised when a provider call cannot be admitted within the allowed wait.
+    Maps to HTTP 429; retry_after is the scheduler's estimate in seconds.
+    """
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` tokens per minute.
+    The balance may go negative when usage is reconciled after a call,
+    which simply delays the next admissions.
+    """
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until `amount` tokens are available (0 if available now).
+        Requests larger than the capacity only need a full bucket.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+
+class ProviderLimiter:
+    """
+    Admission control for a single provider: a concurrency limit, optional
+    requests/min and tokens/min buckets, and a priority queue that is fair
+    across users (each user's n-th queued request sorts after every other
+    user's (n-1)-th within the same priority class).
+    Waiters either get a slot within `max_wait` seconds or a ProviderBusyError;
+    if the buckets cannot refill in time the rejection is immediate.
+    """
+    def __init__(self, name: str, max_concurrency: int = 8, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, max_wait: float = 5.0, max_queue: int = 1000):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rpm = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tpm = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._user_turns: Dict[str, int] = {}
+
+    def _bucket_wait(self, tokens: int) -> float:
+        wait = 0.0
+        if self.rpm:
+            wait = max(wait, self.rpm.wait_time(1))
+        if self.tpm:
+            wait = max(wait, self.tpm.wait_time(tokens))
+        return wait
+
+    def _wake_head(self):
+        if self._queue:
+            self._queue[0][3].set()
+
+    def _remove(self, entry):
+        if entry in self._queue:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+            self._wake_head()
+
+    async def acquire(self, user_id: Optional[str], priority: int, tokens: int) -> float:
+        """
+        Wait for a slot. Returns the time spent queued (seconds).
+        """
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        if len(self._queue) >= self.max_queue:
+            raise ProviderBusyError(f"Provider {self.name} queue is full", retry_after=self.max_wait)
+        bucket_wait = self._bucket_wait(tokens)
+        if bucket_wait > self.max_wait:
+            raise ProviderBusyError(f"Provider {self.name} quota exhausted", retry_after=bucket_wait)
+        turn = self._user_turns.get(user_id, 0)
+        self._user_turns[user_id] = turn + 1
+        entry = [priority, turn, next(self._seq), asyncio.Event()]
+        heapq.heappush(self._queue, entry)
+        try:
+            while True:
+                timeout = None
+                if self._queue[0] is entry and self.in_flight < self.max_concurrency:
+                    timeout = self._bucket_wait(tokens)
+                    if timeout <= 0:
+                        heapq.heappop(self._queue)
+                        self.in_flight += 1
+                        if self.rpm:
+                            self.rpm.consume(1)
+                        if self.tpm:
+                            self.tpm.consume(tokens)
+                        self._wake_head()
+                        return time.monotonic() - start
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (timeout is not None and timeout > remaining):
+                    raise ProviderBusyError(
+                        f"Provider {self.name} busy (waited {time.monotonic() - start:.2f}s)",
+                        retry_after=max(timeout or 0.0, 1.0),
+                    )
+                entry[3].clear()
+                try:
+                    await asyncio.wait_for(entry[3].wait(), timeout if timeout is not None else remaining)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._remove(entry)
+            self._forget_idle_users()
+            raise
+
+    def release(self, reserved_tokens: int = 0, actual_tokens: Optional[int] = None):
+        """
+        Free a concurrency slot and reconcile the tokens/min bucket with the
+        actual token count of the call (prompt + output).
+        """
+        self.in_flight -= 1
+        if self.tpm and actual_tokens is not None and actual_tokens != reserved_tokens:
+            self.tpm.consume(actual_tokens - reserved_tokens)
+        self._wake_head()
+        self._forget_idle_users()
+
+    def _forget_idle_users(self):
+        # Fairness turns only matter while requests are queued; reset when idle so memory stays bounded.
+        if not self._queue and self.in_flight == 0:
+            self._user_turns.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": len(self._queue),
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+class OutboundScheduler:
+    """
+    Holds one ProviderLimiter per provider. `limits` maps provider name to
+    ProviderLimiter keyword arguments; `default_limits` applies to the rest.
+    """
+    def __init__(self, limits: Optional[Dict[str, dict]] = None, default_limits: Optional[dict] = None):
+        self.limits = limits or {}
+        self.default_limits = default_limits or {}
+        self.limiters: Dict[str, ProviderLimiter] = {}
+
+    def limiter_for(self, provider_name: str) -> ProviderLimiter:
+        limiter = self.limiters.get(provider_name)
+        if limiter is None:
+            options = dict(self.default_limits)
+            options.update(self.limits.get(provider_name, {}))
+            limiter = ProviderLimiter(provider_name, **options)
+            self.limiters[provider_name] = limiter
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, provider_name: str, user_id: Optional[str] = None, query_type: str = "qa", tokens: int = 1):
+        """
+        Async context manager around one provider call. Yields a dict where the caller
+        may set "actual_tokens" so the tokens/min bucket is reconciled on exit.
+        """
+        limiter = self.limiter_for(provider_name)
+        priority = QUERY_PRIORITIES.get(query_type, DEFAULT_PRIORITY)
+        waited = await limiter.acquire(user_id, priority, tokens)
+        ticket = {"waited": waited, "actual_tokens": None}
+        try:
+            yield ticket
+        finally:
+            limiter.release(tokens, ticket["actual_tokens"])
@@ -2,17 +2,13 @@ from .md_utils import validate_and_convert_markdown, detect_code_blocks, add_syn
 from .links import validate_urls
 from .hallucination import basic_hallucination_detection
 from .truncate import truncate_response
+from .pipeline import FenceHintStage, HallucinationStage, Pipeline, TruncateStage
 
 def postprocess_output(text: str, context=None, max_length=2048) -> str:
-    # Validate and convert markdown
-    html = validate_and_convert_markdown(text)
-    # Add syntax highlighting hints
-    text = add_syntax_highlighting_hints(text)
-    # Truncate
-    text = truncate_response(text, max_length)
-    # Hallucination detection (if context provided)
-    if context:
-        halluc = basic_hallucination_detection(text, context)
-        if halluc:
-            text += "\n\n[Warning: Possible hallucinated content detected!]"
+    # One pipeline run: syntax highlighting hints, structure-aware truncation,
+    # hallucination detection (if context provided). See pipeline.py.
+    ctx = Pipeline([FenceHintStage(), TruncateStage(max_length), HallucinationStage()]).run(text, context=context)
+    text = ctx.text
+    if ctx.warnings:
+        text += "\n\n[Warning: Possible hallucinated content detected!]"
     return text
@@ -1,4 +1,194 @@
-from typing import List
+"""
+Grounding checks: how much of a response is supported by the retrieved context.
+
+GroundingIndex hashes every word trigram of the context chunks once into a dict
+(trigram hash -> chunk ids). Checking a response then costs one dict lookup per
+response trigram, so it is linear in the response length however much context is
+attached. Indexes are cached by a fingerprint of the chunks (get_grounding_index),
+so a conversation that keeps the same context reuses its index across turns.
+
+Words are casefolded and punctuation is ignored ("Paris." matches "paris").
+Sentences shorter than three words are not scored.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+WORD_RE = re.compile(r"\w+(?:['’]\w+)*")
+SENTENCE_BREAK_RE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+NGRAM = 3
+DEFAULT_INDEX_CACHE_SIZE = 64
+
+ChunkId = Any
+
+
+class SentenceGrounding(NamedTuple):
+    text: str
+    start: int
+    end: int
+    score: Optional[float]   # share of the sentence's trigrams found in the context (None: too short)
+    chunk_ids: List[ChunkId]  # chunks the matching trigrams came from
+
+
+class GroundingReport(NamedTuple):
+    sentences: List[SentenceGrounding]
+    score: float              # share of all scored trigrams found in the context
+
+    def unsupported(self, threshold: float = 0.0) -> List[SentenceGrounding]:
+        """
+        Scored sentences with a grounding score at or below threshold.
+        """
+        return [s for s in self.sentences if s.score is not None and s.score <= threshold]
+
+
+def words(text: str) -> List[str]:
+    return WORD_RE.findall(text.casefold())
+
+
+def trigram_hashes(tokens: List[str]) -> Iterator[int]:
+    return (hash(t) for t in zip(tokens, tokens[1:], tokens[2:]))
+
+
+def split_sentences(text: str) -> Iterator[Tuple[int, int]]:
+    """
+    (start, end) of each sentence: text is split after ., ! or ? followed by
+    whitespace, and at blank lines.
+    """
+    start = 0
+    for m in SENTENCE_BREAK_RE.finditer(text):
+        yield start, m.start()
+        start = m.end()
+    yield start, len(text)
+
+
+def chunk_id(chunk: Union[str, dict], position: int) -> ChunkId:
+    """
+    Id of a context chunk: "<filename>:<chunk_id>" for stored chunks (context/indexer.py),
+    otherwise its "id"/"chunk_id" or its position in the list.
+    """
+    if isinstance(chunk, dict):
+        if "filename" in chunk and "chunk_id" in chunk:
+            return f"{chunk['filename']}:{chunk['chunk_id']}"
+        return chunk.get("chunk_id", chunk.get("id", position))
+    return position
+
+
+def chunk_text(chunk: Union[str, dict]) -> str:
+    return chunk.get("text", "") if isinstance(chunk, dict) else chunk
+
+
+class GroundingIndex:
+    """
+    Hashed word-trigram set over context chunks, mapping each trigram to the chunks
+    that contain it.
+    """
+    def __init__(self, chunks: Iterable[Union[str, dict]]):
+        self.chunk_ids: List[ChunkId] = []
+        # trigram hash -> chunk position, or a list of positions when shared by several chunks
+        self._trigrams: Dict[int, Union[int, List[int]]] = {}
+        for position, chunk in enumerate(chunks):
+            self.chunk_ids.append(chunk_id(chunk, position))
+            for h in set(trigram_hashes(words(chunk_text(chunk)))):
+                seen = self._trigrams.get(h)
+                if seen is None:
+                    self._trigrams[h] = position
+                elif isinstance(seen, list):
+                    seen.append(position)
+                else:
+                    self._trigrams[h] = [seen, position]
+
+    def __len__(self) -> int:
+        return len(self._trigrams)
+
+    def check(self, response: str) -> GroundingReport:
+        """
+        Per-sentence grounding scores and the chunk ids supporting each sentence.
+        """
+        sentences = []
+        matched_total = scored_total = 0
+        for start, end in split_sentences(response):
+            text = response[start:end]
+            if not text.strip():
+                continue
+            tokens = words(text)
+            if len(tokens) < NGRAM:
+                sentences.append(SentenceGrounding(text, start, end, None, []))
+                continue
+            matched = 0
+            positions = {}
+            for h in trigram_hashes(tokens):
+                seen = self._trigrams.get(h)
+                if seen is None:
+                    continue
+                matched += 1
+                for position in (seen if isinstance(seen, list) else (seen,)):
+                    positions[position] = None
+            count = len(tokens) - NGRAM + 1
+            matched_total += matched
+            scored_total += count
+            sentences.append(SentenceGrounding(text, start, end, matched / count,
+                                               [self.chunk_ids[p] for p in positions]))
+        return GroundingReport(sentences, matched_total / scored_total if scored_total else 1.0)
+
+
+def context_fingerprint(chunks: Iterable[Union[str, dict]]) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for position, chunk in enumerate(chunks):
+        digest.update(repr(chunk_id(chunk, position)).encode("utf-8", "surrogatepass"))
+        digest.update(b"\x00")
+        digest.update(chunk_text(chunk).encode("utf-8", "surrogatepass"))
+        digest.update(b"\x01")
+    return digest.digest()
+
+
+class GroundingIndexCache:
+    """
+    LRU of grounding indexes keyed by context fingerprint (or a caller-supplied key,
+    e.g. a conversation id plus context version, which skips hashing the chunks).
+    """
+    def __init__(self, max_entries: int = DEFAULT_INDEX_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._indexes: "OrderedDict[Any, GroundingIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chunks: List[Union[str, dict]], key: Any = None) -> GroundingIndex:
+        key = key if key is not None else context_fingerprint(chunks)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                self.hits += 1
+                return index
+            self.misses += 1
+        index = GroundingIndex(chunks)
+        with self._lock:
+            self._indexes[key] = index
+            if len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+        return index
+
+    def cache_info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._indexes)}
+
+
+_index_cache = GroundingIndexCache()
+
+
+def get_grounding_index(chunks: List[Union[str, dict]], key: Any = None) -> GroundingIndex:
+    return _index_cache.get(chunks, key)
+
+
+def grounding_cache_info() -> dict:
+    return _index_cache.cache_info()
+
+
+def check_grounding(response: str, context: List[Union[str, dict]], key: Any = None) -> GroundingReport:
+    return get_grounding_index(context, key).check(response)
+
 
 def basic_hallucination_detection(response: str, context: List[str]) -> List[str]:
     """
@@ -6,22 +196,4 @@ def basic_hallucination_detection(response: str, context: List[str]) -> List[str
     Returns a list of suspected hallucinated sentences.
     Flags sentences where no significant phrase (3+ words) matches any context sentence.
     """
-    import re
-    sentences = re.split(r'(?<=[.!?]) +', response)
-    hallucinated = []
-    context_text = ' '.join(context).lower()
-    for sent in sentences:
-        sent_clean = sent.strip()
-        if not sent_clean:
-            continue
-        # Look for 3+ word phrases in the sentence that appear in the context
-        found = False
-        words = sent_clean.split()
-        for i in range(len(words) - 2):
-            phrase = ' '.join(words[i:i+3]).lower()
-            if phrase in context_text:
-                found = True
-                break
-        if not found:
-            hallucinated.append(sent)
-    return hallucinated
+    return [s.text for s in check_grounding(response, context).unsupported()]
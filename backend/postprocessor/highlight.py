@@ -0,0 +1,226 @@
+"""
+Cached syntax highlighting for fenced code blocks.
+
+LLM answers (especially in `code` mode) repeat the same snippets across users, and
+Pygments lexer lookup plus highlighting is the most expensive part of rendering a
+response. CodeHighlighter keeps:
+
+- a bounded LRU of highlighted HTML keyed by (language, sha256 of the code), so a
+  snippet is highlighted once per process however many responses contain it;
+- lexer instances per language, preloaded at startup (get_lexer_by_name scans the
+  Pygments plugin registry on every call);
+- a worker pool for large blocks: prewarm() highlights uncached blocks over
+  HIGHLIGHT_OFFLOAD_CHARS off the event loop before the response is rendered.
+
+highlight_extension() plugs the cache into Python-Markdown: fenced blocks found with the
+same detection as md_utils.detect_code_blocks are replaced by the cached HTML before
+`fenced_code` runs. The HTML is what `codehilite` produces (`<div class="codehilite">`,
+`language-<lang>` on the code element), except that blocks without a language are
+rendered as plain text instead of guessing the lexer. Blocks with `{attribute}` fences
+and indented code blocks are left to `codehilite`.
+
+Pygments and Markdown are imported on first use (preload() or the first render), not
+when this module is imported.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Tuple
+
+try:
+    from .md_utils import iter_code_blocks
+except ImportError:  # imported top-level with backend/postprocessor on sys.path
+    from md_utils import iter_code_blocks
+
+if TYPE_CHECKING:
+    from pygments.lexer import Lexer
+
+DEFAULT_CACHE_SIZE = int(os.getenv("HIGHLIGHT_CACHE_SIZE", "2048"))
+# Blocks at least this long are highlighted in the worker pool by prewarm()
+OFFLOAD_CHARS = int(os.getenv("HIGHLIGHT_OFFLOAD_CHARS", "2000"))
+WORKERS = int(os.getenv("HIGHLIGHT_WORKERS", "2"))
+PLAIN_TEXT = "text"
+# Language names come from model output; bound the lexer cache
+MAX_LEXERS = 512
+
+# Languages LLM answers use most; preloaded at startup
+PRELOAD_LANGUAGES = [
+    "python", "javascript", "typescript", "java", "c", "cpp", "csharp", "go", "rust",
+    "ruby", "php", "kotlin", "swift", "bash", "shell", "powershell", "sql", "json",
+    "yaml", "toml", "ini", "html", "css", "xml", "markdown", "dockerfile", "diff", "text",
+]
+
+
+def code_key(lang: str, code: str) -> Tuple[str, str]:
+    return lang, hashlib.sha256(code.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class CodeHighlighter:
+    """
+    Thread-safe highlighter with a bounded HTML cache and a lexer cache.
+    """
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE, css_class: str = "codehilite",
+                 style: str = "default", offload_chars: int = OFFLOAD_CHARS,
+                 executor: Optional[Executor] = None):
+        self.max_entries = max_entries
+        self.css_class = css_class
+        self.style = style
+        self.offload_chars = offload_chars
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lexers: Dict[str, "Lexer"] = {}
+        self._lock = threading.Lock()
+        self._executor = executor
+
+    def preload(self, languages: Iterable[str] = PRELOAD_LANGUAGES) -> int:
+        """
+        Resolve lexers ahead of the first request. Returns the number of cached lexers.
+        """
+        for lang in languages:
+            self.lexer(lang)
+        return len(self._lexers)
+
+    def lexer(self, lang: str) -> "Lexer":
+        """
+        Cached lexer for a language name or alias; unknown languages get the plain-text lexer.
+        """
+        from pygments.lexers import get_lexer_by_name
+        from pygments.util import ClassNotFound
+
+        key = (lang or PLAIN_TEXT).lower()
+        lexer = self._lexers.get(key)
+        if lexer is None:
+            try:
+                lexer = get_lexer_by_name(key)
+            except ClassNotFound:
+                lexer = self._lexers.get(PLAIN_TEXT) or get_lexer_by_name(PLAIN_TEXT)
+            if len(self._lexers) < MAX_LEXERS:
+                self._lexers[key] = lexer
+        return lexer
+
+    def _render(self, code: str, lang: str) -> str:
+        from pygments import highlight
+        from pygments.formatters import HtmlFormatter
+
+        lexer = self.lexer(lang)
+        # Same formatter options as markdown's codehilite extension
+        formatter = HtmlFormatter(cssclass=self.css_class, style=self.style, wrapcode=True,
+                                  lang_str=f"language-{lang or lexer.aliases[0]}")
+        return highlight(code.strip("\n"), lexer, formatter)
+
+    def cached(self, code: str, lang: str = "") -> Optional[str]:
+        key = code_key(lang, code)
+        with self._lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            return html
+
+    def _store(self, code: str, lang: str, html: str):
+        with self._lock:
+            self._cache[code_key(lang, code)] = html
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def highlight(self, code: str, lang: str = "") -> str:
+        """
+        Highlighted HTML for a code block (cached by language and code hash).
+        """
+        html = self.cached(code, lang)
+        if html is not None:
+            return html
+        with self._lock:
+            self.misses += 1
+        html = self._render(code, lang)
+        self._store(code, lang, html)
+        return html
+
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="highlight")
+        return self._executor
+
+    async def ahighlight(self, code: str, lang: str = "") -> str:
+        """
+        Like highlight(), but large uncached blocks are highlighted in the worker pool.
+        """
+        html = self.cached(code, lang)
+        if html is not None:
+            return html
+        if len(code) < self.offload_chars:
+            return self.highlight(code, lang)
+        with self._lock:
+            self.misses += 1
+        html = await asyncio.get_running_loop().run_in_executor(self.executor(), self._render, code, lang)
+        self._store(code, lang, html)
+        return html
+
+    async def prewarm(self, text: str, tab_length: int = 4) -> int:
+        """
+        Highlight the large uncached fenced blocks of a markdown document in the worker
+        pool, so the (synchronous) markdown render that follows only hits the cache.
+        Returns the number of large blocks found.
+        """
+        # Same whitespace normalization Markdown applies before fenced blocks are extracted
+        text = text.replace("\r\n", "\n").replace("\r", "\n").expandtabs(tab_length)
+        jobs = [self.ahighlight(m.group("code"), m.group("lang") or "")
+                for m in iter_code_blocks(text)
+                if len(m.group("code")) >= self.offload_chars]
+        if jobs:
+            await asyncio.gather(*jobs)
+        return len(jobs)
+
+    def cache_info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._cache),
+                "max_entries": self.max_entries, "lexers": len(self._lexers)}
+
+
+def highlight_extension(highlighter: CodeHighlighter):
+    """
+    Python-Markdown extension replacing fenced code blocks with the highlighter's cached HTML.
+    """
+    from markdown.extensions import Extension
+    from markdown.preprocessors import Preprocessor
+
+    class HighlightPreprocessor(Preprocessor):
+        """
+        Replace fenced code blocks with cached highlighted HTML (stashed like fenced_code does).
+        """
+        def run(self, lines):
+            text = "\n".join(lines)
+            parts = []
+            last = 0
+            for m in iter_code_blocks(text):
+                html = highlighter.highlight(m.group("code"), m.group("lang") or "")
+                parts.append(text[last:m.start()])
+                parts.append(f"\n{self.md.htmlStash.store(html)}\n")
+                last = m.end()
+            if not parts:
+                return lines
+            parts.append(text[last:])
+            return "".join(parts).split("\n")
+
+    class HighlightExtension(Extension):
+        def extendMarkdown(self, md):
+            # After normalize_whitespace (30), before fenced_code_block (25)
+            md.preprocessors.register(HighlightPreprocessor(md), "cached_highlight", 27)
+
+    return HighlightExtension()
+
+
+_default_highlighter: Optional[CodeHighlighter] = None
+
+
+def get_highlighter() -> CodeHighlighter:
+    """
+    Process-wide highlighter shared by every renderer.
+    """
+    global _default_highlighter
+    if _default_highlighter is None:
+        _default_highlighter = CodeHighlighter()
+    return _default_highlighter
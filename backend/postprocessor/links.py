@@ -1,14 +1,85 @@
+"""
+URL validation and link verification for LLM responses.
+
+LinkVerifier gives each link a verdict:
+- "denied": non-web schemes (javascript:, data:, ...), unparseable URLs, or hosts on
+  the denylist;
+- "allowed": hosts on the allowlist or known-good list, mailto: links, or hosts that
+  appear in the user's uploaded context;
+- "unknown": everything else (or the optional resolver's answer once it has one).
+
+Verdicts are per host and kept in a TTL cache. An optional resolver (e.g. a DNS or
+HEAD check) runs in the background on a cache miss and never blocks a reply; the
+link counts as unknown until its answer is cached.
+
+LinkStage (a streaming pipeline stage) rewrites links as soon as they are complete:
+denied links are stripped (markdown links keep their text), unknown links are kept,
+annotated or stripped (`unknown_action`). Text that might still be part of a link
+(an open `[`, an open backtick, a URL touching the end of the chunk) is held back
+until it is complete. Links inside code are left alone.
+
+The rewrite works on the markdown source, so it cannot see every form a link can take
+(reference definitions, `<...>` targets, entities). The renderer therefore checks the
+rendered URLs again (render.safe_links_extension) with is_safe_url: URLs are
+entity-decoded and stripped like a browser would before their scheme is read, and a
+colon before the first "/" without a readable scheme is denied. Raw HTML is never
+rendered, only shown as text.
+"""
+import hashlib
+import html
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, FrozenSet, Iterable, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 
+URL_RE = re.compile(r'https?://\S+')
+# Inline code (left alone), markdown links, then bare URLs
+LINK_RE = re.compile(
+    r'(?P<code>`[^`\n]*`)'
+    r'|\[(?P<text>[^\]\n]*)\]\((?P<target>[^\s()]+(?:\([^\s()]*\)[^\s()]*)*)(?P<title>\s+"[^"\n]*")?\)'
+    r'|<?(?P<url>https?://[^\s<>()\[\]"\'`]+)>?'
+)
+TRAILING_PUNCTUATION = ".,;:!?"
+FENCE_LINE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})(.*)$")
+URL_PREFIXES = ("https://", "http://")
+OPENER_RE = re.compile(r"[\[`]")
+# Start of a line that is, or may still become, a code fence
+FENCE_START_RE = re.compile(r" {0,3}(?:`{3,}|~{3,}|`{0,2}$|~{1,2}$)")
+
+ALLOWED = "allowed"
+DENIED = "denied"
+UNKNOWN = "unknown"
+
+WEB_SCHEMES = {"http", "https"}
+SAFE_SCHEMES = {"mailto"}
+# Attributes holding URLs
+URL_ATTRIBUTES = {"href", "src", "action", "formaction", "xlink:href", "poster", "background"}
+# Browsers drop these anywhere in a URL, and leading/trailing controls and spaces
+URL_IGNORED_RE = re.compile(r"[\t\n\r]")
+URL_STRIP = "".join(map(chr, range(0x21)))
+
+DEFAULT_KNOWN_GOOD = [
+    "wikipedia.org", "python.org", "github.com", "developer.mozilla.org", "stackoverflow.com",
+    "readthedocs.io", "pypi.org", "npmjs.com", "docs.microsoft.com", "learn.microsoft.com",
+]
+UNVERIFIED_NOTE = " *(unverified link)*"
+REMOVED_LINK = "[link removed]"
+# A comma-separated string, a file with one domain per line, or a list of domains
+Domains = Union[str, Iterable[str]]
+# Longest stretch of text held back while waiting for a link to complete
+MAX_HOLDBACK = 2048
+
+
 def validate_urls(text: str) -> list:
     """
     Finds and validates all URLs in the text. Returns a list of (url, is_valid) tuples.
     """
-    url_pattern = re.compile(r'https?://\S+')
-    urls = url_pattern.findall(text)
     results = []
-    for url in urls:
+    for url in URL_RE.findall(text):
         try:
             result = urlparse(url)
             is_valid = all([result.scheme, result.netloc])
@@ -16,3 +87,308 @@ def validate_urls(text: str) -> list:
             is_valid = False
         results.append((url, is_valid))
     return results
+
+
+def parse_domains(value: Domains) -> List[str]:
+    """
+    Domains from a comma-separated string, a file with one domain per line, or a list.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        if os.path.isfile(value):
+            with open(value, "r", encoding="utf-8") as f:
+                value = [line.split("#", 1)[0] for line in f]
+        else:
+            value = value.split(",")
+    return [d.strip().lower().lstrip(".") for d in value if d.strip()]
+
+
+def host_matches(host: str, domains: FrozenSet[str]) -> bool:
+    """
+    True if host is one of domains or a subdomain of one.
+    """
+    if host in domains:
+        return True
+    dot = host.find(".")
+    while dot >= 0:
+        if host[dot + 1:] in domains:
+            return True
+        dot = host.find(".", dot + 1)
+    return False
+
+
+def url_host(url: str) -> Optional[str]:
+    try:
+        return (urlparse(url).hostname or "").lower() or None
+    except ValueError:
+        return None
+
+
+def normalize_url(url: str) -> str:
+    """
+    The URL a browser would follow: entities decoded, tabs and newlines removed,
+    surrounding spaces, control characters and <> dropped.
+    """
+    url = URL_IGNORED_RE.sub("", html.unescape(url)).strip(URL_STRIP)
+    if url.startswith("<") and url.endswith(">"):
+        url = url[1:-1].strip(URL_STRIP)
+    return url
+
+
+def scheme_verdict(url: str) -> Optional[str]:
+    """
+    Verdict decided by the scheme alone, or None for web URLs (decided by their host).
+    Relative links are unknown; a colon before the first "/", "?" or "#" that does not
+    parse as a scheme is denied.
+    """
+    url = normalize_url(url)
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return DENIED
+    scheme = parsed.scheme.lower()
+    if scheme in SAFE_SCHEMES:
+        return ALLOWED
+    if scheme in WEB_SCHEMES or (not scheme and parsed.netloc):
+        return None  # including protocol-relative //host links
+    if scheme or ":" in re.split(r"[/?#]", url, 1)[0]:
+        return DENIED
+    return UNKNOWN
+
+
+def is_safe_url(url: str) -> bool:
+    """
+    May this URL be rendered at all (web, mailto or relative)? Host lists are not consulted.
+    """
+    return scheme_verdict(url) != DENIED
+
+
+class LinkVerifier:
+    """
+    Per-host link verdicts with a TTL cache.
+    """
+    def __init__(self, allow: Domains = (), deny: Domains = (), known_good: Domains = (),
+                 ttl: float = 300.0, max_entries: int = 10_000,
+                 resolver: Optional[Callable[[str], Optional[bool]]] = None, executor: Optional[Executor] = None):
+        self.allow = frozenset(parse_domains(allow))
+        self.deny = frozenset(parse_domains(deny))
+        self.known_good = frozenset(parse_domains(known_good))
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.resolver = resolver
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._resolving = set()
+        self._lock = threading.Lock()
+        self._executor = executor
+
+    def verdict(self, url: str, context_hosts: FrozenSet[str] = frozenset()) -> str:
+        verdict = scheme_verdict(url)
+        if verdict is not None:
+            return verdict
+        host = url_host(normalize_url(url))
+        if host is None:
+            return DENIED
+        verdict = self.host_verdict(host)
+        if verdict == UNKNOWN and host_matches(host, context_hosts):
+            return ALLOWED
+        return verdict
+
+    def host_verdict(self, host: str) -> str:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(host)
+            if cached is not None and cached[1] > now:
+                self._cache.move_to_end(host)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+        if host_matches(host, self.deny):
+            verdict = DENIED
+        elif host_matches(host, self.allow) or host_matches(host, self.known_good):
+            verdict = ALLOWED
+        else:
+            verdict = UNKNOWN
+        self._store(host, verdict, now)
+        if verdict == UNKNOWN and self.resolver is not None:
+            self._resolve_later(host)
+        return verdict
+
+    def _store(self, host: str, verdict: str, now: float):
+        with self._lock:
+            self._cache[host] = (verdict, now + self.ttl)
+            self._cache.move_to_end(host)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _resolve_later(self, host: str):
+        with self._lock:
+            if host in self._resolving:
+                return
+            self._resolving.add(host)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="link-resolver")
+        self._executor.submit(self._resolve, host)
+
+    def _resolve(self, host: str):
+        try:
+            ok = self.resolver(host)
+            if ok is not None:
+                self._store(host, ALLOWED if ok else DENIED, time.monotonic())
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._resolving.discard(host)
+
+    def cache_info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
+
+
+_context_hosts: "OrderedDict[bytes, FrozenSet[str]]" = OrderedDict()
+_context_lock = threading.Lock()
+
+
+def context_hosts(chunks) -> FrozenSet[str]:
+    """
+    Hosts of the URLs in the user's context chunks (cached per context).
+    """
+    if not chunks:
+        return frozenset()
+    texts = [c.get("text", "") if isinstance(c, dict) else c for c in chunks]
+    key = hashlib.blake2b("\x00".join(texts).encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    with _context_lock:
+        hosts = _context_hosts.get(key)
+        if hosts is not None:
+            _context_hosts.move_to_end(key)
+            return hosts
+    hosts = frozenset(h for text in texts for url in URL_RE.findall(text) if (h := url_host(url)))
+    with _context_lock:
+        _context_hosts[key] = hosts
+        if len(_context_hosts) > 256:
+            _context_hosts.popitem(last=False)
+    return hosts
+
+
+def _opener(text: str, start: int, end: int) -> Optional[int]:
+    """
+    First backtick or "[" between start and end that later text could still turn into
+    a code span or a link.
+    """
+    m = OPENER_RE.search(text, start, end)
+    while m:
+        if m.group() == "`":
+            return m.start()
+        close = text.find("]", m.start() + 1)
+        if close < 0 or close + 1 >= len(text) or text[close + 1] == "(":
+            return m.start()
+        m = OPENER_RE.search(text, m.start() + 1, end)
+    return None
+
+
+def hold_point(text: str, line_start: bool = True) -> int:
+    """
+    Position from which text may still change how its links are read once more text
+    arrives (len(text) if none). Everything before it can be rewritten and released.
+    line_start tells whether text starts at the beginning of a line.
+    """
+    start = text.rfind("\n") + 1
+    floor = max(start, len(text) - MAX_HOLDBACK)
+    if (start or line_start) and FENCE_START_RE.match(text, start):
+        return floor  # possible fence line: wait for the whole line
+    pos = start
+    for m in LINK_RE.finditer(text, start):
+        opener = _opener(text, pos, m.start())
+        if opener is not None:
+            return max(opener, floor)
+        if m.end() == len(text):
+            return max(m.start(), floor)  # a link touching the end may continue
+        pos = m.end()
+    opener = _opener(text, pos, len(text))
+    if opener is not None:
+        return max(opener, floor)
+    # A URL scheme may be arriving ("... see htt"), possibly as an autolink ("<htt")
+    hold = len(text)
+    for prefix in URL_PREFIXES:
+        for k in range(min(len(prefix), len(text) - pos), 0, -1):
+            if text.endswith(prefix[:k]):
+                hold = min(hold, len(text) - k)
+                break
+    if hold > pos and text[hold - 1] == "<":
+        hold -= 1
+    return max(hold, floor)
+
+
+class LinkRewriter:
+    """
+    Applies verdicts to the links of markdown text, skipping fenced code; stateful so
+    text can be processed in consecutive pieces.
+    """
+    def __init__(self, verifier: LinkVerifier, hosts: FrozenSet[str] = frozenset(), unknown_action: str = "keep"):
+        self.verifier = verifier
+        self.hosts = hosts
+        self.unknown_action = unknown_action
+        self.links: List[Tuple[str, str]] = []
+        self._fence = None
+        self.at_line_start = True
+
+    def rewrite(self, text: str) -> str:
+        out = []
+        for line in text.splitlines(keepends=True):
+            fence = FENCE_LINE_RE.match(line.rstrip("\r\n")) if self.at_line_start else None
+            if fence:
+                marker, info = fence.groups()
+                if self._fence is None:
+                    self._fence = marker
+                elif marker[0] == self._fence[0] and len(marker) >= len(self._fence) and not info.strip():
+                    self._fence = None
+                out.append(line)
+            elif self._fence is not None:
+                out.append(line)
+            else:
+                out.append(LINK_RE.sub(self._replace, line))
+            self.at_line_start = line.endswith("\n")
+        return "".join(out)
+
+    def _replace(self, m: re.Match) -> str:
+        if m.group("code"):
+            return m.group(0)
+        if m.group("url"):
+            whole, url, suffix = m.group(0), m.group("url"), ""
+            if not whole.endswith(">"):
+                # Sentence punctuation after a bare URL is not part of it
+                stripped = url.rstrip(TRAILING_PUNCTUATION)
+                suffix = url[len(stripped):]
+                url, whole = stripped, whole[:len(whole) - len(suffix)]
+            verdict = self._verdict(url)
+            if verdict == DENIED or (verdict == UNKNOWN and self.unknown_action == "strip"):
+                return REMOVED_LINK + suffix
+            if verdict == UNKNOWN and self.unknown_action == "annotate":
+                return whole + UNVERIFIED_NOTE + suffix
+            return m.group(0)
+        verdict = self._verdict(m.group("target"))
+        if verdict == DENIED or (verdict == UNKNOWN and self.unknown_action == "strip"):
+            return m.group("text")
+        if verdict == UNKNOWN and self.unknown_action == "annotate":
+            return m.group(0) + UNVERIFIED_NOTE
+        return m.group(0)
+
+    def _verdict(self, url: str) -> str:
+        verdict = self.verifier.verdict(url, self.hosts)
+        self.links.append((url, verdict))
+        return verdict
+
+
+_default_verifier: Optional[LinkVerifier] = None
+
+
+def get_link_verifier() -> LinkVerifier:
+    """
+    Process-wide verifier with the default known-good domains (main.py configures its own).
+    """
+    global _default_verifier
+    if _default_verifier is None:
+        _default_verifier = LinkVerifier(known_good=DEFAULT_KNOWN_GOOD)
+    return _default_verifier
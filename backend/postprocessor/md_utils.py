@@ -1,7 +1,17 @@
 import re
-from typing import Tuple
-import importlib
-md_lib = importlib.import_module('markdown')
+from typing import Iterator, Tuple
+
+# Fenced code block as Python-Markdown's fenced_code extension finds it:
+# an opening fence at the start of a line, an optional language, and the same fence closing it
+CODE_BLOCK_RE = re.compile(
+    r"^(?P<fence>`{3,}|~{3,})[ ]*\.?(?P<lang>[\w#.+-]*)[ ]*\n(?P<code>.*?)(?<=\n)(?P=fence)[ ]*$",
+    re.MULTILINE | re.DOTALL,
+)
+
+FENCE_LINE_RE = re.compile(r"^( {0,3})(`{3,}|~{3,})(.*)$")
+
+# Built once; reset() between documents instead of rebuilding the extensions per call
+_renderer = None
 
 
 def validate_and_convert_markdown(text: str) -> str:
@@ -9,27 +19,98 @@ def validate_and_convert_markdown(text: str) -> str:
     Validates and converts markdown to HTML. Returns HTML string.
     Raises ValueError if invalid markdown is detected.
     """
+    global _renderer
     try:
-        html = md_lib.markdown(text, extensions=["extra", "codehilite"])
+        if _renderer is None:
+            # Imported here: render -> highlight -> md_utils
+            try:
+                from .render import MarkdownRenderer
+            except ImportError:
+                from render import MarkdownRenderer
+            _renderer = MarkdownRenderer(extensions=["extra", "codehilite"])
+        html = _renderer.render(text)
         return html
     except Exception as e:
         raise ValueError(f"Invalid markdown: {e}")
 
 
+def iter_code_blocks(text: str) -> Iterator[re.Match]:
+    """
+    Fenced code block matches, with "fence", "lang" and "code" groups.
+    """
+    return CODE_BLOCK_RE.finditer(text)
+
+
 def detect_code_blocks(text: str) -> list:
     """
     Detects code blocks and returns a list of (lang, code) tuples.
     """
-    code_blocks = re.findall(r'```(\w+)?\n([\s\S]*?)```', text)
-    return [(lang or "", code) for lang, code in code_blocks]
+    return [(m.group("lang"), m.group("code")) for m in iter_code_blocks(text)]
+
+
+class FenceHinter:
+    """
+    Adds a language hint to code fences opened without one, line by line.
+    feed() returns the text that is ready; a partial line is held back only while it
+    could still turn out to be a fence line. close() returns what is left.
+    """
+    def __init__(self, default_lang: str = "plaintext"):
+        self.default_lang = default_lang
+        self._fence = None       # marker of the open fence
+        self._pending = ""       # held-back start of a line
+        self._mid_line = False   # a partial (non-fence) line was already passed on
+
+    def annotate(self, text: str) -> str:
+        return self.feed(text) + self.close()
+
+    def feed(self, chunk: str) -> str:
+        text = self._pending + chunk
+        self._pending = ""
+        out = []
+        start = 0
+        if self._mid_line:
+            nl = text.find("\n")
+            if nl < 0:
+                return text
+            out.append(text[:nl + 1])
+            start = nl + 1
+            self._mid_line = False
+        while True:
+            nl = text.find("\n", start)
+            if nl < 0:
+                break
+            out.append(self._line(text[start:nl]))
+            out.append("\n")
+            start = nl + 1
+        rest = text[start:]
+        stripped = rest.lstrip(" ")
+        if len(rest) - len(stripped) <= 3 and (set(stripped[:3]) <= {"`"} or set(stripped[:3]) <= {"~"}):
+            self._pending = rest
+        else:
+            out.append(rest)
+            self._mid_line = True
+        return "".join(out)
+
+    def close(self) -> str:
+        rest, self._pending = self._pending, ""
+        return self._line(rest) if rest else ""
+
+    def _line(self, line: str) -> str:
+        m = FENCE_LINE_RE.match(line)
+        if not m:
+            return line
+        indent, marker, info = m.groups()
+        if self._fence is None:
+            self._fence = marker
+            if not info.strip():
+                return f"{indent}{marker}{self.default_lang}"
+        elif marker[0] == self._fence[0] and len(marker) >= len(self._fence) and not info.strip():
+            self._fence = None
+        return line
 
 
 def add_syntax_highlighting_hints(text: str) -> str:
     """
     Adds syntax highlighting hints to code blocks if missing.
     """
-    def replacer(match):
-        lang, code = match.groups()
-        lang = lang or "plaintext"
-        return f"```{lang}\n{code}```"
-    return re.sub(r'```(\w*)\n([\s\S]*?)```', replacer, text)
+    return FenceHinter().annotate(text)
@@ -0,0 +1,402 @@
+"""
+Composable postprocessing pipeline for LLM responses.
+
+A Pipeline is an ordered list of stages. Each stage works on a shared
+PostprocessContext (text, retrieval context, warnings, rendered HTML, timings), so
+the response is walked once per stage instead of being re-split and re-converted
+by every helper.
+
+- Stages declare `streaming = True` when they can process text chunk by chunk
+  (feed()/flush()); every stage can process a complete text (run()).
+- Pipeline.run()/arun() runs all stages over a complete response.
+- Pipeline.stream() returns a PipelineStream: chunks flow through the leading
+  streaming stages as they arrive; from the first non-streaming stage on, the
+  remaining stages run once on the complete text at close(). Output is the same
+  as running the pipeline on the whole response.
+- Tokenization is shared: ctx.offsets(text) tokenizes a text once per request
+  with the provider's tokenizer and every stage reuses the result.
+- Time spent in each stage is accumulated in ctx.timings (milliseconds).
+
+Default chat pipeline: code fence hints -> link verification -> structure-aware truncation ->
+markdown rendering -> hallucination check (only when retrieval context is given).
+"""
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from ..providers.tokenizer import get_tokenizer, text_key
+from .hallucination import GroundingReport, check_grounding
+from .links import LinkRewriter, LinkVerifier, context_hosts, get_link_verifier, hold_point
+from .md_utils import FenceHinter
+from .render import IncrementalMarkdown, MarkdownRenderer, get_renderer
+from .truncate import ELLIPSIS, truncate_markdown
+
+DEFAULT_MAX_LENGTH = 2048
+HALLUCINATION_WARNING = "Possible hallucinated content detected"
+
+
+class PostprocessContext:
+    """
+    State shared by the stages of one pipeline run.
+    """
+    def __init__(self, text: str = "", context: Optional[List[str]] = None, provider: Optional[str] = None,
+                 query_type: str = "qa"):
+        self.text = text
+        self.context = context
+        self.provider = provider
+        self.query_type = query_type
+        self.html: Optional[str] = None
+        self.html_delta = ""       # streaming: HTML committed by the last feed
+        self.html_tail = ""        # streaming: preview of the open block
+        self.truncated = False
+        self.warnings: List[str] = []
+        self.flagged: List[str] = []
+        self.grounding: Optional[GroundingReport] = None
+        self.links: List[Tuple[str, str]] = []  # (url, verdict) for every link checked
+        self.timings: Dict[str, float] = {}
+        self.state: Dict[str, dict] = {}  # per-stage scratch space for streaming
+        self._offsets: Dict[bytes, List[int]] = {}
+
+    def offsets(self, text: Optional[str] = None) -> List[int]:
+        """
+        Token end offsets of text (default: ctx.text), tokenized once per run.
+        """
+        text = self.text if text is None else text
+        key = text_key(text)
+        offsets = self._offsets.get(key)
+        if offsets is None:
+            offsets = get_tokenizer(self.provider).offsets(text)
+            self._offsets[key] = offsets
+        return offsets
+
+    @property
+    def token_count(self) -> int:
+        return len(self.offsets())
+
+    def timings_ms(self) -> Dict[str, float]:
+        return {name: round(ms, 3) for name, ms in self.timings.items()}
+
+
+class Stage:
+    """
+    Base stage. run() processes ctx.text in full; streaming stages also implement
+    feed() (transform one chunk, return the text to pass on) and flush() (return
+    anything still buffered when the stream ends).
+    """
+    name = "stage"
+    streaming = False
+
+    def run(self, ctx: PostprocessContext):
+        pass
+
+    async def arun(self, ctx: PostprocessContext):
+        self.run(ctx)
+
+    def feed(self, ctx: PostprocessContext, chunk: str) -> str:
+        return chunk
+
+    def flush(self, ctx: PostprocessContext) -> str:
+        return ""
+
+
+class FenceHintStage(Stage):
+    """
+    Add a language hint (plaintext) to code fences that have none.
+    Streaming holds back a partial line only while it could still be a fence.
+    """
+    name = "fence_hints"
+    streaming = True
+
+    def __init__(self, default_lang: str = "plaintext"):
+        self.default_lang = default_lang
+
+    def run(self, ctx):
+        ctx.text = FenceHinter(self.default_lang).annotate(ctx.text)
+
+    def feed(self, ctx, chunk):
+        st = ctx.state.setdefault(self.name, {"hinter": FenceHinter(self.default_lang)})
+        return st["hinter"].feed(chunk)
+
+    def flush(self, ctx):
+        st = ctx.state.get(self.name)
+        return st["hinter"].close() if st else ""
+
+
+class LinkStage(Stage):
+    """
+    Verify links (allow/deny lists, known-good domains, hosts in the user's context;
+    see links.py): denied links are stripped, unknown ones kept, annotated or stripped.
+    Streaming rewrites each link once it is complete.
+    """
+    name = "links"
+    streaming = True
+
+    def __init__(self, verifier: Optional[LinkVerifier] = None, unknown_action: str = "keep"):
+        self.verifier = verifier
+        self.unknown_action = unknown_action
+
+    def _rewriter(self, ctx) -> LinkRewriter:
+        rewriter = LinkRewriter(self.verifier or get_link_verifier(), context_hosts(ctx.context), self.unknown_action)
+        ctx.links = rewriter.links
+        return rewriter
+
+    def run(self, ctx):
+        ctx.text = self._rewriter(ctx).rewrite(ctx.text)
+
+    def feed(self, ctx, chunk):
+        st = ctx.state.get(self.name)
+        if st is None:
+            st = ctx.state[self.name] = {"rewriter": self._rewriter(ctx), "pending": ""}
+        text = st["pending"] + chunk
+        hold = hold_point(text, st["rewriter"].at_line_start)
+        st["pending"] = text[hold:]
+        return st["rewriter"].rewrite(text[:hold])
+
+    def flush(self, ctx):
+        st = ctx.state.get(self.name)
+        if not st or not st["pending"]:
+            return ""
+        text, st["pending"] = st["pending"], ""
+        return st["rewriter"].rewrite(text)
+
+
+class TruncateStage(Stage):
+    """
+    Structure-aware truncation to max_length characters and, optionally, max_tokens
+    tokens (see truncate.truncate_markdown). When streaming, the last `holdback`
+    characters before the limit are held until it is clear whether and where the
+    response gets cut, so streamed output matches a full run; the token budget is
+    checked per completed line.
+    """
+    name = "truncate"
+    streaming = True
+
+    def __init__(self, max_length: int = DEFAULT_MAX_LENGTH, max_tokens: Optional[int] = None,
+                 ellipsis: str = ELLIPSIS, holdback: int = 256):
+        self.max_length = max_length
+        self.max_tokens = max_tokens
+        self.ellipsis = ellipsis
+        self.holdback = holdback
+
+    def run(self, ctx):
+        limit = self.max_length
+        if self.max_tokens is not None:
+            offsets = ctx.offsets(ctx.text)
+            if len(offsets) > self.max_tokens:
+                limit = min(limit, offsets[self.max_tokens - 1] if self.max_tokens > 0 else 0)
+        if len(ctx.text) > limit:
+            ctx.text = truncate_markdown(ctx.text, limit, self.ellipsis)
+            ctx.truncated = True
+
+    def feed(self, ctx, chunk):
+        st = ctx.state.setdefault(self.name, {"parts": [], "received": 0, "sent": 0, "pending": "",
+                                              "tokens": 0, "counted": 0, "line": ""})
+        if ctx.truncated:
+            return ""
+        st["parts"].append(chunk)
+        st["received"] += len(chunk)
+        st["pending"] += chunk
+        limit = self.max_length
+        if self.max_tokens is not None:
+            # Count whole lines so token boundaries do not shift between chunks
+            line = st["line"] + chunk
+            end = line.rfind("\n") + 1
+            if end:
+                limit = min(limit, self._token_limit(ctx, st, line[:end]))
+                st["counted"] += end
+                line = line[end:]
+            st["line"] = line
+        return self._emit(ctx, st, limit, final=False)
+
+    def flush(self, ctx):
+        st = ctx.state.get(self.name)
+        if not st or ctx.truncated:
+            return ""
+        limit = self.max_length
+        if self.max_tokens is not None and st["line"]:
+            limit = min(limit, self._token_limit(ctx, st, st["line"]))
+        return self._emit(ctx, st, limit, final=True)
+
+    def _token_limit(self, ctx, st, segment: str) -> int:
+        """
+        Character limit implied by the token budget once segment (the text after
+        st["counted"]) is counted; max_length if the budget is not exceeded.
+        """
+        offsets = ctx.offsets(segment)
+        remaining = self.max_tokens - st["tokens"]
+        st["tokens"] += len(offsets)
+        if len(offsets) <= remaining:
+            return self.max_length
+        return st["counted"] + (offsets[remaining - 1] if remaining > 0 else 0)
+
+    def _emit(self, ctx, st, limit: int, final: bool) -> str:
+        sent = st["sent"]
+        if st["received"] > limit:
+            # Over budget: cut structurally, keeping everything already sent
+            ctx.truncated = True
+            return truncate_markdown("".join(st["parts"]), limit, self.ellipsis, min_cut=sent)[sent:]
+        upto = st["received"] if final else max(sent, min(st["received"], limit - self.holdback))
+        delta = st["pending"][:upto - sent]
+        st["pending"] = st["pending"][upto - sent:]
+        st["sent"] = upto
+        return delta
+
+
+class RenderStage(Stage):
+    """
+    Markdown to HTML. Streaming commits finished blocks as they arrive (IncrementalMarkdown).
+    """
+    name = "render"
+    streaming = True
+
+    def __init__(self, renderer: Optional[MarkdownRenderer] = None):
+        self.renderer = renderer
+
+    def run(self, ctx):
+        ctx.html = (self.renderer or get_renderer()).render(ctx.text)
+
+    async def arun(self, ctx):
+        ctx.html = await (self.renderer or get_renderer()).arender(ctx.text)
+
+    def feed(self, ctx, chunk):
+        st = ctx.state.setdefault(self.name, {"markdown": IncrementalMarkdown(self.renderer)})
+        update = st["markdown"].feed(chunk)
+        ctx.html_delta += update.committed
+        ctx.html_tail = update.tail
+        return chunk
+
+    def flush(self, ctx):
+        st = ctx.state.get(self.name)
+        ctx.html = st["markdown"].close() if st else (self.renderer or get_renderer()).render(ctx.text)
+        ctx.html_tail = ""
+        return ""
+
+
+class HallucinationStage(Stage):
+    """
+    Score each sentence against the retrieval context (hashed trigram index, cached
+    across turns; see hallucination.py) and flag sentences with no support.
+    Needs the full response; adds a warning instead of rewriting the text.
+    """
+    name = "hallucination"
+
+    def __init__(self, threshold: float = 0.0):
+        self.threshold = threshold
+
+    def run(self, ctx):
+        if not ctx.context:
+            return
+        ctx.grounding = check_grounding(ctx.text, ctx.context)
+        ctx.flagged = [s.text for s in ctx.grounding.unsupported(self.threshold)]
+        if ctx.flagged:
+            ctx.warnings.append(HALLUCINATION_WARNING)
+
+
+class StreamUpdate(NamedTuple):
+    text: str   # new response text (after the streaming stages)
+    html: str   # newly committed HTML, append once
+    tail: str   # HTML preview of the open block, replaces the previous tail
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage]):
+        self.stages = list(stages)
+
+    @property
+    def names(self) -> List[str]:
+        return [stage.name for stage in self.stages]
+
+    def run(self, text: str, **kwargs) -> PostprocessContext:
+        ctx = PostprocessContext(text, **kwargs)
+        for stage in self.stages:
+            _timed(ctx, stage, stage.run, ctx)
+        return ctx
+
+    async def arun(self, text: str, **kwargs) -> PostprocessContext:
+        ctx = PostprocessContext(text, **kwargs)
+        for stage in self.stages:
+            start = time.perf_counter()
+            try:
+                await stage.arun(ctx)
+            finally:
+                _record(ctx, stage, start)
+        return ctx
+
+    def stream(self, **kwargs) -> "PipelineStream":
+        return PipelineStream(self, PostprocessContext("", **kwargs))
+
+
+class PipelineStream:
+    """
+    Incremental run of a pipeline. feed() chunks, then close() for the final context;
+    `flushed` is the text released by close() (held back by the stages until the end).
+    `done` turns true once truncation has cut the response (the caller can stop reading).
+    """
+    def __init__(self, pipeline: Pipeline, ctx: PostprocessContext):
+        self.ctx = ctx
+        split = next((i for i, s in enumerate(pipeline.stages) if not s.streaming), len(pipeline.stages))
+        self.streaming = pipeline.stages[:split]
+        self.rest = pipeline.stages[split:]
+        self._parts: List[str] = []
+        self.flushed = ""
+
+    @property
+    def done(self) -> bool:
+        return self.ctx.truncated
+
+    def feed(self, chunk: str) -> StreamUpdate:
+        ctx = self.ctx
+        ctx.html_delta = ""
+        out = self._through(0, chunk)
+        self._parts.append(out)
+        return StreamUpdate(out, ctx.html_delta, ctx.html_tail)
+
+    def _through(self, first: int, chunk: str) -> str:
+        for stage in self.streaming[first:]:
+            if not chunk:
+                break
+            chunk = _timed(self.ctx, stage, stage.feed, self.ctx, chunk)
+        return chunk
+
+    def close(self) -> PostprocessContext:
+        ctx = self.ctx
+        ctx.html_delta = ""
+        flushed = []
+        for i, stage in enumerate(self.streaming):
+            # Whatever a stage still buffers goes through the stages after it
+            rest = _timed(ctx, stage, stage.flush, ctx)
+            if rest:
+                flushed.append(self._through(i + 1, rest))
+        self.flushed = "".join(flushed)
+        self._parts.append(self.flushed)
+        ctx.text = "".join(self._parts)
+        for stage in self.rest:
+            _timed(ctx, stage, stage.run, ctx)
+        return ctx
+
+
+def _record(ctx: PostprocessContext, stage: Stage, start: float):
+    ctx.timings[stage.name] = ctx.timings.get(stage.name, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def _timed(ctx: PostprocessContext, stage: Stage, fn, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        _record(ctx, stage, start)
+
+
+def chat_pipeline(max_length: int = DEFAULT_MAX_LENGTH, max_tokens: Optional[int] = None,
+                  renderer: Optional[MarkdownRenderer] = None, link_verifier: Optional[LinkVerifier] = None,
+                  unknown_links: str = "keep") -> Pipeline:
+    """
+    The chat response pipeline: fence hints, link verification, truncation, rendering,
+    hallucination check.
+    """
+    return Pipeline([
+        FenceHintStage(),
+        LinkStage(link_verifier, unknown_links),
+        TruncateStage(max_length, max_tokens),
+        RenderStage(renderer),
+        HallucinationStage(),
+    ])
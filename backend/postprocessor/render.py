@@ -0,0 +1,209 @@
+"""
+Markdown to HTML rendering for LLM responses.
+
+- MarkdownRenderer keeps one configured markdown.Markdown instance and calls reset()
+  between documents, so extensions (extra, codehilite, nl2br) are built once per
+  process instead of on every response.
+- IncrementalMarkdown renders a streamed response as it arrives. Finished block-level
+  elements (paragraphs, lists, headings, closed code fences) are rendered once and
+  committed; only the open tail block is re-rendered on each feed, so total work is
+  linear in the response length rather than quadratic.
+
+Block boundaries are conservative: a block is committed at a blank line only when the
+next line starts a new top-level block (not an indented continuation or the next item
+of the same list), or when a top-level code fence closes. Documents that use reference
+links, footnotes or abbreviations are re-rendered in full on close(), since their
+definitions can change earlier blocks. Apart from blank lines between blocks, the
+result matches rendering the whole text at once.
+
+Markdown itself is imported when the first renderer is built (get_renderer(), which
+the API calls while warming its caches at startup).
+"""
+import re
+import threading
+from typing import List, NamedTuple, Optional
+
+try:
+    from .highlight import CodeHighlighter, get_highlighter, highlight_extension
+    from .links import URL_ATTRIBUTES, is_safe_url
+except ImportError:  # imported top-level with backend/postprocessor on sys.path
+    from highlight import CodeHighlighter, get_highlighter, highlight_extension
+    from links import URL_ATTRIBUTES, is_safe_url
+
+DEFAULT_EXTENSIONS = ["extra", "codehilite", "nl2br"]
+
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+LIST_ITEM_RE = re.compile(r"^ {0,3}(?:[-*+]|\d+[.)])(?:\s|$)")
+# Reference links, footnotes and abbreviations: definitions that apply to the whole document
+REFERENCE_DEF_RE = re.compile(r"^ {0,3}\*?\[[^\]]+\]:", re.MULTILINE)
+
+
+def safe_links_extension():
+    """
+    Python-Markdown extension for untrusted (model) text. Raw HTML is not parsed at all:
+    it is escaped and shown as text, as the chat UI inserts the rendered HTML as is.
+    On the parsed document, after links, references and entities are resolved, URL
+    attributes that are not is_safe_url() and event handler attributes are removed.
+    """
+    from markdown.extensions import Extension
+    from markdown.treeprocessors import Treeprocessor
+    from markdown.util import AMP_SUBSTITUTE
+
+    class SafeLinkTreeprocessor(Treeprocessor):
+        def run(self, root):
+            for el in root.iter():
+                for name in [n for n in el.attrib if n.startswith("on") or n in URL_ATTRIBUTES]:
+                    if name.startswith("on") or not is_safe_url(el.get(name).replace(AMP_SUBSTITUTE, "&")):
+                        del el.attrib[name]
+
+    class SafeLinkExtension(Extension):
+        def extendMarkdown(self, md):
+            # Raw HTML blocks and inline tags (md_in_html from "extra" registers under the same name)
+            for registry, name in ((md.preprocessors, "html_block"), (md.inlinePatterns, "html")):
+                if name in registry:
+                    registry.deregister(name)
+            # After inline patterns (20), prettify (10) and unescape (0): attributes are final
+            md.treeprocessors.register(SafeLinkTreeprocessor(md), "safe_links", -10)
+
+    return SafeLinkExtension()
+
+
+class MarkdownRenderer:
+    """
+    Reusable renderer around a single Markdown instance. Markdown objects are not
+    thread-safe, so conversions are serialised with a lock. Unsafe URLs are dropped
+    from, and raw HTML escaped in, every rendered document (safe_links_extension).
+
+    With `codehilite` enabled (and not reconfigured), fenced code blocks go through the
+    shared CodeHighlighter cache (see highlight.py) instead of being highlighted per render.
+    """
+    def __init__(self, extensions: Optional[List[str]] = None, extension_configs: Optional[dict] = None,
+                 highlighter: Optional[CodeHighlighter] = None):
+        import markdown
+
+        self.extensions = list(DEFAULT_EXTENSIONS if extensions is None else extensions)
+        extension_configs = extension_configs or {}
+        self.highlighter = None
+        md_extensions = list(self.extensions) + [safe_links_extension()]
+        if "codehilite" in self.extensions and "codehilite" not in extension_configs:
+            self.highlighter = highlighter or get_highlighter()
+            md_extensions.append(highlight_extension(self.highlighter))
+        self._md = markdown.Markdown(extensions=md_extensions, extension_configs=extension_configs)
+        self._lock = threading.Lock()
+
+    def render(self, text: str) -> str:
+        with self._lock:
+            self._md.reset()
+            return self._md.convert(text)
+
+    async def arender(self, text: str) -> str:
+        """
+        render() for the event loop: large uncached code blocks are highlighted in the
+        highlighter's worker pool first, so the render itself only hits the cache.
+        """
+        if self.highlighter is not None:
+            await self.highlighter.prewarm(text, self._md.tab_length)
+        return self.render(text)
+
+
+_default_renderer: Optional[MarkdownRenderer] = None
+
+
+def get_renderer() -> MarkdownRenderer:
+    """
+    Process-wide renderer with the chat extensions (extra, codehilite, nl2br).
+    """
+    global _default_renderer
+    if _default_renderer is None:
+        _default_renderer = MarkdownRenderer()
+    return _default_renderer
+
+
+class RenderUpdate(NamedTuple):
+    committed: str  # HTML of blocks finished by this feed (append it once)
+    tail: str       # HTML of the open block (replaces the previous tail)
+
+
+class IncrementalMarkdown:
+    """
+    Streaming renderer: feed() text chunks, get back newly committed HTML plus a
+    preview of the open tail; close() returns the complete document HTML.
+    """
+    def __init__(self, renderer: Optional[MarkdownRenderer] = None):
+        self.renderer = renderer or get_renderer()
+        self._committed: List[str] = []
+        self._committed_text: List[str] = []
+        self._buffer = ""        # text of the uncommitted blocks
+        self._scan = 0           # start of the first line in _buffer not yet scanned
+        self._fence = None       # closing marker of an open code fence
+        self._fence_at_top = False
+        self._block_lines = 0    # lines scanned in the current block
+        self._block_is_list = False
+        self._blank_at = -1      # start of the line after a blank line (candidate boundary)
+
+    @property
+    def html(self) -> str:
+        """
+        HTML of the committed blocks (without the open tail).
+        """
+        return "\n".join(self._committed)
+
+    def feed(self, chunk: str, render_tail: bool = True) -> RenderUpdate:
+        self._buffer += chunk
+        before = len(self._committed)
+        self._scan_lines()
+        committed = "\n".join(self._committed[before:])
+        tail = self.renderer.render(self._buffer) if render_tail and self._buffer.strip() else ""
+        return RenderUpdate(committed, tail)
+
+    def close(self) -> str:
+        full_text = "".join(self._committed_text) + self._buffer
+        if REFERENCE_DEF_RE.search(full_text):
+            return self.renderer.render(full_text)
+        if self._buffer.strip():
+            self._commit(len(self._buffer))
+        return self.html
+
+    def _commit(self, end: int):
+        text = self._buffer[:end]
+        self._buffer = self._buffer[end:]
+        self._scan -= end
+        if text.strip():
+            self._committed.append(self.renderer.render(text))
+            self._committed_text.append(text)
+        self._block_lines = 0
+        self._block_is_list = False
+        self._blank_at = -1
+
+    def _scan_lines(self):
+        while True:
+            end = self._buffer.find("\n", self._scan)
+            if end < 0:
+                return
+            start, self._scan = self._scan, end + 1
+            line = self._buffer[start:end]
+            if self._fence is not None:
+                stripped = line.strip()
+                if stripped.startswith(self._fence) and stripped.strip(self._fence[0]) == "":
+                    self._fence = None
+                    if self._fence_at_top:
+                        self._commit(self._scan)
+                continue
+            if not line.strip():
+                if self._block_lines:
+                    self._blank_at = self._scan
+                continue
+            if self._blank_at >= 0:
+                continuation = line[:1] in (" ", "\t") or (self._block_is_list and LIST_ITEM_RE.match(line))
+                if continuation:
+                    self._blank_at = -1
+                else:
+                    self._commit(self._blank_at)
+            fence = FENCE_RE.match(line)
+            if fence:
+                self._fence = fence.group(1)
+                self._fence_at_top = line[:1] != " " or not self._block_is_list
+            if self._block_lines == 0:
+                self._block_is_list = bool(LIST_ITEM_RE.match(line))
+            self._block_lines += 1
+
@@ -1,7 +1,79 @@
+import re
+import unicodedata
+from typing import Optional, Tuple
+
+ELLIPSIS = "..."
+FENCE_LINE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})(.*)$", re.MULTILINE)
+# Characters that attach to the previous one: cutting before them splits a grapheme
+JOINERS = {"\u200d", "\ufe0e", "\ufe0f"}
+
+
+def safe_cut(text: str, cut: int, floor: int = 0) -> int:
+    """
+    Move a cut position back so it does not split a grapheme (combining marks, ZWJ
+    sequences, variation selectors, emoji modifiers, surrogate pairs) or a CRLF.
+    Never goes below floor.
+    """
+    while cut > floor and cut < len(text):
+        ch, prev = text[cut], text[cut - 1]
+        if (unicodedata.combining(ch) or ch in JOINERS or prev in JOINERS
+                or "\U0001f3fb" <= ch <= "\U0001f3ff" or "\udc00" <= ch <= "\udfff"
+                or (prev == "\r" and ch == "\n")):
+            cut -= 1
+        else:
+            break
+    return cut
+
+
+def open_fence(text: str, end: int) -> Optional[Tuple[int, str]]:
+    """
+    If position end is inside a fenced code block, return (start of the opening fence
+    line, fence marker); otherwise None.
+    """
+    current = None
+    for m in FENCE_LINE_RE.finditer(text, 0, end):
+        marker, rest = m.group(1), m.group(2)
+        if current is None:
+            current = (m.start(), marker)
+        elif marker[0] == current[1][0] and len(marker) >= len(current[1]) and not rest.strip():
+            current = None
+    return current
+
+
+def truncate_markdown(text: str, max_length: int = 2048, ellipsis: str = ELLIPSIS, min_cut: int = 0) -> str:
+    """
+    Truncate markdown to about max_length characters (plus the ellipsis) without
+    splitting a grapheme or leaving a code fence open: a cut inside a fenced block
+    ends at a line boundary and the fence is closed. min_cut is the length of a
+    prefix that must be kept (already streamed to the client).
+    """
+    if len(text) <= max_length:
+        return text
+    cut = max(safe_cut(text, max_length, min_cut), min_cut)
+    fence = open_fence(text, cut)
+    if fence is None:
+        return text[:cut] + ellipsis
+    fence_start, marker = fence
+    # Leave room for the closing fence, and end on a line boundary inside the block
+    limit = max(max_length - len(marker) - 1, min_cut)
+    line_end = text.rfind("\n", fence_start, limit) + 1
+    opening_end = text.find("\n", fence_start) + 1
+    if line_end > opening_end:
+        cut = max(line_end, min_cut)
+    elif fence_start >= min_cut:
+        # Not even one line of code fits: drop the block
+        return text[:fence_start] + ellipsis
+    else:
+        cut = max(safe_cut(text, limit, min_cut), min_cut)
+    body = text[:cut]
+    if not body.endswith("\n"):
+        body += "\n"
+    return f"{body}{marker}\n{ellipsis}"
+
+
 def truncate_response(text: str, max_length: int = 2048) -> str:
     """
     Truncates the response to a maximum length (in characters).
+    Code fences are closed and graphemes are kept whole (see truncate_markdown).
     """
-    if len(text) > max_length:
-        return text[:max_length] + "..."
-    return text
+    return truncate_markdown(text, max_length)
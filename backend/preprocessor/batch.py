@@ -0,0 +1,240 @@
+"""
+Bulk message screening for moderation backfills.
+
+screen_chunk() runs the same checks as the chat endpoint (sanitize, single-pass
+screening, length) over a list of texts and returns per-message verdict arrays:
+
+    {"profanity": [False, True, ...], "prompt_injection": [...], "sql_injection": [...],
+     "too_long": [...], "flagged": [...]}
+
+BatchScreener splits an iterable (a list, a generator, a Mongo cursor) into chunks
+and screens them on a process pool. The screening engine is compiled once in the
+parent and shipped to each worker when it starts, so large blocklists are not
+rebuilt per worker or per chunk. Results come back in input order, with a bounded
+number of chunks in flight so arbitrarily long streams run in constant memory.
+
+CLI (streams a JSONL file or the conversations collection, reports throughput):
+
+    python -m backend.preprocessor.batch --jsonl messages.jsonl [--field text]
+    python -m backend.preprocessor.batch --mongo [--limit 100000] --processes 8
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .core import ScreeningEngine, get_screening_engine, sanitize_input, validate_length
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# Engine used by screen_chunk inside pool workers (set by the pool initializer).
+_worker_engine: Optional[ScreeningEngine] = None
+
+
+def _init_worker(engine: ScreeningEngine):
+    global _worker_engine
+    _worker_engine = engine
+
+
+def screen_chunk(texts: List[str], engine: Optional[ScreeningEngine] = None, sanitize: bool = True,
+                 max_length: int = 500) -> Dict[str, List[bool]]:
+    """
+    Screen a list of texts. Returns one boolean list per rule category plus
+    "too_long" and "flagged" (any category matched or too long).
+    """
+    engine = engine or _worker_engine or get_screening_engine()
+    verdicts = {c: [False] * len(texts) for c in engine.categories}
+    too_long = [False] * len(texts)
+    flagged = [False] * len(texts)
+    for i, text in enumerate(texts):
+        if not isinstance(text, str):
+            text = ""
+        if sanitize:
+            text = sanitize_input(text)
+        for category in engine.screen(text):
+            verdicts[category][i] = True
+            flagged[i] = True
+        if not validate_length(text, max_length):
+            too_long[i] = True
+            flagged[i] = True
+    verdicts["too_long"] = too_long
+    verdicts["flagged"] = flagged
+    return verdicts
+
+
+class BatchScreener:
+    """
+    Screen large streams of texts in chunks on a process pool.
+    processes=0 screens in the calling process (useful for small jobs and tests);
+    None uses one worker per CPU.
+    """
+    def __init__(self, engine: Optional[ScreeningEngine] = None, processes: Optional[int] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, sanitize: bool = True, max_length: int = 500):
+        self.engine = engine or get_screening_engine()
+        self.chunk_size = chunk_size
+        self.sanitize = sanitize
+        self.max_length = max_length
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self._pool = None
+        if self.processes > 0:
+            self._pool = ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                             initargs=(self.engine,))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def iter_chunks(self, items: Iterable, text: Optional[Callable] = None) -> Iterator[Tuple[list, Dict[str, List[bool]]]]:
+        """
+        Yield (items_chunk, verdicts) in input order. `text` extracts the message
+        text from an item (default: the item itself).
+        """
+        it = iter(items)
+        if self._pool is None:
+            while True:
+                chunk = list(itertools.islice(it, self.chunk_size))
+                if not chunk:
+                    return
+                texts = [text(item) for item in chunk] if text else chunk
+                yield chunk, screen_chunk(texts, self.engine, self.sanitize, self.max_length)
+        pending = deque()
+        max_pending = self.processes * 2
+        while True:
+            while len(pending) < max_pending:
+                chunk = list(itertools.islice(it, self.chunk_size))
+                if not chunk:
+                    break
+                texts = [text(item) for item in chunk] if text else chunk
+                # engine=None: workers use the engine they were initialised with
+                pending.append((chunk, self._pool.submit(screen_chunk, texts, None, self.sanitize, self.max_length)))
+            if not pending:
+                return
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+
+    def screen(self, texts: Iterable[str]) -> Dict[str, List[bool]]:
+        """
+        Screen every text and return the concatenated verdict arrays.
+        """
+        result: Dict[str, List[bool]] = {c: [] for c in self.engine.categories + ["too_long", "flagged"]}
+        for _, verdicts in self.iter_chunks(texts):
+            for key, values in verdicts.items():
+                result[key].extend(values)
+        return result
+
+
+def screen_batch(texts: Iterable[str], processes: Optional[int] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, List[bool]]:
+    """
+    Convenience wrapper: screen texts with a temporary BatchScreener.
+    """
+    with BatchScreener(processes=processes, chunk_size=chunk_size) as screener:
+        return screener.screen(texts)
+
+
+def iter_jsonl(path: str, field: str) -> Iterator[dict]:
+    """
+    Records from a JSONL file ('-' for stdin). Plain JSON strings become {"text": ...}.
+    """
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for n, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {field: record}
+            record.setdefault("line", n + 1)
+            yield record
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def iter_mongo_messages(uri: str, collection: str = "conversations", limit: int = 0) -> Iterator[dict]:
+    """
+    Stream every stored message from the conversations collection without loading it all.
+    """
+    from pymongo import MongoClient
+
+    client = MongoClient(uri)
+    try:
+        cursor = client.get_database()[collection].find({}, {"user_id": 1, "messages.text": 1}).batch_size(1000)
+        count = 0
+        for convo in cursor:
+            for index, message in enumerate(convo.get("messages", [])):
+                yield {"conversation_id": str(convo["_id"]), "user_id": convo.get("user_id"),
+                       "index": index, "text": message.get("text", "")}
+                count += 1
+                if limit and count >= limit:
+                    return
+    finally:
+        client.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Re-screen stored messages in bulk.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--jsonl", help="JSONL file of messages ('-' for stdin)")
+    source.add_argument("--mongo", action="store_true", help="stream messages from MongoDB (MONGODB_URI)")
+    parser.add_argument("--field", default="text", help="text field in JSONL records")
+    parser.add_argument("--collection", default="conversations")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many messages (0 = all)")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (0 = in-process)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--output", default="-", help="where to write verdicts as JSONL ('-' for stdout)")
+    parser.add_argument("--all", action="store_true", help="write a verdict for every message, not only flagged ones")
+    args = parser.parse_args(argv)
+
+    if args.mongo:
+        uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017/llmchatbot")
+        records = iter_mongo_messages(uri, args.collection, args.limit)
+    else:
+        records = iter_jsonl(args.jsonl, args.field)
+        if args.limit:
+            records = itertools.islice(records, args.limit)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    total = 0
+    counts: Dict[str, int] = {}
+    start = last_report = time.perf_counter()
+    try:
+        with BatchScreener(processes=args.processes, chunk_size=args.chunk_size) as screener:
+            for chunk, verdicts in screener.iter_chunks(records, text=lambda r: r.get(args.field, "")):
+                for i, record in enumerate(chunk):
+                    hits = [key for key, values in verdicts.items() if key != "flagged" and values[i]]
+                    for key in hits:
+                        counts[key] = counts.get(key, 0) + 1
+                    if hits or args.all:
+                        record = {k: v for k, v in record.items() if k != args.field}
+                        out.write(json.dumps({**record, "flags": hits}) + "\n")
+                total += len(chunk)
+                now = time.perf_counter()
+                if now - last_report >= 5:
+                    print(f"{total} messages, {total / (now - start):.0f} msg/s", file=sys.stderr)
+                    last_report = now
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed > 0 else 0.0
+    summary = ", ".join(f"{k}={v}" for k, v in sorted(counts.items())) or "nothing flagged"
+    print(f"Screened {total} messages in {elapsed:.2f}s ({rate:.0f} msg/s): {summary}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""
+Large-scale blocklist matching (profanity and other banned terms/phrases).
+
+Text and terms go through the same normalization before matching:
+- Unicode NFKD, accents stripped, casefolded ("Bádword" -> "badword")
+- leetspeak digits/symbols mapped to letters ("b4dw0rd", "b@dword")
+- separators inside words dropped ("b.a.d-w_o_r_d") and spaced-out letters joined ("b a d w o r d")
+- repeated letters collapsed ("baaadwooord"); the run lengths are kept so a term
+  with a double letter still needs at least that many in the text ("as" is not "ass")
+
+Matching uses an Aho-Corasick automaton stored in flat arrays (CSR layout over a
+BFS-numbered trie), so memory is a few bytes per trie node and scanning is linear
+in the text length no matter how many terms are loaded. A match only counts when it
+starts and ends on a word boundary, which keeps "class" from matching "ass", and when
+the matched text has at least one letter, so plain numbers ("455", an order number)
+are never read as leetspeak.
+"""
+import unicodedata
+from array import array
+from functools import lru_cache
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+# Leetspeak substitutions. Digits always map (but a match needs a letter, see find_all);
+# symbols only map inside a word (so the "!" in "badword!" stays punctuation).
+LEET_DIGITS = {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "9": "g"}
+LEET_SYMBOLS = {"@": "a", "$": "s", "!": "i", "|": "i", "+": "t", "(": "c", "€": "e"}
+
+# Resolved automaton moves memoised per Blocklist (bounded; text usually revisits few states).
+TRANSITION_CACHE_SIZE = 1 << 16
+
+# Characters never treated as content (zero-width joiners, soft hyphen, BOM).
+INVISIBLE = {"​", "‌", "‍", "⁠", "­", "﻿"}
+
+
+class BlocklistMatch(NamedTuple):
+    term: str
+    start: int  # offsets into the original text
+    end: int
+
+
+class Normalized(NamedTuple):
+    text: str
+    starts: List[int]       # original index of the first character of each normalized char's run
+    ends: List[int]         # original index just past the last character of the run
+    boundaries: List[bool]  # a word boundary precedes this char
+    runs: List[int]         # how many repeated characters were collapsed into this one
+
+
+# Character classes for normalize(), cached per distinct character.
+_SKIP, _SPACE, _LEET_SYMBOL, _ALNUM, _MIXED = range(5)
+
+
+@lru_cache(maxsize=4096)
+def _classify(ch: str) -> Tuple[int, str]:
+    """
+    (class, folded) for one input character. _ALNUM carries the folded letters/digits
+    ("" for punctuation); _MIXED is a fold that mixes both (e.g. fractions).
+    """
+    if ch in INVISIBLE:
+        return _SKIP, ""
+    if ch.isspace():
+        return _SPACE, " "
+    if ch in LEET_DIGITS:
+        return _ALNUM, LEET_DIGITS[ch]
+    if ch in LEET_SYMBOLS:
+        return _LEET_SYMBOL, LEET_SYMBOLS[ch]
+    decomposed = unicodedata.normalize("NFKD", ch)
+    folded = "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    alnum = "".join(c for c in folded if c.isalnum())
+    if alnum and alnum != folded:
+        return _MIXED, folded
+    return _ALNUM, alnum
+
+
+def normalize(text: str) -> Normalized:
+    """
+    Normalize text for matching, keeping the mapping back to the original offsets.
+    """
+    chars: List[str] = []
+    starts: List[int] = []
+    ends: List[int] = []
+    boundaries: List[bool] = []
+    runs: List[int] = []
+    boundary = True
+    n = len(text)
+    for i, raw in enumerate(text):
+        kind, folded = _classify(raw)
+        if kind == _ALNUM:
+            if not folded:
+                # Punctuation/separators are dropped but remembered as a boundary
+                boundary = True
+                continue
+        elif kind == _SPACE:
+            if chars and chars[-1] != " ":
+                chars.append(" ")
+                starts.append(i)
+                ends.append(i + 1)
+                boundaries.append(False)
+                runs.append(1)
+            boundary = True
+            continue
+        elif kind == _SKIP:
+            continue
+        elif kind == _LEET_SYMBOL:
+            # Only inside a word: the "!" in "badword!" stays punctuation
+            if not (chars and chars[-1] != " " and i + 1 < n and text[i + 1].isalnum()):
+                boundary = True
+                continue
+        for ch in folded:
+            if not ch.isalnum():
+                boundary = True
+            elif chars and chars[-1] == ch and not boundary:
+                # Repeated letter: collapse, but remember how many there were
+                runs[-1] += 1
+                ends[-1] = i + 1
+            else:
+                chars.append(ch)
+                starts.append(i)
+                ends.append(i + 1)
+                boundaries.append(boundary)
+                runs.append(1)
+                boundary = False
+    if chars and chars[-1] == " ":
+        for values in (chars, starts, ends, boundaries, runs):
+            values.pop()
+    return _join_spaced_letters(Normalized("".join(chars), starts, ends, boundaries, runs))
+
+
+def _join_spaced_letters(norm: Normalized) -> Normalized:
+    """
+    Remove the spaces in runs of three or more single-letter words ("b a d" -> "bad").
+    """
+    chars = norm.text
+    if " " not in chars:
+        return norm
+    drop = set()
+    run: List[int] = []  # indices of spaces inside the current run of single letters
+    letters = 0
+    i = 0
+    n = len(chars)
+    while i < n:
+        single = chars[i] != " " and (i + 1 == n or chars[i + 1] == " ") and (i == 0 or chars[i - 1] == " ")
+        if single:
+            letters += 1
+            if i + 1 < n:
+                run.append(i + 1)
+            i += 2
+            continue
+        if letters >= 3:
+            drop.update(run[:letters - 1])
+        run, letters = [], 0
+        while i < n and chars[i] != " ":
+            i += 1
+        i += 1
+    if letters >= 3:
+        drop.update(run[:letters - 1])
+    if not drop:
+        return norm
+    keep = [i for i in range(n) if i not in drop]
+    return Normalized("".join(chars[i] for i in keep), *([values[i] for i in keep] for values in norm[1:]))
+
+
+class Blocklist:
+    """
+    Aho-Corasick automaton over normalized terms.
+
+    Layout: states are numbered in BFS order, so the outgoing edges of state s are
+    edge_start[s]..edge_start[s+1] (sorted by label) and edge e always leads to state e + 1.
+    """
+    def __init__(self, terms: Iterable[str]):
+        normalized = {}
+        for term in terms:
+            norm = normalize(term)
+            if norm.text:
+                # Same collapsed form with different run lengths: keep the least strict one
+                key = norm.text
+                if key not in normalized or sum(norm.runs) < sum(normalized[key][1]):
+                    normalized[key] = (term, norm.runs)
+        self.terms = [term for term, _ in normalized.values()]
+        self.term_runs_offset = array("I", [0])
+        self.term_runs = array("B")
+        for _, runs in normalized.values():
+            self.term_runs.extend(min(r, 255) for r in runs)
+            self.term_runs_offset.append(len(self.term_runs))
+        self._build(list(normalized.keys()))
+        # Memo of resolved (state, char) -> state moves, so hot paths skip the fail-link walk
+        self._transitions: Dict[int, int] = {}
+
+    @classmethod
+    def from_file(cls, path: str, extra_terms: Iterable[str] = ()) -> "Blocklist":
+        """
+        Load one term or phrase per line; blank lines and lines starting with '#' are ignored.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            terms = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        return cls(list(extra_terms) + terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Size of the automaton arrays (excluding the original term strings).
+        """
+        arrays = (self.edge_start, self.edge_label, self.term_index, self.term_length,
+                  self.fail, self.out_link, self.term_runs, self.term_runs_offset)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    def _build(self, keys: List[str]):
+        # Temporary dict trie, then frozen into BFS-ordered arrays.
+        children = [{}]
+        term_at = [-1]
+        for index, key in enumerate(keys):
+            node = 0
+            for ch in key:
+                nxt = children[node].get(ch)
+                if nxt is None:
+                    nxt = len(children)
+                    children[node][ch] = nxt
+                    children.append({})
+                    term_at.append(-1)
+                node = nxt
+            term_at[node] = index
+
+        order = [0]
+        new_id = {0: 0}
+        edge_start = array("I", [0])
+        edge_label = array("I")
+        queue = deque([0])
+        while queue:
+            node = queue.popleft()
+            for ch in sorted(children[node]):
+                child = children[node][ch]
+                new_id[child] = len(order)
+                order.append(child)
+                edge_label.append(ord(ch))
+                queue.append(child)
+            edge_start.append(len(edge_label))
+        self.edge_start = edge_start
+        self.edge_label = edge_label
+        self.term_index = array("i", (term_at[old] for old in order))
+        self.term_length = array("I", (len(k) for k in keys))
+        del children
+
+        count = len(order)
+        self.fail = array("I", bytes(4 * count))
+        self.out_link = array("i", [-1]) * count
+        # BFS over the frozen trie: fail links and dictionary (output) links
+        queue = deque(range(self.edge_start[0] + 1, self.edge_start[1] + 1))
+        while queue:
+            state = queue.popleft()
+            for edge in range(self.edge_start[state], self.edge_start[state + 1]):
+                child = edge + 1
+                queue.append(child)
+                fallback = self._goto(self.fail[state], self.edge_label[edge])
+                self.fail[child] = fallback
+                self.out_link[child] = fallback if self.term_index[fallback] >= 0 else self.out_link[fallback]
+
+    def _child(self, state: int, label: int) -> int:
+        lo, hi = self.edge_start[state], self.edge_start[state + 1]
+        if lo == hi:
+            return -1
+        i = bisect_left(self.edge_label, label, lo, hi)
+        if i < hi and self.edge_label[i] == label:
+            return i + 1
+        return -1
+
+    def _goto(self, state: int, label: int) -> int:
+        while True:
+            child = self._child(state, label)
+            if child >= 0:
+                return child
+            if state == 0:
+                return 0
+            state = self.fail[state]
+
+    def find_all(self, text: str) -> List[BlocklistMatch]:
+        """
+        Return every blocklisted term in text that sits on word boundaries.
+        """
+        if not text or not self.terms:
+            return []
+        normalized = normalize(text)
+        norm, boundaries, runs = normalized.text, normalized.boundaries, normalized.runs
+        n = len(norm)
+        matches = []
+        state = 0
+        transitions = self._transitions
+        term_index = self.term_index
+        out_link = self.out_link
+        for i, ch in enumerate(norm):
+            key = state * 0x110000 + ord(ch)
+            nxt = transitions.get(key)
+            if nxt is None:
+                nxt = self._goto(state, ord(ch))
+                if len(transitions) < TRANSITION_CACHE_SIZE:
+                    transitions[key] = nxt
+            state = nxt
+            hit = state if term_index[state] >= 0 else out_link[state]
+            while hit >= 0:
+                index = term_index[hit]
+                start = i - self.term_length[index] + 1
+                end_ok = i + 1 == n or norm[i + 1] == " " or boundaries[i + 1]
+                start_ok = start == 0 or norm[start - 1] == " " or boundaries[start]
+                if start_ok and end_ok and self._runs_ok(index, runs, start):
+                    begin, end = normalized.starts[start], normalized.ends[i]
+                    # Digits alone are a number, not leetspeak ("455" is not "ass")
+                    if any(c.isalpha() for c in text[begin:end]):
+                        matches.append(BlocklistMatch(self.terms[index], begin, end))
+                hit = out_link[hit]
+        return matches
+
+    def _runs_ok(self, index: int, runs: List[int], start: int) -> bool:
+        # Every repeated letter in the term must be repeated at least as often in the text
+        lo, hi = self.term_runs_offset[index], self.term_runs_offset[index + 1]
+        for k in range(hi - lo):
+            if runs[start + k] < self.term_runs[lo + k]:
+                return False
+        return True
+
+    def contains(self, text: str) -> bool:
+        return bool(self.find_all(text))
@@ -1,5 +1,10 @@
+import os
 import re
-from html import unescape
+import json
+from typing import Dict, List, NamedTuple, Optional
+
+from .blocklist import Blocklist
+from .sanitizer import sanitize_html
 
 # Basic profanity list (expand as needed)
 PROFANITY = {"badword", "anotherbadword", "testword"}
@@ -15,28 +20,212 @@ PROMPT_INJECTION_PATTERNS = [
 ]
 
 SQL_PATTERNS = [
-    r"(;|\b)(drop|select|insert|delete|update|alter|create|truncate|exec|union|--|#|\bOR\b|\bAND\b)\b"
+    r"(;|\b)(drop|select|insert|delete|update|alter|create|truncate|exec|union|--|#)\b"
 ]
 
-SCRIPT_TAG_RE = re.compile(r"<script.*?>.*?</script>", re.IGNORECASE | re.DOTALL)
-HTML_TAG_RE = re.compile(r"<.*?>", re.DOTALL)
-
+# Screening rule sets, in priority order. "patterns" are regexes matched anywhere against
+# lowercased text, so they are case-insensitive: their letters are lowercased when they
+# are compiled (escapes such as \S or \D are kept as written). "words" (and "words_file",
+# one term or phrase per line) are blocklist terms: matched as whole words on normalized
+# text, so leetspeak, accents, repeated letters and inserted separators are caught (see
+# blocklist.py).
+# Override or extend per category with a JSON file of the same shape (SCREENING_RULES_PATH);
+# BLOCKLIST_PATH adds a term file to the profanity category.
+DEFAULT_SCREENING_RULES = {
+    "profanity": {"words": sorted(PROFANITY)},
+    "prompt_injection": {"patterns": PROMPT_INJECTION_PATTERNS},
+    "sql_injection": {"patterns": SQL_PATTERNS},
+}
 
 def sanitize_input(text: str) -> str:
-    text = unescape(text)
-    text = SCRIPT_TAG_RE.sub("", text)
-    text = HTML_TAG_RE.sub("", text)
-    return text.strip()
+    """
+    Decode HTML entities (including double-encoded ones) and strip tags, script/style
+    elements and comments in one linear pass. See sanitizer.py.
+    """
+    return sanitize_html(text).strip()
+
+class ScreenMatch(NamedTuple):
+    category: str
+    start: int
+    end: int
+    text: str
+
+
+def _trie_regex(literals: List[str]) -> str:
+    """
+    Compile literal strings into one regex that shares common prefixes
+    (e.g. ["act as", "acting"] -> "act(?:\\ as|ing)"), so matching cost grows
+    with the input length rather than with the number of entries.
+    """
+    trie: dict = {}
+    for lit in literals:
+        node = trie
+        for ch in lit:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        terminal = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            body = "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+REGEX_META_RE = re.compile(r"[.^$*+?{}\[\]\\|()]")
+# An escape (kept as written: lowercasing \S or \D would change its meaning) or a run of other text
+REGEX_ESCAPE_RE = re.compile(r"(\\.)|[^\\]+", re.DOTALL)
+
+
+def _lowercase_regex(pattern: str) -> str:
+    """
+    The pattern with its letters lowercased, for matching lowercased text: cheaper than
+    re.IGNORECASE on every scan.
+    """
+    return "".join(m.group() if m.group(1) else m.group().lower() for m in REGEX_ESCAPE_RE.finditer(pattern))
+
+
+def _category_regex(rules: dict) -> str:
+    patterns = rules.get("patterns", [])
+    literals = [p.lower() for p in patterns if not REGEX_META_RE.search(p)]
+    regexes = [_lowercase_regex(p) for p in patterns if REGEX_META_RE.search(p)]
+    parts = []
+    if literals:
+        parts.append(_trie_regex(literals))
+    parts.extend(f"(?:{p})" for p in regexes)
+    return "|".join(parts)
+
+
+def _category_blocklist(rules: dict) -> Optional[Blocklist]:
+    words = list(rules.get("words", []))
+    path = rules.get("words_file")
+    if path:
+        return Blocklist.from_file(path, extra_terms=words)
+    return Blocklist(words) if words else None
+
+
+class ScreeningEngine:
+    """
+    Compiles every screening rule set into a single alternation with one named group
+    per category, so a message is lowercased once and scanned once.
+    Literal entries are folded into prefix tries, which keeps the hot path flat as
+    rule lists grow into the thousands. Word lists are compiled into one blocklist
+    automaton per category, which scans in linear time whatever the list size.
+    Regex matches are leftmost and non-overlapping; when two categories match at the
+    same offset the one listed first in the rules wins.
+    """
+    def __init__(self, rules: Dict[str, dict]):
+        self.categories = [c for c, r in rules.items() if r.get("words") or r.get("words_file") or r.get("patterns")]
+        self.blocklists = {}
+        self.category_res = {}
+        for c in self.categories:
+            blocklist = _category_blocklist(rules[c])
+            if blocklist is not None:
+                self.blocklists[c] = blocklist
+            if rules[c].get("patterns"):
+                self.category_res[c] = re.compile(_category_regex(rules[c]))
+        self.combined_re = re.compile(
+            "|".join(f"(?P<{c}>{regex.pattern})" for c, regex in self.category_res.items())
+        ) if self.category_res else None
+
+    def scan(self, text: str) -> List[ScreenMatch]:
+        """
+        Return every rule match in text with its category and offsets, ordered by position.
+        """
+        if not text:
+            return []
+        found = []
+        for category, blocklist in self.blocklists.items():
+            found.extend(ScreenMatch(category, m.start, m.end, text[m.start:m.end]) for m in blocklist.find_all(text))
+        if self.combined_re is not None:
+            lowered = text.lower()
+            found.extend(ScreenMatch(m.lastgroup, m.start(), m.end(), m.group()) for m in self.combined_re.finditer(lowered))
+        rank = {c: i for i, c in enumerate(self.categories)}
+        found.sort(key=lambda m: (m.start, rank[m.category]))
+        return found
+
+    def screen(self, text: str) -> List[str]:
+        """
+        Return the matched categories, in rule priority order.
+        """
+        found = {m.category for m in self.scan(text)}
+        return [c for c in self.categories if c in found]
+
+    def matches(self, category: str, text: str) -> bool:
+        if not text:
+            return False
+        blocklist = self.blocklists.get(category)
+        if blocklist is not None and blocklist.contains(text):
+            return True
+        regex = self.category_res.get(category)
+        return regex is not None and regex.search(text.lower()) is not None
+
+
+def load_screening_rules(path: str) -> Dict[str, dict]:
+    """
+    Load rule overrides from a JSON file shaped like DEFAULT_SCREENING_RULES.
+    Categories in the file replace the defaults; new categories are appended.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        overrides = json.load(f)
+    rules = {c: dict(r) for c, r in DEFAULT_SCREENING_RULES.items()}
+    for category, entry in overrides.items():
+        if not isinstance(entry, dict):
+            raise ValueError(f"Screening rules for {category} must be an object with 'words' or 'patterns'")
+        rules[category] = entry
+    return rules
+
+
+def configured_screening_rules() -> Dict[str, dict]:
+    """
+    Rules from SCREENING_RULES_PATH (if set) or the defaults, plus the BLOCKLIST_PATH term file.
+    """
+    path = os.getenv("SCREENING_RULES_PATH")
+    rules = load_screening_rules(path) if path else {c: dict(r) for c, r in DEFAULT_SCREENING_RULES.items()}
+    blocklist_path = os.getenv("BLOCKLIST_PATH")
+    if blocklist_path:
+        rules.setdefault("profanity", {})["words_file"] = blocklist_path
+    return rules
+
+
+_engine: Optional[ScreeningEngine] = None
+
+
+def get_screening_engine() -> ScreeningEngine:
+    """
+    Shared engine, compiled on first use from configured_screening_rules().
+    """
+    global _engine
+    if _engine is None:
+        _engine = ScreeningEngine(configured_screening_rules())
+    return _engine
+
+
+def reload_screening_rules(rules: Optional[Dict[str, dict]] = None) -> ScreeningEngine:
+    """
+    Recompile the shared engine (from the given rules, or from config again).
+    """
+    global _engine
+    _engine = ScreeningEngine(rules) if rules is not None else None
+    return get_screening_engine()
+
+
+def screen_text(text: str) -> List[str]:
+    """
+    Single-pass screening: returns the rule categories matched by text, in priority order.
+    """
+    return get_screening_engine().screen(text)
 
 def contains_profanity(text: str) -> bool:
-    words = set(re.findall(r"\w+", text.lower()))
-    return not PROFANITY.isdisjoint(words)
+    return get_screening_engine().matches("profanity", text)
 
 def contains_prompt_injection(text: str) -> bool:
-    for pat in PROMPT_INJECTION_PATTERNS:
-        if re.search(pat, text, re.IGNORECASE):
-            return True
-    return False
+    return get_screening_engine().matches("prompt_injection", text)
 
 def contains_sql_injection(text: str) -> bool:
     """
@@ -52,13 +241,8 @@ def contains_sql_injection(text: str) -> bool:
     """
     if not isinstance(text, str) or not text:
         return False
-    # Lowercase for case-insensitive matching
-    text_lower = text.lower()
-    # Use configured SQL injection regex patterns
-    for pat in SQL_PATTERNS:
-        if re.search(pat, text_lower):
-            return True
-    return False
+    # Matched against lowercased text using the configured SQL injection patterns
+    return get_screening_engine().matches("sql_injection", text)
 
 def validate_length(text: str, max_length: int = 500) -> bool:
     return len(text) <= max_length
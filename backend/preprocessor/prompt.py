@@ -1,4 +1,10 @@
 import os
+import re
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Optional
+
+from ..providers.tokenizer import get_tokenizer
 
 TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "../templates")
 TEMPLATES = {
@@ -7,20 +13,46 @@ TEMPLATES = {
     "qa": "qa.txt",
     "report": "report.txt"
 }
+PLACEHOLDER = "{user_message}"
+_LAST_WORD = re.compile(r"\S*$")
 
-def build_prompt(user_message: str, query_type: str) -> str:
+@lru_cache(maxsize=None)
+def load_template(query_type: str) -> str:
     fname = TEMPLATES.get(query_type, "qa.txt")
     path = os.path.join(TEMPLATE_DIR, fname)
     with open(path, "r", encoding="utf-8") as f:
-        template = f.read()
-    return template.replace("{user_message}", user_message)
+        return f.read()
+
+def build_prompt(user_message: str, query_type: str) -> str:
+    return load_template(query_type).replace(PLACEHOLDER, user_message)
+
+def count_tokens(text: str, provider: Optional[str] = None) -> int:
+    # Counted with the provider's tokenizer (cached by text hash), see providers/tokenizer.py
+    return get_tokenizer(provider).count(text)
 
-def count_tokens(text: str) -> int:
-    # Simple token count: split by whitespace (for demo, not LLM-accurate)
-    return len(text.split())
+def trim_to_max_tokens(text: str, max_tokens: int, provider: Optional[str] = None) -> str:
+    return get_tokenizer(provider).truncate(text, max_tokens)
 
-def trim_to_max_tokens(text: str, max_tokens: int) -> str:
-    tokens = text.split()
-    if len(tokens) <= max_tokens:
-        return text
-    return " ".join(tokens[:max_tokens])
+def fit_to_budget(user_message: str, query_type: str, max_tokens: int, max_length: int,
+                  provider: Optional[str] = None) -> Optional[str]:
+    """
+    Longest prefix of user_message that is at most max_tokens tokens and keeps the framed
+    prompt within max_length characters. Tokenizes once. A message is only cut between
+    words, never inside one: returns None if not even its first word fits.
+    """
+    template = load_template(query_type)
+    slots = max(template.count(PLACEHOLDER), 1)
+    available = (max_length - (len(template) - template.count(PLACEHOLDER) * len(PLACEHOLDER))) // slots
+    ends = get_tokenizer(provider).offsets(user_message)
+    if not ends:
+        return user_message if available >= 0 else None
+    # Token end offsets are increasing: the budget is a binary search away
+    n = bisect_right(ends, available, 0, min(max_tokens, len(ends)))
+    if n == len(ends):
+        return user_message
+    cut = ends[n - 1] if n else 0
+    if not user_message[cut].isspace():
+        # The budget ends inside a word: drop that word rather than send a fragment of it
+        cut = _LAST_WORD.search(user_message, 0, cut).start()
+    trimmed = user_message[:cut].rstrip()
+    return trimmed or None
@@ -0,0 +1,222 @@
+"""
+Linear-time HTML sanitizer for user input.
+
+Two streaming stages, each touching every input character a bounded number of times:
+
+1. EntityDecoder decodes character references (&lt; &#60; &#x3c; and the legacy
+   no-semicolon forms). Decoded text is re-examined, so double-encoded markup
+   (&amp;lt;script&amp;gt;) decodes all the way to "<script>" instead of slipping
+   through as an entity a later consumer would decode. A decoded reference is
+   always shorter than its source, so the re-examination stays linear.
+2. HtmlSanitizer strips markup with a small state machine:
+   - tags (<...>) are removed; a "<" that is never closed is kept as text
+   - <script>/<style> elements are removed with their content (an unclosed one
+     drops everything after it)
+   - comments (<!-- ... -->) are removed
+
+Every scan is a forward str.find from the current position, so there is no
+backtracking and worst-case time is O(n) for any input, unlike the lazy DOTALL
+regexes this replaces. feed() can be called with chunks of a stream; output for
+text that may still turn out to be markup is held back until it is decided.
+"""
+from html import unescape
+from typing import List
+
+# Longest reference we try to decode ("&CounterClockwiseContourIntegral;" is 33 chars).
+ENTITY_MAX = 40
+ENTITY_NAME_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789#")
+
+# Elements whose content is dropped along with the tags.
+RAW_TEXT_TAGS = {"script", "style"}
+
+TEXT, TAG, RAW, RAW_CLOSE, COMMENT = range(5)
+
+
+class EntityDecoder:
+    """
+    Streaming HTML entity decoder. feed() returns decoded text that can no longer
+    change; a trailing partial reference is held until more input or close().
+    """
+    def __init__(self):
+        self._out: List[str] = []
+        self._amp = -1  # index in _out of an '&' that may start a reference
+
+    def feed(self, chunk: str) -> str:
+        if self._amp < 0 and "&" not in chunk:
+            return chunk
+        for ch in chunk:
+            self._push(ch)
+        return self._release()
+
+    def close(self) -> str:
+        if self._amp >= 0:
+            self._decode()
+        out = "".join(self._out)
+        self._out = []
+        return out
+
+    def _push(self, ch: str):
+        out = self._out
+        if self._amp >= 0:
+            if ch in ENTITY_NAME_CHARS and len(out) - self._amp < ENTITY_MAX:
+                out.append(ch)
+                return
+            if ch == ";":
+                out.append(ch)
+                self._decode()
+                return
+            # Reference ended without ';' (legacy form like "&lt") or got too long
+            self._decode()
+        if ch == "&":
+            self._amp = len(out)
+        out.append(ch)
+
+    def _decode(self):
+        out, amp = self._out, self._amp
+        self._amp = -1
+        token = "".join(out[amp:])
+        decoded = unescape(token)
+        if decoded == token:
+            return
+        del out[amp:]
+        # The decoded text may complete an earlier '&' ("&&#108;t;" -> "&lt;" -> "<")
+        for i in range(len(out) - 1, max(len(out) - ENTITY_MAX, -1), -1):
+            if out[i] == "&":
+                self._amp = i
+                break
+            if out[i] not in ENTITY_NAME_CHARS:
+                break
+        for ch in decoded:
+            self._push(ch)
+
+    def _release(self) -> str:
+        out = self._out
+        if self._amp < 0:
+            self._out = []
+            return "".join(out)
+        # Hold back the pending reference and anything a decode could still join onto
+        keep = self._amp
+        while keep > 0 and self._amp - keep < ENTITY_MAX and (out[keep - 1] in ENTITY_NAME_CHARS or out[keep - 1] == "&"):
+            keep -= 1
+        self._out = out[keep:]
+        self._amp -= keep
+        return "".join(out[:keep])
+
+
+class HtmlSanitizer:
+    """
+    Streaming markup stripper over entity-decoded text. Use feed() for each chunk
+    and close() at the end; or sanitize_html() for a whole string.
+    """
+    def __init__(self):
+        self._decoder = EntityDecoder()
+        self._state = TEXT
+        self._tag: List[str] = []  # text of the tag being read, starting with '<'
+        self._raw_name = ""        # element whose closing tag ends RAW
+        self._carry = ""           # undecided tail of the previous chunk (RAW/COMMENT)
+
+    def feed(self, chunk: str) -> str:
+        return self._strip(self._decoder.feed(chunk))
+
+    def close(self) -> str:
+        out = self._strip(self._decoder.close())
+        if self._state == TAG:
+            # Never closed: it was a literal "<", keep the text
+            out += "".join(self._tag)
+        self._state, self._tag, self._carry = TEXT, [], ""
+        return out
+
+    def _strip(self, text: str) -> str:
+        out: List[str] = []
+        i, n = 0, len(text)
+        while i < n:
+            if self._state == TEXT:
+                j = text.find("<", i)
+                if j < 0:
+                    out.append(text[i:])
+                    break
+                out.append(text[i:j])
+                self._tag = ["<"]
+                self._state = TAG
+                i = j + 1
+            elif self._state == TAG:
+                j = text.find(">", i)
+                if j < 0:
+                    self._tag.append(text[i:])
+                    break
+                self._tag.append(text[i:j])
+                self._end_tag("".join(self._tag)[1:])
+                i = j + 1
+            elif self._state == RAW:
+                i = self._find_raw_end(text, i)
+            elif self._state == RAW_CLOSE:
+                j = text.find(">", i)
+                if j < 0:
+                    break
+                self._state = TEXT
+                i = j + 1
+            else:  # COMMENT
+                data = self._carry + text[i:]
+                j = data.find("-->")
+                if j < 0:
+                    self._carry = data[-2:]
+                    break
+                self._carry = ""
+                self._state = TEXT
+                i += j + 3 - (len(data) - (n - i))
+        return "".join(out)
+
+    def _end_tag(self, content: str):
+        """
+        Called at the '>' of a tag with the text between '<' and '>'.
+        """
+        self._tag = []
+        self._state = TEXT
+        if content.startswith("!--"):
+            if not content[3:].endswith("--"):
+                # The '>' was inside the comment; keep skipping to "-->"
+                self._state = COMMENT
+                self._carry = ""
+            return
+        body = content.lstrip()
+        if body.startswith("/"):
+            return
+        end = 0
+        while end < len(body) and (body[end].isalnum() or body[end] in "-:"):
+            end += 1
+        name = body[:end].lower()
+        if name in RAW_TEXT_TAGS and not content.rstrip().endswith("/"):
+            self._raw_name = name
+            self._state = RAW
+            self._carry = ""
+
+    def _find_raw_end(self, text: str, i: int) -> int:
+        """
+        Skip raw element content up to its closing tag; returns the next index to process.
+        """
+        data = self._carry + text[i:]
+        offset = i - len(self._carry)  # index in text of data[0]
+        self._carry = ""
+        close = "</" + self._raw_name
+        pos = 0
+        while True:
+            j = data.find("<", pos)
+            if j < 0:
+                return len(text)
+            candidate = data[j:j + len(close) + 1]
+            if len(candidate) <= len(close) and close.startswith(candidate.lower()):
+                # Could be the closing tag split across chunks
+                self._carry = data[j:]
+                return len(text)
+            if candidate[:len(close)].lower() == close and (candidate[-1] in "/>" or candidate[-1].isspace()):
+                self._state = RAW_CLOSE
+                return offset + j + len(close)
+            pos = j + 1
+
+
+def sanitize_html(text: str) -> str:
+    """
+    Decode entities and strip markup from text in a single linear pass.
+    """
+    sanitizer = HtmlSanitizer()
+    return sanitizer.feed(text) + sanitizer.close()
@@ -1,10 +1,34 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict, Optional, Union
+
+from .tokenizer import Tokenizer, get_tokenizer
+
+
+class ProviderError(Exception):
+    """
+    Error raised by a provider call. Carries the upstream HTTP status (if any)
+    so the orchestrator can decide whether the failure is worth retrying.
+    """
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
 
 class LLMProvider(ABC):
     """
     Abstract base class for all LLM providers.
     """
+    # Prices in USD per 1k tokens; providers override with their model's rates
+    input_cost_per_1k: float = 0.0
+    output_cost_per_1k: float = 0.0
+    # Socket timeouts (seconds) for providers calling an HTTP API: connecting, and the
+    # longest wait for data. The orchestrator sets request_timeout to its attempt_timeout,
+    # so a call it stops awaiting does not keep a worker thread blocked on the socket.
+    connect_timeout: float = 5.0
+    request_timeout: float = 30.0
+
     @abstractmethod
     def generate(self, prompt: str, **kwargs) -> str:
         """
@@ -18,3 +42,36 @@ class LLMProvider(ABC):
         Return the name of the provider.
         """
         pass
+
+    async def agenerate(self, prompt: str, **kwargs) -> str:
+        """
+        Async variant of generate. Providers with a native async client should
+        override this; the default runs the blocking call in a worker thread so
+        it never stalls the event loop.
+        """
+        return await asyncio.to_thread(self.generate, prompt, **kwargs)
+
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """
+        Stream the response as text chunks. Providers with a streaming API should
+        override this; the default yields the whole agenerate() result as one chunk.
+        """
+        yield await self.agenerate(prompt, **kwargs)
+
+    def tokenizer(self) -> Tokenizer:
+        """
+        Tokenizer for this provider's model (see providers/tokenizer.py).
+        """
+        return get_tokenizer(self.name())
+
+    def count_tokens(self, text: str) -> int:
+        return self.tokenizer().count(text)
+
+    def estimate_cost(self, prompt: Union[str, int], output: Union[str, int] = 0) -> float:
+        """
+        Cost of a call in USD from its prompt and output, given as text (counted with
+        this provider's tokenizer) or as token counts.
+        """
+        prompt_tokens = self.count_tokens(prompt) if isinstance(prompt, str) else prompt
+        output_tokens = self.count_tokens(output) if isinstance(output, str) else output
+        return (prompt_tokens * self.input_cost_per_1k + output_tokens * self.output_cost_per_1k) / 1000
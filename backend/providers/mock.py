@@ -1,20 +1,47 @@
 from .base import LLMProvider
+import asyncio
 import random
+from typing import AsyncIterator, Optional
 
 class MockLLMProvider(LLMProvider):
     """
     Mock provider for testing. Returns canned responses.
+
+    For benchmarks it can also simulate a provider's timing on the async calls:
+    `latency` seconds before the response (or the first streamed chunk), and astream()
+    yields the response in `chunk_size`-character chunks `chunk_delay` seconds apart.
+    `response` replaces the canned responses with a fixed text.
     """
-    def __init__(self):
+    def __init__(self, latency: float = 0.0, chunk_size: int = 0, chunk_delay: float = 0.0,
+                 response: Optional[str] = None):
         self.responses = [
             "This is a mock response.",
             "Hello from the mock LLM!",
             "Test response: everything is working.",
             "[MOCK] LLM output."
-        ]
+        ] if response is None else [response]
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
 
     def generate(self, prompt: str, **kwargs) -> str:
         return random.choice(self.responses)
 
+    async def agenerate(self, prompt: str, **kwargs) -> str:
+        # generate() is instant, so it runs on the loop instead of a worker thread
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.generate(prompt, **kwargs)
+
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        text = await self.agenerate(prompt, **kwargs)
+        if self.chunk_size <= 0:
+            yield text
+            return
+        for i in range(0, len(text), self.chunk_size):
+            if i and self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield text[i:i + self.chunk_size]
+
     def name(self) -> str:
         return "mock"
@@ -0,0 +1,168 @@
+"""
+Simulated LLM provider for load tests, streaming work and exercising the
+orchestrator's timeouts, retries and failover without calling a real model.
+
+Select it with LLM_PROVIDER=simulated (it can be combined with others for
+failover, e.g. "simulated,mock"). It is configured through environment variables:
+
+- SIM_TTFB_MS: time to the first token, as a distribution (default "lognormal:400,0.5")
+- SIM_TOKEN_MS: time between tokens (default "normal:25,8")
+- SIM_ERROR_RATE: share of calls failing with a 503 after the TTFB (default 0)
+- SIM_RATE_LIMIT_RATE: share of calls rejected at once with a 429 (default 0)
+- SIM_RETRY_AFTER: Retry-After of the simulated 429s, in seconds (default 1)
+- SIM_OUTPUT_RATIO: response tokens per prompt token (default 1.5, +/-50% per call)
+- SIM_MIN_TOKENS / SIM_MAX_TOKENS: bounds on the response length (default 16 / 1024)
+- SIM_SEED: makes runs reproducible; with the same seed and the same order of
+  calls, latencies, failures and texts are identical (default: unseeded)
+
+Distributions are "const:MS" (or just "MS"), "uniform:LO,HI", "normal:MEAN,SD",
+"lognormal:MEDIAN,SIGMA" or "exponential:MEAN", all in milliseconds.
+
+astream() yields the response token by token. When tokens are due faster than
+MIN_SLEEP apart, the ones already due are sent together, as real streaming APIs
+do, so thousands of concurrent streams do not turn into one timer per token.
+"""
+import asyncio
+import itertools
+import math
+import os
+import random
+import time
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from .base import LLMProvider, ProviderError
+
+Distribution = Callable[[random.Random], float]
+
+# Shortest sleep between streamed chunks (seconds)
+MIN_SLEEP = 0.005
+
+WORDS = ["the", "request", "is", "handled", "by", "a", "worker", "that", "reads", "from", "queue", "and",
+         "writes", "results", "to", "database", "each", "step", "can", "fail", "so", "we", "retry", "with",
+         "backoff", "this", "keeps", "latency", "low", "under", "load", "when", "cache", "hit", "rate",
+         "drops", "you", "should", "check", "index", "on", "user", "field", "response", "time", "improves"]
+
+
+def parse_distribution(spec) -> Distribution:
+    """
+    A sampler returning seconds from a spec in milliseconds (see module docstring).
+    """
+    spec = str(spec).strip()
+    kind, _, params = spec.partition(":") if ":" in spec else ("const", "", spec)
+    kind = kind.strip().lower()
+    try:
+        values = [float(v) for v in params.split(",")]
+    except ValueError:
+        raise ValueError(f"Invalid latency distribution: {spec!r}")
+    ms = 1000.0
+    if kind == "const" and len(values) == 1:
+        value = max(0.0, values[0] / ms)
+        return lambda rng: value
+    if kind == "uniform" and len(values) == 2:
+        low, high = values[0] / ms, values[1] / ms
+        return lambda rng: max(0.0, rng.uniform(low, high))
+    if kind == "normal" and len(values) == 2:
+        mean, sd = values[0] / ms, values[1] / ms
+        return lambda rng: max(0.0, rng.gauss(mean, sd))
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values[0] / ms, values[1]
+        return lambda rng: median * math.exp(rng.gauss(0.0, sigma))
+    if kind == "exponential" and len(values) == 1:
+        mean = values[0] / ms
+        return lambda rng: rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+    raise ValueError(f"Invalid latency distribution: {spec!r}")
+
+
+class SimulatedLLMProvider(LLMProvider):
+    """
+    Provider with realistic timing and failures; see the module docstring for the settings.
+    Arguments left as None are read from the SIM_* environment variables.
+    """
+    def __init__(self, ttfb_ms: Optional[str] = None, token_ms: Optional[str] = None,
+                 error_rate: Optional[float] = None, rate_limit_rate: Optional[float] = None,
+                 retry_after: Optional[float] = None, output_ratio: Optional[float] = None,
+                 min_tokens: Optional[int] = None, max_tokens: Optional[int] = None, seed: Optional[str] = None):
+        def setting(value, env, default, cast):
+            if value is None:
+                value = os.getenv(env, "") or default
+            return cast(value)
+        self.ttfb = parse_distribution(setting(ttfb_ms, "SIM_TTFB_MS", "lognormal:400,0.5", str))
+        self.token_delay = parse_distribution(setting(token_ms, "SIM_TOKEN_MS", "normal:25,8", str))
+        self.error_rate = setting(error_rate, "SIM_ERROR_RATE", 0.0, float)
+        self.rate_limit_rate = setting(rate_limit_rate, "SIM_RATE_LIMIT_RATE", 0.0, float)
+        self.retry_after = setting(retry_after, "SIM_RETRY_AFTER", 1.0, float)
+        self.output_ratio = setting(output_ratio, "SIM_OUTPUT_RATIO", 1.5, float)
+        self.min_tokens = setting(min_tokens, "SIM_MIN_TOKENS", 16, int)
+        self.max_tokens = setting(max_tokens, "SIM_MAX_TOKENS", 1024, int)
+        self.seed = setting(seed, "SIM_SEED", "", str) or None
+        self._calls = itertools.count()
+
+    def _plan(self, prompt: str, max_tokens: Optional[int] = None) -> Tuple[Optional[Exception], float, List[str], List[float]]:
+        """
+        Draw one call: (error to raise or None, TTFB, response tokens, delay before each later token).
+        """
+        call = next(self._calls)
+        rng = random.Random(f"{self.seed}:{call}") if self.seed is not None else random.Random()
+        if rng.random() < self.rate_limit_rate:
+            return ProviderError("Simulated rate limit", status_code=429, retry_after=self.retry_after), 0.0, [], []
+        ttfb = self.ttfb(rng)
+        if rng.random() < self.error_rate:
+            return ProviderError("Simulated provider error", status_code=503), ttfb, [], []
+        wanted = self.count_tokens(prompt) * self.output_ratio * rng.uniform(0.5, 1.5)
+        count = max(self.min_tokens, min(self.max_tokens, int(wanted)))
+        if max_tokens:
+            count = min(count, max_tokens)
+        tokens = self._text(rng, count)
+        return None, ttfb, tokens, [self.token_delay(rng) for _ in tokens[1:]]
+
+    @staticmethod
+    def _text(rng: random.Random, count: int) -> List[str]:
+        tokens, sentence = [], 0
+        for i in range(count):
+            word = rng.choice(WORDS)
+            separator = " "
+            if sentence == 0:
+                word = word.capitalize()
+                separator = "" if i == 0 else "\n\n" if rng.random() < 0.2 else " "
+            sentence += 1
+            if i == count - 1 or (sentence >= 6 and rng.random() < 0.2):
+                word += "."
+                sentence = 0
+            tokens.append(separator + word)
+        return tokens
+
+    def generate(self, prompt: str, **kwargs) -> str:
+        error, ttfb, tokens, delays = self._plan(prompt, kwargs.get("max_tokens"))
+        time.sleep(ttfb + sum(delays))
+        if error is not None:
+            raise error
+        return "".join(tokens)
+
+    async def agenerate(self, prompt: str, **kwargs) -> str:
+        error, ttfb, tokens, delays = self._plan(prompt, kwargs.get("max_tokens"))
+        await asyncio.sleep(ttfb + sum(delays))
+        if error is not None:
+            raise error
+        return "".join(tokens)
+
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        error, ttfb, tokens, delays = self._plan(prompt, kwargs.get("max_tokens"))
+        await asyncio.sleep(ttfb)
+        if error is not None:
+            raise error
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        due = [0.0] + list(itertools.accumulate(delays))
+        sent = 0
+        while sent < len(tokens):
+            now = loop.time() - start
+            ready = sent + 1
+            while ready < len(tokens) and due[ready] <= now:
+                ready += 1
+            yield "".join(tokens[sent:ready])
+            sent = ready
+            if sent < len(tokens):
+                await asyncio.sleep(max(MIN_SLEEP, due[sent] - (loop.time() - start)))
+
+    def name(self) -> str:
+        return "simulated"
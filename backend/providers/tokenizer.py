@@ -0,0 +1,273 @@
+"""
+Tokenizer service shared by prompt trimming, budget fitting, scheduler token
+estimates and usage tracking, so every part of the stack counts tokens the same way.
+
+- BPETokenizer: byte-level BPE over a vocabulary of merge ranks in tiktoken's file
+  format (one "<base64 token> <rank>" per line). Runs fully offline.
+- HeuristicTokenizer: fallback for providers without a configured vocabulary.
+  Splits text with the same pre-tokenizer and estimates sub-word pieces
+  (about 6 ASCII letters or 2 non-ASCII characters per token).
+
+Each provider gets its own tokenizer: set TOKENIZER_VOCAB_<PROVIDER> (for example
+TOKENIZER_VOCAB_GOOGLEAI=/models/gemini.tiktoken), or TOKENIZER_VOCAB as the
+default for all providers. Token counts are cached in an LRU keyed by a hash of
+the text, so the same prompt is tokenized once even when it is counted for
+trimming, scheduling and usage.
+"""
+import base64
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# GPT-style pre-tokenizer: contractions, letter runs, up to 3 digits, punctuation runs,
+# whitespace (a single space attaches to the following piece).
+PRETOKEN_RE = re.compile(r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+(?!\S)|\s+""")
+
+DEFAULT_COUNT_CACHE_SIZE = 10_000
+# Pieces longer than this are merged in slices, keeping BPE cost bounded on pathological input.
+MAX_BPE_PIECE_BYTES = 256
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+class Tokenizer(ABC):
+    """
+    Base tokenizer. Subclasses implement encode_with_offsets(); counting, batching,
+    truncation and the count cache are shared.
+    """
+    name = "tokenizer"
+
+    def __init__(self, cache_size: int = DEFAULT_COUNT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def encode_with_offsets(self, text: str) -> List[Tuple[int, int]]:
+        """
+        Return (token_id, end) per token, where end is the character offset in text
+        just past the token (rounded down when a token ends inside a character).
+        """
+
+    def encode(self, text: str) -> List[int]:
+        return [token for token, _ in self.encode_with_offsets(text)]
+
+    def encode_batch(self, texts: Sequence[str]) -> List[List[int]]:
+        return [self.encode(text) for text in texts]
+
+    def count(self, text: str) -> int:
+        """
+        Number of tokens in text (cached by text hash).
+        """
+        if not text:
+            return 0
+        key = text_key(text)
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None:
+                self._counts.move_to_end(key)
+                self.cache_hits += 1
+                return cached
+            self.cache_misses += 1
+        tokens = len(self.encode_with_offsets(text))
+        with self._lock:
+            self._counts[key] = tokens
+            if len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        return [self.count(text) for text in texts]
+
+    def offsets(self, text: str) -> List[int]:
+        """
+        End offset of each token; offsets()[n - 1] is where the first n tokens end.
+        """
+        return [end for _, end in self.encode_with_offsets(text)]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Longest prefix of text that is at most max_tokens tokens.
+        """
+        if max_tokens <= 0:
+            return ""
+        ends = self.offsets(text)
+        if len(ends) <= max_tokens:
+            return text
+        return text[:ends[max_tokens - 1]]
+
+    def cache_info(self) -> dict:
+        return {"hits": self.cache_hits, "misses": self.cache_misses, "size": len(self._counts)}
+
+
+class HeuristicTokenizer(Tokenizer):
+    """
+    Vocabulary-free estimate: pre-tokenize, then split letter runs into pieces of
+    ~6 ASCII / ~2 non-ASCII characters and punctuation into pairs. Token ids are
+    stable hashes of the pieces, only meaningful to this tokenizer.
+    """
+    name = "heuristic"
+
+    def encode_with_offsets(self, text: str) -> List[Tuple[int, int]]:
+        tokens = []
+        for match in PRETOKEN_RE.finditer(text):
+            start, end = match.span()
+            piece = match.group()
+            body = piece.lstrip(" ")
+            if not body or body.isspace() or body.isdigit():
+                step = len(piece)
+            elif body[0].isalpha() or body[0] == "'":
+                step = 6 if body.isascii() else 2
+            else:
+                step = 2
+            # A leading space rides along with the first sub-piece
+            lead = len(piece) - len(body) if body else 0
+            count = max(1, math.ceil((len(piece) - lead) / step))
+            for k in range(count):
+                piece_end = min(end, start + lead + (k + 1) * step)
+                token_text = text[start if k == 0 else start + lead + k * step:piece_end]
+                tokens.append((zlib.crc32(token_text.encode("utf-8", "surrogatepass")), piece_end))
+        return tokens
+
+
+def load_tiktoken_ranks(path: str) -> Dict[bytes, int]:
+    """
+    Read a tiktoken-format vocabulary: one "<base64 token> <rank>" per line.
+    """
+    ranks = {}
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            token, rank = line.split()
+            ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+class BPETokenizer(Tokenizer):
+    """
+    Byte-level BPE: each pre-tokenized piece is split into bytes and the adjacent pair
+    with the lowest merge rank is merged until no ranked pair remains. Every single
+    byte must be in the vocabulary. Piece encodings are memoised (pieces repeat a lot).
+    """
+    def __init__(self, ranks: Dict[bytes, int], name: str = "bpe", cache_size: int = DEFAULT_COUNT_CACHE_SIZE,
+                 piece_cache_size: int = 50_000):
+        super().__init__(cache_size)
+        missing = [b for b in range(256) if bytes([b]) not in ranks]
+        if missing:
+            raise ValueError(f"BPE vocabulary is missing {len(missing)} single-byte tokens")
+        self.ranks = ranks
+        self.name = name
+        self.piece_cache_size = piece_cache_size
+        self._pieces: Dict[bytes, List[Tuple[int, int]]] = {}
+
+    @classmethod
+    def from_file(cls, path: str, name: Optional[str] = None) -> "BPETokenizer":
+        return cls(load_tiktoken_ranks(path), name=name or os.path.basename(path))
+
+    def _merge(self, piece: bytes) -> List[Tuple[int, int]]:
+        """
+        (token_id, byte_end) for one piece.
+        """
+        cached = self._pieces.get(piece)
+        if cached is not None:
+            return cached
+        ranks = self.ranks
+        if piece in ranks:
+            result = [(ranks[piece], len(piece))]
+        else:
+            result = []
+            for offset in range(0, len(piece), MAX_BPE_PIECE_BYTES):
+                part = piece[offset:offset + MAX_BPE_PIECE_BYTES]
+                bounds = list(range(len(part) + 1))
+                while len(bounds) > 2:
+                    best, best_rank = -1, None
+                    for i in range(len(bounds) - 2):
+                        rank = ranks.get(part[bounds[i]:bounds[i + 2]])
+                        if rank is not None and (best_rank is None or rank < best_rank):
+                            best, best_rank = i, rank
+                    if best < 0:
+                        break
+                    del bounds[best + 1]
+                result.extend((ranks[part[a:b]], offset + b) for a, b in zip(bounds, bounds[1:]))
+        if len(self._pieces) >= self.piece_cache_size:
+            self._pieces.clear()
+        self._pieces[piece] = result
+        return result
+
+    def encode_with_offsets(self, text: str) -> List[Tuple[int, int]]:
+        tokens = []
+        for match in PRETOKEN_RE.finditer(text):
+            piece = match.group()
+            data = piece.encode("utf-8", "surrogatepass")
+            start = match.start()
+            if len(data) == len(piece):
+                tokens.extend((token, start + end) for token, end in self._merge(data))
+                continue
+            # Map byte offsets back to characters (floor inside multi-byte characters)
+            chars = 0
+            pos = 0
+            for token, end in self._merge(data):
+                while pos < end:
+                    if data[pos] & 0xC0 != 0x80:
+                        chars += 1
+                    pos += 1
+                if end < len(data) and data[end] & 0xC0 == 0x80:
+                    tokens.append((token, start + chars - 1))
+                else:
+                    tokens.append((token, start + chars))
+        return tokens
+
+
+_tokenizers: Dict[str, Tokenizer] = {}
+_registry_lock = threading.Lock()
+
+
+def register_tokenizer(provider: str, tokenizer: Tokenizer):
+    """
+    Use a specific tokenizer for a provider (overrides configuration).
+    """
+    with _registry_lock:
+        _tokenizers[provider] = tokenizer
+
+
+def get_tokenizer(provider: Optional[str] = None) -> Tokenizer:
+    """
+    The tokenizer for a provider, created on first use from TOKENIZER_VOCAB_<PROVIDER>
+    or TOKENIZER_VOCAB, falling back to the heuristic estimate.
+    """
+    key = provider or "default"
+    tokenizer = _tokenizers.get(key)
+    if tokenizer is not None:
+        return tokenizer
+    with _registry_lock:
+        tokenizer = _tokenizers.get(key)
+        if tokenizer is None:
+            tokenizer = _load_tokenizer(provider)
+            _tokenizers[key] = tokenizer
+    return tokenizer
+
+
+def _load_tokenizer(provider: Optional[str]) -> Tokenizer:
+    path = None
+    if provider:
+        path = os.getenv(f"TOKENIZER_VOCAB_{provider.upper()}")
+    path = path or os.getenv("TOKENIZER_VOCAB")
+    if path:
+        try:
+            return BPETokenizer.from_file(path, name=f"{provider or 'default'}-bpe")
+        except (OSError, ValueError) as e:
+            logging.warning("Could not load tokenizer vocabulary %s for %s: %s", path, provider or 'default', e)
+    return HeuristicTokenizer()
@@ -0,0 +1 @@
+# ratelimit package
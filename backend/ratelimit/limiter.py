@@ -0,0 +1,185 @@
+"""
+Per-key rate limiting with the sliding-window-counter algorithm.
+
+Each key keeps only two counters (current and previous fixed window), so memory is
+O(1) per key. The request rate is estimated as
+    previous_count * (1 - elapsed_fraction_of_current_window) + current_count
+which smooths the burst allowed at window boundaries by plain fixed windows.
+
+Backends:
+- InMemoryRateLimiter: single process; idle keys are evicted so the table stays bounded.
+- MongoRateLimiter: counters live in a shared collection (TTL-expired), so every
+  uvicorn/gunicorn worker enforces the same limit.
+"""
+import math
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, NamedTuple
+
+from pymongo import ReturnDocument
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: int  # seconds until the current window ends
+
+
+def rate_limit_headers(result: RateLimitResult, window: int) -> Dict[str, str]:
+    """
+    Standard RateLimit-* response headers (IETF httpapi draft), plus Retry-After when denied.
+    """
+    headers = {
+        "RateLimit-Limit": str(result.limit),
+        "RateLimit-Remaining": str(result.remaining),
+        "RateLimit-Reset": str(result.reset),
+        "RateLimit-Policy": f"{result.limit};w={window}",
+    }
+    if not result.allowed:
+        headers["Retry-After"] = str(max(1, result.reset))
+    return headers
+
+
+def _estimate(prev_count: int, count: int, elapsed: float, window: float) -> float:
+    return prev_count * (1 - elapsed / window) + count
+
+
+class RateLimiter(ABC):
+    """
+    Abstract rate limiter: allow at most `limit` hits per `window` seconds per key.
+    """
+    def __init__(self, limit: int, window: int):
+        self.limit = limit
+        self.window = window
+
+    @abstractmethod
+    def hit(self, key: str) -> RateLimitResult:
+        """
+        Record a hit for key if it is allowed and return the decision.
+        """
+        pass
+
+    @abstractmethod
+    def reset(self, key: str):
+        """
+        Forget all counters for key.
+        """
+        pass
+
+    def _result(self, allowed: bool, estimate: float, elapsed: float) -> RateLimitResult:
+        remaining = max(0, int(self.limit - estimate))
+        return RateLimitResult(allowed, self.limit, remaining, math.ceil(self.window - elapsed))
+
+
+class InMemoryRateLimiter(RateLimiter):
+    """
+    Process-local sliding-window counter. Keys are kept in LRU order and evicted once
+    idle for two windows (their counters would be zero anyway) or when `max_keys` is hit.
+    """
+    def __init__(self, limit: int, window: int, max_keys: int = 100_000):
+        super().__init__(limit, window)
+        self.max_keys = max_keys
+        self._entries = OrderedDict()  # key -> [window_start, count, prev_count]
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        entries = self._entries
+        while entries:
+            entry = next(iter(entries.values()))
+            if len(entries) <= self.max_keys and now - entry[0] < 2 * self.window:
+                break
+            entries.popitem(last=False)
+
+    def hit(self, key: str) -> RateLimitResult:
+        now = time.time()
+        current_start = now - (now % self.window)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = [current_start, 0, 0]
+                self._entries[key] = entry
+            else:
+                self._entries.move_to_end(key)
+                if entry[0] != current_start:
+                    # Roll the window; the old count only counts if it was the immediately previous window
+                    entry[2] = entry[1] if current_start - entry[0] == self.window else 0
+                    entry[0] = current_start
+                    entry[1] = 0
+            elapsed = now - current_start
+            estimate = _estimate(entry[2], entry[1], elapsed, self.window)
+            allowed = estimate + 1 <= self.limit
+            if allowed:
+                entry[1] += 1
+                estimate += 1
+            self._evict(now)
+        return self._result(allowed, estimate, elapsed)
+
+    def reset(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def ensure_rate_limit_indexes(collection):
+    """
+    TTL index removing expired MongoRateLimiter windows from `collection`.
+    """
+    collection.create_index("expire_at", expireAfterSeconds=0)
+
+
+class MongoRateLimiter(RateLimiter):
+    """
+    Shared sliding-window counter stored in MongoDB. One small document per key and
+    window ({_id: "<key>:<window index>", count, expire_at}); a TTL index on
+    expire_at removes old windows. Counts are updated atomically with $inc, so all
+    workers see the same totals.
+    """
+    def __init__(self, limit: int, window: int, collection):
+        super().__init__(limit, window)
+        self.collection = collection
+
+    def ensure_indexes(self):
+        ensure_rate_limit_indexes(self.collection)
+
+    def hit(self, key: str) -> RateLimitResult:
+        now = time.time()
+        index = int(now // self.window)
+        elapsed = now - index * self.window
+        doc = self.collection.find_one_and_update(
+            {"_id": f"{key}:{index}"},
+            {"$inc": {"count": 1}, "$setOnInsert": {"expire_at": datetime.fromtimestamp((index + 2) * self.window, tz=timezone.utc)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        prev = self.collection.find_one({"_id": f"{key}:{index - 1}"}, {"count": 1})
+        estimate = _estimate(prev["count"] if prev else 0, doc["count"], elapsed, self.window)
+        allowed = estimate <= self.limit
+        if not allowed:
+            # Denied hits must not count, or a client hammering the endpoint would never recover
+            self.collection.update_one({"_id": f"{key}:{index}"}, {"$inc": {"count": -1}})
+            estimate -= 1
+        return self._result(allowed, estimate, elapsed)
+
+    def reset(self, key: str):
+        # Only this key's windows ("<key>:<index>"), not keys that merely start with "<key>:"
+        self.collection.delete_many({"_id": {"$regex": f"^{re.escape(key)}:\\d+$"}})
+
+
+def create_rate_limiter(backend: str, limit: int, window: int, collection=None) -> RateLimiter:
+    """
+    Build a limiter for the configured backend ("memory" or "mongo").
+    """
+    if backend == "memory":
+        return InMemoryRateLimiter(limit, window)
+    if backend == "mongo":
+        if collection is None:
+            raise ValueError("Mongo rate limiter requires a collection")
+        return MongoRateLimiter(limit, window, collection)
+    raise ValueError(f"Unknown rate limit backend: {backend}")
@@ -0,0 +1,98 @@
+"""
+Cached dependency checks for the health and readiness probes.
+
+HealthMonitor runs a cheap check (for Mongo: the `ping` admin command, which reads
+and writes nothing) from a background task every `interval` seconds and keeps the
+last result, so a probe only reads memory however often it is called and however
+many probes run at once. A result older than `max_age` (the checker is stuck or
+stopped) counts as a failure.
+
+Without a running monitor (the app used without its lifespan, e.g. by a test client)
+a missing or stale result is refreshed on read instead, at most once per `interval`.
+"""
+import asyncio
+import time
+from typing import Callable, NamedTuple, Optional
+
+try:
+    from ..telemetry.metrics import DEPENDENCY_UP
+except ImportError:  # imported top-level with backend/ on sys.path
+    from telemetry.metrics import DEPENDENCY_UP
+
+
+class CheckResult(NamedTuple):
+    ok: bool
+    latency_ms: Optional[float]
+    checked_at: float  # wall clock (time.time())
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {"ok": self.ok, "latency_ms": self.latency_ms, "checked_at": round(self.checked_at, 3),
+                "error": self.error}
+
+
+class HealthMonitor:
+    def __init__(self, name: str, check: Callable[[], None], interval: float = 5.0,
+                 max_age: Optional[float] = None):
+        self.name = name
+        self._check = check
+        self.interval = interval
+        self.max_age = max_age or 3 * interval
+        self._last: Optional[CheckResult] = None
+        self._task: Optional[asyncio.Task] = None
+        self._up = DEPENDENCY_UP.labels(name)
+
+    def check(self) -> CheckResult:
+        """
+        Run the check now (blocking) and cache its result.
+        """
+        start = time.perf_counter()
+        try:
+            self._check()
+            result = CheckResult(True, round((time.perf_counter() - start) * 1000, 3), time.time())
+        except Exception as e:
+            result = CheckResult(False, None, time.time(), f"{type(e).__name__}: {e}")
+        self._last = result
+        self._up.set(1 if result.ok else 0)
+        return result
+
+    async def run(self):
+        while True:
+            await asyncio.to_thread(self.check)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def last(self) -> Optional[CheckResult]:
+        """
+        The cached result, failed if it is older than max_age; None before the first check.
+        """
+        result = self._last
+        if result is not None and time.time() - result.checked_at > self.max_age:
+            return result._replace(ok=False, error=f"stale: last checked {time.time() - result.checked_at:.0f}s ago")
+        return result
+
+    async def aresult(self) -> CheckResult:
+        """
+        The cached result; refreshed first (in a thread) only when no monitor is running
+        and it is missing or older than `interval`.
+        """
+        result = self._last
+        if not self.running and (result is None or time.time() - result.checked_at > self.interval):
+            return await asyncio.to_thread(self.check)
+        return self.last() or CheckResult(False, None, time.time(), "not checked yet")
@@ -0,0 +1,116 @@
+"""
+Index builds and data migrations, applied once per database however many workers start.
+
+Each migration has a stable name; applied names are recorded in the `migrations`
+collection ({_id: name, applied_at, applied_by}). At startup every worker:
+1. reads the applied names (one query) and returns at once if nothing is pending;
+2. otherwise takes the lock document in `locks` ({_id: "migrations", owner, expire_at})
+   and applies the pending migrations in order, extending the lock after each one;
+3. workers that do not get the lock poll until the holder has finished.
+
+A lock whose holder died expires after `lock_ttl` seconds and is taken over.
+Migrations should be idempotent (create_index is), so an expired lock never does
+harm. Append new migrations with new names; never rename or edit applied ones.
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+LOCK_ID = "migrations"
+
+
+class Migration(NamedTuple):
+    name: str
+    apply: Callable[[], None]
+
+
+class MigrationTimeout(RuntimeError):
+    """
+    Raised when another worker holds the migration lock for longer than the wait allows.
+    """
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class MongoLock:
+    """
+    Lease-style lock in a Mongo collection: a document that expires unless renewed.
+    """
+    def __init__(self, collection, name: str, ttl: float = 60.0, owner: Optional[str] = None):
+        self.collection = collection
+        self.name = name
+        self.ttl = ttl
+        self.owner = owner or _owner()
+
+    def _expiry(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+
+    def acquire(self) -> bool:
+        """
+        Take the lock if it is free or expired; never blocks.
+        """
+        try:
+            self.collection.insert_one({"_id": self.name, "owner": self.owner, "expire_at": self._expiry()})
+            return True
+        except DuplicateKeyError:
+            taken = self.collection.update_one(
+                {"_id": self.name, "expire_at": {"$lt": datetime.now(timezone.utc)}},
+                {"$set": {"owner": self.owner, "expire_at": self._expiry()}})
+            return taken.modified_count == 1
+
+    def renew(self) -> bool:
+        renewed = self.collection.update_one({"_id": self.name, "owner": self.owner},
+                                             {"$set": {"expire_at": self._expiry()}})
+        return renewed.matched_count == 1
+
+    def release(self):
+        self.collection.delete_one({"_id": self.name, "owner": self.owner})
+
+
+def _applied(db) -> set:
+    return {doc["_id"] for doc in db.migrations.find({}, {"_id": 1})}
+
+
+def run_migrations(db, migrations: Sequence[Migration], lock_ttl: float = 60.0, wait_timeout: float = 300.0,
+                   poll_interval: float = 0.25) -> List[str]:
+    """
+    Apply the pending migrations (blocking); returns the names applied by this process.
+    """
+    pending = [m for m in migrations if m.name not in _applied(db)]
+    if not pending:
+        return []
+    lock = MongoLock(db.locks, LOCK_ID, ttl=lock_ttl)
+    deadline = time.monotonic() + wait_timeout
+    while not lock.acquire():
+        if time.monotonic() > deadline:
+            raise MigrationTimeout(f"Timed out after {wait_timeout:.0f}s waiting for the migration lock")
+        time.sleep(poll_interval)
+        if all(m.name in _applied(db) for m in pending):
+            return []
+    done = []
+    try:
+        # Another worker may have finished some of them while we waited
+        applied = _applied(db)
+        for migration in migrations:
+            if migration.name in applied:
+                continue
+            start = time.perf_counter()
+            migration.apply()
+            db.migrations.insert_one({"_id": migration.name, "applied_at": datetime.now(timezone.utc),
+                                      "applied_by": lock.owner})
+            done.append(migration.name)
+            logger.info("Applied migration %s in %.0f ms", migration.name, (time.perf_counter() - start) * 1000)
+            lock.renew()
+    finally:
+        lock.release()
+    return done
@@ -0,0 +1,78 @@
+"""
+Readiness of the dependencies a worker connects to at startup.
+
+The lifespan starts connect_with_retry() for a dependency (Mongo: connect, then apply
+the migrations) and waits for it only up to a startup timeout. A worker whose
+database is not reachable yet still starts: it answers liveness checks and the
+routes that do not need the database, while the routes that do answer 503 with a
+Retry-After until the dependency is ready. The connection keeps being retried in the
+background with capped exponential backoff.
+
+States: "idle" (no lifespan has started it: the app is used without one, e.g. by a
+test client, and the driver connects lazily on first use), "connecting" (not
+reachable yet; `error` is the last failure) and "ready".
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+IDLE, CONNECTING, READY = "idle", "connecting", "ready"
+
+
+class Readiness:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = IDLE
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.changed_at = time.time()
+
+    def _set(self, state: str, error: Optional[str] = None):
+        self.state = state
+        self.error = error
+        self.changed_at = time.time()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    @property
+    def serving(self) -> bool:
+        """
+        May requests that need this dependency go ahead? Only not while it is connecting.
+        """
+        return self.state != CONNECTING
+
+    def to_dict(self) -> dict:
+        return {"state": self.state, "attempts": self.attempts, "error": self.error,
+                "since": round(self.changed_at, 3)}
+
+
+async def connect_with_retry(readiness: Readiness, connect: Callable[[], Awaitable[None]],
+                             initial_delay: float = 0.5, max_delay: float = 30.0):
+    """
+    Await connect() until it succeeds, then mark the dependency ready. Runs until then
+    (or until cancelled at shutdown); every failure is logged and retried.
+    """
+    readiness._set(CONNECTING)
+    readiness.attempts = 0
+    delay = initial_delay
+    while True:
+        readiness.attempts += 1
+        try:
+            await connect()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            readiness._set(CONNECTING, f"{type(e).__name__}: {e}")
+            logger.warning("%s not ready (attempt %s, retrying in %.1fs): %s",
+                           readiness.name, readiness.attempts, delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+            continue
+        readiness._set(READY)
+        logger.info("%s ready after %s attempt(s)", readiness.name, readiness.attempts)
+        return
@@ -0,0 +1,91 @@
+"""
+Production entry point: several worker processes serving backend.main:app.
+
+    python -m backend.server.serve --workers 4 --bind 0.0.0.0:8000
+
+With gunicorn installed, the master imports the app once (preload_app) and warms the
+shared caches (Markdown renderer, syntax highlighting lexers) before forking uvicorn
+workers. Each worker then only runs the app's lifespan: the Mongo connection and
+migrations (a single query once another worker has applied them, see
+server/migrations.py), background tasks and the startup profile. Without gunicorn, uvicorn's own process manager is used and every
+worker imports the app itself.
+
+WORKERS is exported to the app's settings, so per-worker shares of the provider
+limits and the shared (Mongo) rate limiter are selected automatically. Mongo
+connections are opened lazily, in the workers, never in the master.
+"""
+import argparse
+import os
+import sys
+
+APP = "backend.main:app"
+
+
+def gunicorn_options(args) -> dict:
+    return {
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "keepalive": 5,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+        # Access lines come from the app's own logging (telemetry/logs.py)
+        "accesslog": None,
+    }
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options(args).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from backend import main
+            main.warm_caches()
+            return main.app
+
+    Server().run()
+
+
+def run_uvicorn(args):
+    import uvicorn
+
+    host, _, port = args.bind.rpartition(":")
+    uvicorn.run(APP, host=host or "0.0.0.0", port=int(port), workers=args.workers, log_config=None,
+                timeout_graceful_shutdown=args.graceful_timeout, limit_max_requests=args.max_requests or None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--bind", default=os.getenv("BIND", "0.0.0.0:8000"), help="host:port")
+    parser.add_argument("--timeout", type=int, default=60, help="seconds before a silent worker is restarted")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="seconds to finish requests on shutdown")
+    parser.add_argument("--max-requests", type=int, default=0, help="recycle a worker after this many requests (0 = never)")
+    parser.add_argument("--server", choices=["auto", "gunicorn", "uvicorn"], default="auto")
+    args = parser.parse_args(argv)
+    # Read by backend.main's settings, so this must happen before the app is imported
+    os.environ["WORKERS"] = str(args.workers)
+
+    server = args.server
+    if server == "auto":
+        try:
+            import gunicorn  # noqa: F401
+            server = "gunicorn"
+        except ImportError:
+            server = "uvicorn"
+    if server == "gunicorn":
+        run_gunicorn(args)
+    else:
+        run_uvicorn(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+# telemetry package
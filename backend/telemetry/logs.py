@@ -0,0 +1,282 @@
+"""
+Structured, non-blocking logging.
+
+configure_logging() routes every log record through AsyncLogHandler, which puts it on
+an in-process queue and returns; a background thread formats the queued records as
+JSON lines and writes them in batches (one write and flush per batch). Messages use
+logging's lazy %-style arguments and are only formatted on the writer thread.
+
+Records carry correlation fields captured when they are logged: `request_id` (the
+X-Request-ID of the request being served, see request_context()) and the current
+trace and span ids (telemetry/tracing.py), so a request's log lines can be joined
+with its trace.
+
+High-volume INFO/DEBUG lines can be sampled per logger (LOG_SAMPLING, e.g.
+"backend.access=0.1"). WARNING and above are never sampled and never dropped: when
+the queue is full, lower levels are dropped (and counted) while warnings wait for
+room, so security warnings always reach the log.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, TextIO
+
+from .tracing import current_span
+
+DEFAULT_QUEUE_SIZE = 10_000
+DEFAULT_BATCH_SIZE = 256
+# Longest a WARNING+ record waits for room in a full queue before it is written directly
+BLOCKING_PUT_TIMEOUT = 1.0
+# LogRecord attributes that are not user-supplied `extra` fields
+STANDARD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime",
+                                                                                    "request_id", "trace_id", "span_id"}
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def request_context(request_id: Optional[str] = None):
+    """
+    Tag log records emitted inside the block (including awaited calls and tasks
+    started from it) with request_id; a new id is generated when none is given.
+    """
+    token = _request_id.set(request_id or new_request_id())
+    try:
+        yield _request_id.get()
+    finally:
+        _request_id.reset(token)
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """
+    {"logger.name": rate} from "name=rate,name=rate".
+    """
+    rates = {}
+    for item in (spec or "").split(","):
+        name, sep, rate = item.partition("=")
+        if sep and name.strip():
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a share of the INFO/DEBUG records of the configured loggers (and their
+    children); WARNING and above always pass.
+    """
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: Dict[str, Optional[float]] = {}
+
+    def rate_for(self, name: str) -> Optional[float]:
+        rate = self._resolved.get(name, -1.0)
+        if rate == -1.0:
+            rate, probe = None, name
+            while probe:
+                if probe in self.rates:
+                    rate = self.rates[probe]
+                    break
+                probe = probe.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        return rate is None or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, msg, correlation ids, extra fields
+    and the formatted exception if any.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("request_id", "trace_id", "span_id"):
+            value = getattr(record, key, None)
+            if value:
+                entry[key] = value
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class AsyncLogHandler(logging.Handler):
+    """
+    Queues records for a background writer thread; emit() never formats or writes.
+
+    emit() only touches the (thread-safe) queue, so handle() calls it without the handler
+    lock: a caller never waits for the writer, and a warning waiting for room in a full
+    queue holds up no one else. Stream writes (the writer's, and the last-resort write
+    of a warning that found no room) are serialised by their own lock.
+    """
+    def __init__(self, stream: Optional[TextIO] = None, formatter: Optional[logging.Formatter] = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, batch_size: int = DEFAULT_BATCH_SIZE):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.setFormatter(formatter or JsonFormatter())
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._closed = False
+        self._queue_size = queue_size
+        self._write_lock = threading.Lock()
+        self._start_writer()
+        if hasattr(os, "register_at_fork"):
+            # Threads do not survive fork: a worker forked from a preloading master needs its own writer
+            handler = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: handler() is not None and handler()._after_fork())
+
+    def _start_writer(self):
+        self._queue: "queue.Queue[Optional[logging.LogRecord]]" = queue.Queue(self._queue_size)
+        self._writer = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._writer.start()
+
+    def _after_fork(self):
+        if not self._closed:
+            self.createLock()
+            self._write_lock = threading.Lock()
+            self._start_writer()
+
+    def handle(self, record: logging.LogRecord):
+        # logging.Handler.handle() without `with self.lock` around emit()
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):  # filters may return a replacement record (3.12+)
+            record = rv
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record: logging.LogRecord):
+        # Correlation ids must be read on the logging thread, where the contextvars are set
+        record.request_id = _request_id.get()
+        span = current_span()
+        if span is not None:
+            record.trace_id, record.span_id = span.context.trace_id, span.context.span_id
+        if record.exc_info and not record.exc_text:
+            # Tracebacks reference live frames; render them before handing the record off
+            record.exc_text = self.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                self.dropped += 1
+                return
+            try:
+                self._queue.put(record, timeout=BLOCKING_PUT_TIMEOUT)
+            except queue.Full:
+                self._write([record])
+
+    def _run(self):
+        # Queue items: log records, threading.Event flush markers, None to stop
+        while True:
+            item = self._queue.get()
+            batch: List[logging.LogRecord] = []
+            markers = []
+            while item is not None:
+                if isinstance(item, threading.Event):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for marker in markers:
+                marker.set()
+            if item is None:
+                return
+
+    def _write(self, records: List[logging.LogRecord]):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if self.dropped:
+            lines.append(json.dumps({"ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                                     "level": "WARNING", "logger": __name__,
+                                     "msg": f"{self.dropped} log records dropped (queue full)"}))
+            self.dropped = 0
+        try:
+            with self._write_lock:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+        except Exception:
+            pass
+
+    def flush(self, timeout: float = 5.0):
+        """
+        Wait until the records queued so far have been written.
+        """
+        if not self._writer.is_alive():
+            return
+        marker = threading.Event()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return
+        marker.wait(timeout)
+
+    def close(self):
+        self._closed = True
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=5.0)
+        super().close()
+
+
+def configure_logging(level: str = "INFO", sampling: str = "", json_format: bool = True,
+                      stream: Optional[TextIO] = None) -> AsyncLogHandler:
+    """
+    Replace the root logger's handlers with a single AsyncLogHandler.
+    sampling: per-logger INFO/DEBUG sample rates, "name=rate,name=rate".
+    """
+    formatter = JsonFormatter() if json_format else logging.Formatter(
+        "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+    handler = AsyncLogHandler(stream, formatter)
+    rates = parse_sampling(sampling)
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+        old.close()
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    return handler
@@ -0,0 +1,371 @@
+"""
+In-process metrics exposed in the Prometheus text format (GET /metrics).
+
+No client library is needed: counters, gauges and histograms are plain Python
+objects. Recording is a dict lookup plus an addition (histograms add a bisect over
+the bucket bounds); formatting only happens when /metrics is scraped. Bind labels
+once on hot paths (`child = HISTOGRAM.labels("render")`, then `child.observe(s)`).
+
+Updates are not locked: they are meant to happen on the event loop thread, where
+they cannot interleave. Each uvicorn/gunicorn worker keeps its own metrics, so scrape
+every worker (or aggregate by instance in Prometheus).
+
+Values that already live elsewhere (cache hit counts, queue depths) are exported
+with FunctionMetric, which reads them at scrape time and costs nothing in between.
+"""
+import asyncio
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; covers fast in-process stages (ms) up to slow provider calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+Sample = Tuple[str, Dict[str, str], float]  # (name suffix, labels, value)
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    """
+    A named metric with optional labels; one child per combination of label values.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: "Optional[Registry]" = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self) -> Iterator[Sample]:
+        for key, child in list(self._children.items()):
+            yield from child.samples(dict(zip(self.labelnames, key)))
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def samples(self, labels):
+        yield "_total", labels, self.value
+
+
+class Counter(Metric):
+    """
+    Monotonic count. The exported name gets the conventional `_total` suffix.
+    """
+    kind = "counter"
+    _new_child = _CounterChild
+
+    def inc(self, amount: float = 1):
+        self._children[()].inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def samples(self, labels):
+        yield "", labels, self.value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+    _new_child = _GaugeChild
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+    def inc(self, amount: float = 1):
+        self._children[()].inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._children[()].dec(amount)
+
+    def get(self) -> float:
+        return self._children[()].value
+
+    @contextmanager
+    def track_inprogress(self):
+        """
+        Count the enclosed block while it runs (inc on entry, dec on exit).
+        """
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot: above the highest bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, labels):
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield "_bucket", {**labels, "le": _format_value(bound)}, cumulative
+        yield "_bucket", {**labels, "le": "+Inf"}, self.count
+        yield "_sum", labels, self.sum
+        yield "_count", labels, self.count
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in fixed buckets (seconds by default).
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: "Optional[Registry]" = None):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def time(self):
+        return self._children[()].time()
+
+
+class FunctionMetric(Metric):
+    """
+    Read at scrape time: func() returns {label values tuple: value} (or a single value
+    when there are no labels).
+    """
+    def __init__(self, name: str, help: str, func: Callable[[], object], kind: str = "gauge",
+                 labelnames: Sequence[str] = (), registry: "Optional[Registry]" = None):
+        self.func = func
+        self.kind = kind
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return None
+
+    def samples(self) -> Iterator[Sample]:
+        values = self.func()
+        if not isinstance(values, dict):
+            values = {(): values}
+        suffix = "_total" if self.kind == "counter" else ""
+        for key, value in values.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield suffix, dict(zip(self.labelnames, (str(k) for k in key))), value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = list(metric.samples())
+            except Exception as e:  # a broken callback must not break the scrape
+                lines.append(f"# {metric.name}: collection failed: {e!r}")
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                name = metric.name + suffix
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}" if label_text
+                             else f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- Application metrics ---
+HTTP_REQUESTS = Counter("http_requests", "HTTP requests by route template, method and status",
+                        ["method", "route", "status"])
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency by route template",
+                         ["method", "route"])
+CHAT_STAGE_LATENCY = Histogram(
+    "chat_stage_duration_seconds",
+    "Time spent per chat request stage (preprocess, rate_limit, db_write, retrieval, provider_ttfb, "
+    "provider_total, postprocess)",
+    ["stage"])
+POSTPROCESS_STAGE_LATENCY = Histogram("postprocess_stage_duration_seconds",
+                                      "Time spent per postprocessing pipeline stage", ["stage"])
+PROVIDER_REQUESTS = Counter("llm_provider_requests", "LLM provider attempts by outcome", ["provider", "outcome"])
+PROVIDER_ERRORS = Counter("llm_provider_errors", "LLM provider errors by kind", ["provider", "kind"])
+PROVIDER_LATENCY = Histogram("llm_provider_duration_seconds", "LLM provider call latency (successful calls)",
+                             ["provider"])
+PROVIDER_TTFB = Histogram("llm_provider_ttfb_seconds", "Time to the first streamed chunk from an LLM provider",
+                          ["provider"])
+EVENT_LOOP_LAG = Histogram("event_loop_lag_seconds", "How late the event loop wakes up a sleeping task",
+                           buckets=LAG_BUCKETS)
+EVENT_LOOP_LAG_MAX = Gauge("event_loop_lag_max_seconds", "Largest event loop lag since the last scrape")
+STARTUP_DURATION = Gauge("app_startup_seconds", "Worker startup time by phase (see telemetry/startup.py)", ["phase"])
+DEPENDENCY_UP = Gauge("dependency_up", "Result of the last background dependency check (1 = up, see server/health.py)",
+                      ["dependency"])
+INGESTION_IN_PROGRESS = Gauge("context_ingestion_in_progress", "Context uploads being saved, extracted and indexed")
+
+
+def error_kind(exc: BaseException) -> str:
+    """
+    Coarse error class for the llm_provider_errors `kind` label.
+    """
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout"
+    status = getattr(exc, "status_code", None) or getattr(exc, "status", None) or getattr(exc, "code", None)
+    if isinstance(status, int):
+        return "rate_limited" if status == 429 else f"http_{status // 100}xx"
+    return type(exc).__name__
+
+
+_caches: Dict[str, Callable[[], dict]] = {}
+
+
+def register_cache(name: str, cache_info: Callable[[], dict]):
+    """
+    Export a cache's hits and misses (read from cache_info(), which returns a dict with
+    "hits" and "misses") and its hit ratio, labelled cache=name.
+    """
+    _caches[name] = cache_info
+
+
+def _cache_stats() -> Dict[str, Tuple[int, int]]:
+    stats = {}
+    for name, cache_info in list(_caches.items()):
+        info = cache_info()
+        stats[name] = (info.get("hits", 0), info.get("misses", 0))
+    return stats
+
+
+def _cache_ratios() -> Dict[Tuple[str], float]:
+    return {(name,): hits / (hits + misses) if hits + misses else 0.0
+            for name, (hits, misses) in _cache_stats().items()}
+
+
+CACHE_HITS = FunctionMetric("cache_hits", "Cache hits",
+                            lambda: {(name,): s[0] for name, s in _cache_stats().items()}, "counter", ["cache"])
+CACHE_MISSES = FunctionMetric("cache_misses", "Cache misses",
+                              lambda: {(name,): s[1] for name, s in _cache_stats().items()}, "counter", ["cache"])
+CACHE_HIT_RATIO = FunctionMetric("cache_hit_ratio", "Cache hits / lookups since start", _cache_ratios,
+                                 "gauge", ["cache"])
+
+
+def scrape(registry: "Optional[Registry]" = None) -> str:
+    """
+    Text for a /metrics response; resets the per-scrape maximum event loop lag.
+    """
+    text = (registry if registry is not None else REGISTRY).render()
+    if registry is None or registry is REGISTRY:
+        EVENT_LOOP_LAG_MAX.set(0.0)
+    return text
+
+
+async def monitor_event_loop(interval: float = 0.5):
+    """
+    Measure event loop lag until cancelled: sleep for interval and record how much
+    later than requested the task woke up. Blocking work on the loop shows up here.
+    """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        EVENT_LOOP_LAG.observe(lag)
+        if lag > EVENT_LOOP_LAG_MAX.get():
+            EVENT_LOOP_LAG_MAX.set(lag)
+
+
+def record_timings(histogram: Histogram, timings_ms: Dict[str, float]):
+    """
+    Observe a {stage: milliseconds} mapping (e.g. PostprocessContext.timings) into a
+    seconds histogram.
+    """
+    for stage, ms in timings_ms.items():
+        histogram.labels(stage).observe(ms / 1000)
+
@@ -0,0 +1,35 @@
+"""
+Mongo command tracing: a pymongo CommandListener that records a client span per
+command (find, insert, update, aggregate, ...) under the request's current span.
+Commands issued outside a sampled trace (startup, background jobs) are not traced.
+"""
+from pymongo import monitoring
+
+from .tracing import STATUS_ERROR, current_span, get_tracer
+
+
+class MongoTracingListener(monitoring.CommandListener):
+    def __init__(self):
+        self._spans = {}  # (connection id, request id) -> open span
+
+    def started(self, event):
+        parent = current_span()
+        if parent is None or not parent.recording:
+            return
+        collection = event.command.get(event.command_name)
+        attributes = {"db.system": "mongodb", "db.name": event.database_name, "db.operation": event.command_name}
+        if isinstance(collection, str):
+            attributes["db.mongodb.collection"] = collection
+        span = get_tracer().start_span(f"mongodb.{event.command_name}", attributes, kind="client")
+        self._spans[(event.connection_id, event.request_id)] = span
+
+    def succeeded(self, event):
+        span = self._spans.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.end()
+
+    def failed(self, event):
+        span = self._spans.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.set_status(STATUS_ERROR, str(event.failure.get("errmsg", ""))[:200])
+            span.end()
@@ -0,0 +1,74 @@
+"""
+Worker startup profile: how long each startup phase took, from the first line of
+backend/main.py until the worker is ready to serve. In a worker forked from a master
+that preloaded the app, the profile restarts at the fork (the import is shared).
+
+    profile = StartupProfile(started=IMPORT_STARTED)
+    profile.mark("import")          # time since the previous mark
+    with profile.phase("migrations"):
+        ...
+    profile.ready()                 # logs the profile and exports app_startup_seconds{phase}
+
+The profile is logged once and reported by GET /api/status and the
+app_startup_seconds metric.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from .metrics import STARTUP_DURATION
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    def __init__(self, started: Optional[float] = None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases: Dict[str, float] = {}  # phase -> seconds, in order
+        self.ready_at: Optional[float] = None
+        self.preloaded = False
+        self._last = self.started
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forked)
+
+    def _forked(self):
+        # Forked from a master that preloaded the app: the worker's startup begins now
+        self.started = self._last = time.perf_counter()
+        self.phases = {}
+        self.ready_at = None
+        self.preloaded = True
+
+    def mark(self, phase: str):
+        """
+        Close a phase that started at the previous mark (or at `started`).
+        """
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+            self._last = time.perf_counter()
+
+    def ready(self):
+        self.ready_at = time.perf_counter()
+        for phase, seconds in self.phases.items():
+            STARTUP_DURATION.labels(phase).set(seconds)
+        STARTUP_DURATION.labels("total").set(self.total)
+        logger.info("Worker ready in %.0f ms (%s)", self.total * 1000,
+                    ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases.items()))
+
+    @property
+    def total(self) -> float:
+        return (self.ready_at if self.ready_at is not None else time.perf_counter()) - self.started
+
+    def to_dict(self) -> dict:
+        return {"ready": self.ready_at is not None, "preloaded": self.preloaded, "total_ms": round(self.total * 1000, 1),
+                "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()}}
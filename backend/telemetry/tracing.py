@@ -0,0 +1,447 @@
+"""
+Request tracing with OpenTelemetry-compatible spans.
+
+Spans carry W3C trace context (trace id, span id, sampled flag): an incoming
+`traceparent` header continues the caller's trace, and inject() adds one to outgoing
+requests. Exported spans use the OTLP/JSON field names (traceId, spanId,
+parentSpanId, startTimeUnixNano, attributes, status), so a file export can be
+replayed into any OpenTelemetry collector and OTLPHttpExporter sends to one directly.
+
+Sampling is decided once at the root of a trace (head sampling): a trace is kept
+when its trace id falls under TRACE_SAMPLE_RATIO, the same rule as OpenTelemetry's
+TraceIdRatioBased sampler, and child spans (local or remote) follow their parent.
+Spans of unsampled traces only carry the ids needed for propagation and record
+nothing. Finished spans are queued and exported in batches by a background thread,
+never on the request path; when the exporter falls behind, spans are dropped rather
+than queued without bound.
+
+Usage:
+    with span("chat.postprocess", {"stages": 4}) as s:
+        ...
+        s.set_attribute("truncated", True)
+The current span is kept in a contextvar, so it follows awaits, asyncio tasks and
+asyncio.to_thread calls.
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+TRACEPARENT_RE = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+INVALID_TRACE_ID = "0" * 32
+INVALID_SPAN_ID = "0" * 16
+# Span kinds and status codes as numbered in OTLP
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+DEFAULT_BATCH_SIZE = 512
+DEFAULT_MAX_QUEUE = 8192
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+logger = logging.getLogger(__name__)
+
+
+class SpanContext(NamedTuple):
+    trace_id: str
+    span_id: str
+    sampled: bool
+    remote: bool = False
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    """
+    SpanContext from a W3C traceparent header, or None when missing or invalid.
+    """
+    if not header:
+        return None
+    m = TRACEPARENT_RE.match(header.strip().lower())
+    if not m:
+        return None
+    version, trace_id, span_id, flags = m.groups()
+    if version == "ff" or trace_id == INVALID_TRACE_ID or span_id == INVALID_SPAN_ID:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1), remote=True)
+
+
+def format_traceparent(context: SpanContext) -> str:
+    return f"00-{context.trace_id}-{context.span_id}-{'01' if context.sampled else '00'}"
+
+
+def _attribute_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_attribute_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def otlp_attributes(attributes: Dict[str, Any]) -> List[dict]:
+    return [{"key": key, "value": _attribute_value(value)} for key, value in attributes.items()]
+
+
+class Span:
+    """
+    One timed operation. span() / Tracer.span() end it when their block exits and
+    record an exception leaving the block as an error; spans from start_span() are
+    ended by the caller.
+    """
+    __slots__ = ("tracer", "context", "parent_id", "name", "kind", "start_ns", "end_ns",
+                 "attributes", "events", "status", "status_message")
+
+    def __init__(self, tracer: "Tracer", context: SpanContext, parent_id: Optional[str], name: str,
+                 kind: str = "internal", attributes: Optional[Dict[str, Any]] = None):
+        self.tracer = tracer
+        self.context = context
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes) if attributes else {}
+        self.events: List[tuple] = []
+        self.status = STATUS_UNSET
+        self.status_message = ""
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.events.append((time.time_ns(), name, attributes or {}))
+
+    def record_exception(self, exc: BaseException):
+        self.add_event("exception", {"exception.type": type(exc).__name__, "exception.message": str(exc)})
+
+    def set_status(self, code: int, message: str = ""):
+        self.status = code
+        self.status_message = message
+
+    def traceparent(self) -> str:
+        return format_traceparent(self.context)
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.tracer._finished(self)
+
+    @property
+    def duration(self) -> float:
+        """
+        Seconds from start to end (to now if the span is still open).
+        """
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": otlp_attributes(self.attributes),
+            "status": {"code": self.status, **({"message": self.status_message} if self.status_message else {})},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = [{"timeUnixNano": str(t), "name": name, "attributes": otlp_attributes(attrs)}
+                              for t, name, attrs in self.events]
+        return span
+
+
+class NonRecordingSpan(Span):
+    """
+    Span of an unsampled trace: keeps the ids for propagation, records nothing.
+    """
+    __slots__ = ()
+
+    def __init__(self, tracer: "Tracer", context: SpanContext, name: str = ""):
+        self.tracer = tracer
+        self.context = context
+        self.parent_id = None
+        self.name = name
+        self.end_ns = None
+
+    @property
+    def recording(self) -> bool:
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def add_event(self, name, attributes=None):
+        pass
+
+    def set_status(self, code, message=""):
+        pass
+
+    def end(self):
+        pass
+
+
+class SpanExporter:
+    """
+    Receives batches of finished spans (from the exporter thread).
+    """
+    def export(self, spans: List[Span]):
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class InMemoryExporter(SpanExporter):
+    """
+    Keeps exported spans in a list (tests, debugging).
+    """
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock:
+            self.spans.extend(spans)
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+    def names(self) -> List[str]:
+        return [s.name for s in self.spans]
+
+
+class FileExporter(SpanExporter):
+    """
+    Appends spans as JSON lines in OTLP/JSON span format (one span per line).
+    """
+    def __init__(self, path: str, service_name: str = ""):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = []
+        for s in spans:
+            record = s.to_otlp()
+            if self.service_name:
+                record["resource"] = {"service.name": self.service_name}
+            lines.append(json.dumps(record))
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+class OTLPHttpExporter(SpanExporter):
+    """
+    Sends spans to an OpenTelemetry collector over OTLP/HTTP JSON (POST <endpoint>/v1/traces).
+    """
+    def __init__(self, endpoint: str, service_name: str = "chatbot-backend", timeout: float = 5.0):
+        import httpx  # only needed when this exporter is configured
+        self.url = endpoint.rstrip("/") + ("" if endpoint.rstrip("/").endswith("/v1/traces") else "/v1/traces")
+        self.service_name = service_name
+        self._client = httpx.Client(timeout=timeout)
+
+    def export(self, spans):
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": otlp_attributes({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": "chatbottogo"}, "spans": [s.to_otlp() for s in spans]}],
+        }]}
+        self._client.post(self.url, json=payload).raise_for_status()
+
+    def shutdown(self):
+        self._client.close()
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Creates spans, makes head sampling decisions and batches finished spans to the
+    exporter. Without an exporter every span is non-recording.
+    """
+    def __init__(self, exporter: Optional[SpanExporter] = None, sample_ratio: float = 1.0,
+                 batch_size: int = DEFAULT_BATCH_SIZE, max_queue: int = DEFAULT_MAX_QUEUE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.exporter = exporter
+        self.sample_ratio = max(0.0, min(1.0, sample_ratio))
+        self._threshold = int(self.sample_ratio * (1 << 64))
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: deque = deque()
+        self._wake = threading.Event()
+        self._export_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+        if hasattr(os, "register_at_fork"):
+            # The export thread does not survive fork; a forked worker starts its own on demand
+            tracer = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: tracer() is not None and tracer()._after_fork())
+
+    def _after_fork(self):
+        self._queue.clear()
+        self._wake = threading.Event()
+        self._export_lock = threading.Lock()
+        self._worker = None
+
+    def should_sample(self, trace_id: str) -> bool:
+        # Lower 64 bits of the trace id against the ratio, as OpenTelemetry's TraceIdRatioBased
+        return self.exporter is not None and int(trace_id[16:], 16) < self._threshold
+
+    def start_span(self, name: str, attributes: Optional[Dict[str, Any]] = None, kind: str = "internal",
+                   parent: Optional[SpanContext] = None) -> Span:
+        """
+        Start a span under parent (default: the current span; a new trace if none).
+        The caller ends it; use span() to also make it the current span.
+        """
+        if parent is None:
+            current = _current_span.get()
+            parent = current.context if current is not None else None
+        if parent is None:
+            trace_id = f"{random.getrandbits(128):032x}"
+            sampled = self.should_sample(trace_id)
+            parent_id = None
+        else:
+            trace_id, sampled, parent_id = parent.trace_id, parent.sampled and self.exporter is not None, parent.span_id
+        context = SpanContext(trace_id, f"{random.getrandbits(64) or 1:016x}", sampled)
+        if not sampled:
+            return NonRecordingSpan(self, context, name)
+        return Span(self, context, parent_id, name, kind, attributes)
+
+    @contextmanager
+    def span(self, name: str, attributes: Optional[Dict[str, Any]] = None, kind: str = "internal",
+             parent: Optional[SpanContext] = None) -> Iterator[Span]:
+        s = self.start_span(name, attributes, kind, parent)
+        token = _current_span.set(s)
+        try:
+            yield s
+        except BaseException as exc:
+            if s.recording:
+                s.record_exception(exc)
+                s.set_status(STATUS_ERROR, type(exc).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            s.end()
+
+    def _finished(self, span: Span):
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append(span)
+        if self._worker is None:
+            self._start_worker()
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    def _start_worker(self):
+        with self._export_lock:
+            if self._worker is None and not self._closed:
+                self._worker = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Export every queued span now.
+        """
+        with self._export_lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                try:
+                    self.exporter.export(batch)
+                except Exception as e:
+                    logger.warning("Span export failed (%s spans dropped): %s", len(batch), e)
+
+    def shutdown(self):
+        self._closed = True
+        self._wake.set()
+        self.flush()
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def exporter_from_config(spec: str, service_name: str = "chatbot-backend") -> Optional[SpanExporter]:
+    """
+    Exporter from a TRACE_EXPORTER value: "" or "none" (tracing off), "memory",
+    "file:<path>" (e.g. file:/dev/stderr) or "otlp:<collector url>".
+    """
+    spec = (spec or "").strip()
+    if spec in ("", "none"):
+        return None
+    if spec == "memory":
+        return InMemoryExporter()
+    if spec.startswith("file:"):
+        return FileExporter(spec[len("file:"):], service_name)
+    if spec.startswith("otlp:"):
+        return OTLPHttpExporter(spec[len("otlp:"):], service_name)
+    raise ValueError(f"Unknown trace exporter: {spec}")
+
+
+_tracer = Tracer()
+
+
+def configure_tracing(exporter: Optional[SpanExporter], sample_ratio: float = 1.0, **kwargs) -> Tracer:
+    """
+    Replace the process-wide tracer (used by span(), current_span() and inject()).
+    """
+    global _tracer
+    previous, _tracer = _tracer, Tracer(exporter, sample_ratio, **kwargs)
+    previous.shutdown()
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def span(name: str, attributes: Optional[Dict[str, Any]] = None, kind: str = "internal",
+         parent: Optional[SpanContext] = None):
+    """
+    Context manager: a span under the current one, using the process-wide tracer.
+    """
+    return _tracer.span(name, attributes, kind, parent)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def inject(headers: Dict[str, str]) -> Dict[str, str]:
+    """
+    Add the current trace context to outgoing request headers.
+    """
+    current = _current_span.get()
+    if current is not None:
+        headers["traceparent"] = current.traceparent()
+    return headers
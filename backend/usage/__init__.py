@@ -0,0 +1 @@
+# usage package
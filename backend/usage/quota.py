@@ -0,0 +1,207 @@
+"""
+Per-user and per-tenant LLM budgets: tokens per UTC day and cost (USD) per UTC month.
+
+QuotaManager checks a call against the cached totals of UsageTracker (no database
+read on the hot path) before any provider is called:
+- the call's estimate is its prompt tokens plus `output_estimate` response tokens,
+  priced with the provider's rates;
+- a call is denied when used + in flight + estimate would exceed a limit of the user
+  or of their tenant (QuotaExceededError, answered with a 429 by the API);
+- an admitted call holds a reservation for its estimate until it finishes, so
+  concurrent calls cannot overrun the budget together. The orchestrator records the
+  actual usage and then releases the reservation (reconciliation).
+
+Budgets come from the defaults (per scope) and per-subject overrides:
+{"user:<id>": {"tokens_per_day": int, "cost_per_month": float}, "tenant:<id>": {...}}
+as inline JSON or a JSON file. A limit of 0 / None is unlimited.
+"""
+import json
+import os
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from .tracker import QuotaStatus, UsageTracker, UsageTotals, seconds_until_reset
+
+SCOPES = ("user", "tenant")
+
+
+class Budget(NamedTuple):
+    tokens_per_day: Optional[int] = None
+    cost_per_month: Optional[float] = None
+
+    @property
+    def unlimited(self) -> bool:
+        return not self.tokens_per_day and not self.cost_per_month
+
+
+class SubjectQuota(NamedTuple):
+    scope: str  # "user" or "tenant"
+    key: str
+    budget: Budget
+    status: QuotaStatus  # remaining values are after in-flight reservations, before this call
+
+
+class QuotaDecision(NamedTuple):
+    allowed: bool
+    subjects: List[SubjectQuota]
+    tokens: int  # estimate reserved for the call
+    cost: float
+    denied: Optional[SubjectQuota] = None
+
+
+class QuotaExceededError(RuntimeError):
+    """
+    Raised when a call would exceed a user or tenant budget. Maps to HTTP 429;
+    retry_after is the time until the exhausted budget resets.
+    """
+    def __init__(self, message: str, decision: QuotaDecision, retry_after: int):
+        super().__init__(message)
+        self.decision = decision
+        self.retry_after = retry_after
+
+
+def parse_budgets(value: Union[str, dict, None]) -> Dict[str, Budget]:
+    """
+    Budget overrides from inline JSON, a JSON file or a dict, keyed "user:<id>" / "tenant:<id>".
+    """
+    if not value:
+        return {}
+    if isinstance(value, str):
+        if os.path.isfile(value):
+            with open(value, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        else:
+            value = json.loads(value)
+    budgets = {}
+    for subject, limits in value.items():
+        scope = subject.split(":", 1)[0]
+        if scope not in SCOPES or ":" not in subject:
+            raise ValueError(f"Invalid quota subject {subject!r} (expected user:<id> or tenant:<id>)")
+        budgets[subject] = Budget(limits.get("tokens_per_day"), limits.get("cost_per_month"))
+    return budgets
+
+
+def quota_headers(decision: QuotaDecision) -> Dict[str, str]:
+    """
+    X-Quota-* headers for the tightest applicable budget, plus Retry-After when denied.
+    """
+    headers = {}
+    tokens = [s for s in decision.subjects if s.status.remaining_tokens is not None]
+    if tokens:
+        tightest = min(tokens, key=lambda s: s.status.remaining_tokens)
+        headers["X-Quota-Tokens-Limit"] = str(tightest.budget.tokens_per_day)
+        headers["X-Quota-Tokens-Remaining"] = str(tightest.status.remaining_tokens)
+        headers["X-Quota-Tokens-Reset"] = str(seconds_until_reset("day"))
+    costs = [s for s in decision.subjects if s.status.remaining_cost is not None]
+    if costs:
+        tightest = min(costs, key=lambda s: s.status.remaining_cost)
+        headers["X-Quota-Cost-Limit"] = f"{tightest.budget.cost_per_month:.6g}"
+        headers["X-Quota-Cost-Remaining"] = f"{tightest.status.remaining_cost:.6f}"
+        headers["X-Quota-Cost-Reset"] = str(seconds_until_reset("month"))
+    if decision.denied is not None:
+        headers["X-Quota-Scope"] = decision.denied.scope
+        headers["Retry-After"] = str(_retry_after(decision))
+    return headers
+
+
+def _retry_after(decision: QuotaDecision) -> int:
+    status = decision.denied.status
+    # Only the monthly cost budget blocks past midnight
+    if status.remaining_cost is not None and status.remaining_cost < decision.cost:
+        return seconds_until_reset("month")
+    return seconds_until_reset("day")
+
+
+class QuotaManager:
+    """
+    Budget checks and in-flight reservations on top of a UsageTracker; see the module docstring.
+    """
+    def __init__(self, tracker: UsageTracker, user_budget: Budget = Budget(), tenant_budget: Budget = Budget(),
+                 overrides: Optional[Dict[str, Budget]] = None, output_estimate: int = 512):
+        self.tracker = tracker
+        self.defaults = {"user": user_budget, "tenant": tenant_budget}
+        self.overrides = overrides or {}
+        self.output_estimate = output_estimate
+        self._reserved: Dict[Tuple[str, str], List[float]] = {}  # (scope, key) -> [tokens, cost] in flight
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return not all(b.unlimited for b in self.defaults.values()) or bool(self.overrides)
+
+    def budget(self, scope: str, key: str) -> Budget:
+        return self.overrides.get(f"{scope}:{key}", self.defaults[scope])
+
+    def estimate(self, provider, prompt: str) -> Tuple[int, float]:
+        """
+        Tokens and cost to reserve for a call before its output is known.
+        """
+        prompt_tokens = provider.count_tokens(prompt)
+        return prompt_tokens + self.output_estimate, provider.estimate_cost(prompt_tokens, self.output_estimate)
+
+    def _subjects(self, user_id: str, tenant_id: Optional[str]) -> List[Tuple[str, str, Budget]]:
+        subjects = [("user", user_id, self.budget("user", user_id))]
+        if tenant_id:
+            subjects.append(("tenant", tenant_id, self.budget("tenant", tenant_id)))
+        return [s for s in subjects if not s[2].unlimited]
+
+    def _decide(self, subjects, totals, tokens: int, cost: float) -> QuotaDecision:
+        checked, denied = [], None
+        with self._lock:
+            for (scope, key, budget), (today, month) in zip(subjects, totals):
+                in_flight = self._reserved.get((scope, key), (0, 0.0))
+                today = UsageTotals(today.requests, today.prompt_tokens + int(in_flight[0]), today.completion_tokens)
+                month = UsageTotals(month.requests, month.prompt_tokens, month.completion_tokens,
+                                    month.cost + in_flight[1])
+                status = UsageTracker.quota(today, month, budget.tokens_per_day, budget.cost_per_month)
+                subject = SubjectQuota(scope, key, budget, status)
+                checked.append(subject)
+                over = (status.remaining_tokens is not None and status.remaining_tokens < tokens) or \
+                       (status.remaining_cost is not None and status.remaining_cost < cost) or not status.allowed
+                if over and denied is None:
+                    denied = subject
+        return QuotaDecision(denied is None, checked, tokens, cost, denied)
+
+    def check(self, user_id: str, tenant_id: Optional[str] = None, tokens: int = 0, cost: float = 0.0) -> QuotaDecision:
+        """
+        Would a call of this size fit in the user's and tenant's budgets? Reserves nothing.
+        """
+        subjects = self._subjects(user_id, tenant_id)
+        totals = [self.tracker.totals(scope, key) for scope, key, _ in subjects]
+        return self._decide(subjects, totals, tokens, cost)
+
+    async def acheck(self, user_id: str, tenant_id: Optional[str] = None, tokens: int = 0,
+                     cost: float = 0.0) -> QuotaDecision:
+        subjects = self._subjects(user_id, tenant_id)
+        totals = [await self.tracker.atotals(scope, key) for scope, key, _ in subjects]
+        return self._decide(subjects, totals, tokens, cost)
+
+    def reserve(self, decision: QuotaDecision) -> QuotaDecision:
+        """
+        Hold a checked call's estimate until release(); raises QuotaExceededError if it was denied.
+        """
+        if not decision.allowed:
+            denied = decision.denied
+            raise QuotaExceededError(f"Quota exceeded for {denied.scope} {denied.key}", decision,
+                                     _retry_after(decision))
+        with self._lock:
+            for subject in decision.subjects:
+                reserved = self._reserved.setdefault((subject.scope, subject.key), [0, 0.0])
+                reserved[0] += decision.tokens
+                reserved[1] += decision.cost
+        return decision
+
+    def release(self, decision: QuotaDecision):
+        """
+        Drop a reservation once the call's actual usage has been recorded (or it failed).
+        """
+        with self._lock:
+            for subject in decision.subjects:
+                key = (subject.scope, subject.key)
+                reserved = self._reserved.get(key)
+                if reserved is None:
+                    continue
+                reserved[0] -= decision.tokens
+                reserved[1] -= decision.cost
+                if reserved[0] <= 0:
+                    del self._reserved[key]
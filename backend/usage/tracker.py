@@ -0,0 +1,416 @@
+"""
+Usage accounting: one record per LLM call (prompt and completion tokens, cost),
+written in bulk off the request path, plus per-user (and per-tenant) daily rollups
+for quota checks.
+
+UsageTracker.record() never touches the database: the record is appended to an
+in-memory buffer and added to the user's running total for the day. A background
+task (start()/stop()) flushes the buffer every `flush_interval` seconds, or as soon
+as `batch_size` records are waiting, from a worker thread:
+- insert_many of the raw records into the usage collection;
+- one $inc upsert per user and day in the batch into the daily collection
+  ({_id: "<user>:<YYYY-MM-DD>", user_id, day, requests, prompt_tokens,
+  completion_tokens, tokens, cost}), and per tenant and day into the tenant
+  collection (same shape, keyed by tenant_id) when one is configured.
+A failed flush is held back and retried as it was, under the same flush id, before
+anything newer is written. Retrying is idempotent: records inserted by the failed
+attempt are duplicate keys, and each rollup upsert only applies if the flush id is
+not among the rollup's recent `flushes`. While a batch is held, records beyond
+`max_buffer` are dropped (oldest first) and counted.
+
+totals(), usage_today() and check() read the running totals (today and this month)
+from memory, so a quota check is a dict lookup. A user's or tenant's totals are
+loaded from the month's daily rollups the first time they are needed and reloaded
+every `refresh_interval` seconds, which picks up the usage recorded by other workers.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+# Flush ids kept per rollup document: far more than the flushes that can be in retry at once
+APPLIED_FLUSHES = 32
+
+
+class UsageTotals:
+    """
+    Running totals for one user and day.
+    """
+    __slots__ = ("requests", "prompt_tokens", "completion_tokens", "cost")
+
+    def __init__(self, requests: int = 0, prompt_tokens: int = 0, completion_tokens: int = 0, cost: float = 0.0):
+        self.requests = requests
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cost = cost
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, other: "UsageTotals", sign: int = 1):
+        self.requests += sign * other.requests
+        self.prompt_tokens += sign * other.prompt_tokens
+        self.completion_tokens += sign * other.completion_tokens
+        self.cost += sign * other.cost
+
+    def copy(self) -> "UsageTotals":
+        return UsageTotals(self.requests, self.prompt_tokens, self.completion_tokens, self.cost)
+
+    def to_dict(self) -> dict:
+        return {"requests": self.requests, "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens, "tokens": self.tokens, "cost": round(self.cost, 6)}
+
+
+class QuotaStatus(NamedTuple):
+    allowed: bool
+    used_tokens: int  # today
+    used_cost: float  # this month
+    remaining_tokens: Optional[int]  # None when there is no token limit
+    remaining_cost: Optional[float]  # None when there is no cost limit
+
+
+def usage_day(timestamp: Optional[float] = None) -> str:
+    """
+    UTC day ("YYYY-MM-DD") a timestamp is accounted to.
+    """
+    return datetime.fromtimestamp(time.time() if timestamp is None else timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+def seconds_until_reset(period: str, timestamp: Optional[float] = None) -> int:
+    """
+    Seconds until the current UTC "day" or "month" ends.
+    """
+    now = datetime.fromtimestamp(time.time() if timestamp is None else timestamp, timezone.utc)
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "day":
+        end = start + timedelta(days=1)
+    else:
+        end = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return max(1, math.ceil((end - now).total_seconds()))
+
+
+def _totals_of(doc: dict) -> UsageTotals:
+    return UsageTotals(1, doc["prompt_tokens"], doc["completion_tokens"], doc["cost"])
+
+
+class _CachedTotal:
+    __slots__ = ("day", "today", "month", "fetched_at")
+
+    def __init__(self, day: str, today: UsageTotals, month: UsageTotals, fetched_at: float):
+        self.day = day
+        self.today = today
+        self.month = month
+        self.fetched_at = fetched_at
+
+    def add(self, day: str, usage: UsageTotals):
+        if day == self.day:
+            self.today.add(usage)
+        if day[:7] == self.day[:7]:
+            self.month.add(usage)
+
+
+class UsageTracker:
+    """
+    Buffered usage writer and per-user daily totals; see the module docstring.
+    """
+    def __init__(self, collection, daily_collection, batch_size: int = 500, flush_interval: float = 1.0,
+                 max_buffer: int = 100_000, refresh_interval: float = 30.0, max_users: int = 100_000,
+                 tenant_collection=None):
+        self.collection = collection
+        self.daily_collection = daily_collection
+        self.tenant_collection = tenant_collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.refresh_interval = refresh_interval
+        self.max_users = max_users
+        self.dropped = 0
+        self._buffer: deque = deque()
+        self._held: Optional[Tuple[str, List[dict]]] = None  # (flush id, records) of a failed flush
+        self._unflushed: Dict[Tuple[str, str, str], UsageTotals] = {}  # (scope, key, day) -> not yet written
+        self._totals: "OrderedDict[Tuple[str, str], _CachedTotal]" = OrderedDict()  # (scope, key)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._wake_pending = False
+        self._task: Optional[asyncio.Task] = None
+
+    def ensure_indexes(self):
+        self.collection.create_index([("user_id", ASCENDING), ("timestamp", ASCENDING)])
+        self.daily_collection.create_index([("user_id", ASCENDING), ("day", ASCENDING)])
+        if self.tenant_collection is not None:
+            self.tenant_collection.create_index([("tenant_id", ASCENDING), ("day", ASCENDING)])
+
+    def _rollup(self, scope: str):
+        # (collection, key field) holding the daily rollups of a scope
+        if scope == "tenant":
+            return self.tenant_collection, "tenant_id"
+        return self.daily_collection, "user_id"
+
+    def _subjects(self, doc: dict) -> List[Tuple[str, str]]:
+        subjects = [("user", doc["user_id"])]
+        if doc.get("tenant_id") and self.tenant_collection is not None:
+            subjects.append(("tenant", doc["tenant_id"]))
+        return subjects
+
+    # --- Recording ---
+    def record(self, user_id: str, provider: str, prompt_tokens: int, completion_tokens: int, cost: float,
+               query_type: Optional[str] = None, timestamp: Optional[float] = None, tenant_id: Optional[str] = None):
+        """
+        Account one call. Cheap and safe from any thread; the write happens later.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        day = usage_day(timestamp)
+        doc = {
+            "user_id": user_id,
+            "tenant_id": tenant_id,
+            "provider": provider,
+            "query_type": query_type,
+            "tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": cost,
+            "day": day,
+            "timestamp": timestamp,
+        }
+        usage = _totals_of(doc)
+        with self._lock:
+            self._buffer.append(doc)
+            if self._buffered() > self.max_buffer and self._buffer:
+                self._discard(self._buffer.popleft())
+            for scope, key in self._subjects(doc):
+                self._unflushed.setdefault((scope, key, day), UsageTotals()).add(usage)
+                cached = self._totals.get((scope, key))
+                if cached is not None:
+                    cached.add(day, usage)
+            wake = len(self._buffer) >= self.batch_size and not self._wake_pending and self._loop is not None
+            if wake:
+                self._wake_pending = True
+        if wake:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _settle(self, doc: dict):
+        # Caller holds self._lock: the record is no longer waiting to be written
+        usage = _totals_of(doc)
+        for scope, key in self._subjects(doc):
+            pending = self._unflushed.get((scope, key, doc["day"]))
+            if pending is not None:
+                pending.add(usage, -1)
+                if pending.requests <= 0:
+                    del self._unflushed[(scope, key, doc["day"])]
+
+    def _discard(self, doc: dict):
+        # Caller holds self._lock. The record is lost, but cached totals still count it
+        self.dropped += 1
+        self._settle(doc)
+
+    def _buffered(self) -> int:
+        return len(self._buffer) + (len(self._held[1]) if self._held is not None else 0)
+
+    @property
+    def pending(self) -> int:
+        """
+        Usage records buffered and not written yet.
+        """
+        return self._buffered()
+
+    # --- Flushing ---
+    def flush_now(self) -> int:
+        """
+        Write everything buffered so far (blocking); returns the number of records written.
+        """
+        with self._flush_lock:
+            written = 0
+            if self._held is not None:
+                written = self._flush_batch(*self._held)
+                if not written:
+                    return 0
+            with self._lock:
+                batch = list(self._buffer)
+                self._buffer.clear()
+                self._wake_pending = False
+            if batch:
+                written += self._flush_batch(uuid.uuid4().hex, batch)
+            if self.dropped:
+                logger.warning("%s usage records dropped (buffer full)", self.dropped)
+                self.dropped = 0
+            return written
+
+    def _flush_batch(self, flush_id: str, batch: List[dict]) -> int:
+        # Caller holds self._flush_lock
+        try:
+            self._write(flush_id, batch)
+        except Exception as e:
+            logger.error("Usage flush failed (%s records, will retry): %s", len(batch), e)
+            with self._lock:
+                self._held = (flush_id, batch)
+                while self._buffered() > self.max_buffer and self._buffer:
+                    self._discard(self._buffer.popleft())
+            return 0
+        with self._lock:
+            self._held = None
+            for doc in batch:
+                self._settle(doc)
+        return len(batch)
+
+    def _write(self, flush_id: str, batch: List[dict]):
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Retried batches: records inserted by the failed attempt already exist
+            if any(err.get("code") != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+                raise
+        rollups: Dict[Tuple[str, str, str], UsageTotals] = {}
+        for doc in batch:
+            for scope, key in self._subjects(doc):
+                rollups.setdefault((scope, key, doc["day"]), UsageTotals()).add(_totals_of(doc))
+        # One upsert per user (tenant) and day in the batch, however many calls it holds.
+        # Guarded by the flush id, so the rollups a failed attempt applied are not applied twice
+        for (scope, key, day), t in rollups.items():
+            collection, field = self._rollup(scope)
+            try:
+                collection.update_one(
+                    {"_id": f"{key}:{day}", "flushes": {"$ne": flush_id}},
+                    {"$inc": {"requests": t.requests, "prompt_tokens": t.prompt_tokens,
+                              "completion_tokens": t.completion_tokens, "tokens": t.tokens, "cost": t.cost},
+                     "$push": {"flushes": {"$each": [flush_id], "$slice": -APPLIED_FLUSHES}},
+                     "$setOnInsert": {field: key, "day": day}},
+                    upsert=True)
+            except DuplicateKeyError:
+                pass  # the rollup exists and already has this flush: the upsert tried to insert it again
+
+    async def flush(self) -> int:
+        return await asyncio.to_thread(self.flush_now)
+
+    async def run(self):
+        """
+        Flush on a timer or when a batch is full, until cancelled.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self):
+        """
+        Start the background flusher on the running event loop.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """
+        Stop the flusher and write what is left.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+        await self.flush()
+
+    # --- Totals and quotas ---
+    def _load(self, scope: str, key: str, day: str) -> _CachedTotal:
+        collection, field = self._rollup(scope)
+        today, month = UsageTotals(), UsageTotals()
+        for doc in collection.find({field: key, "day": {"$gte": day[:7] + "-01", "$lte": day}}):
+            total = UsageTotals(doc.get("requests", 0), doc.get("prompt_tokens", 0),
+                                doc.get("completion_tokens", 0), doc.get("cost", 0.0))
+            month.add(total)
+            if doc["day"] == day:
+                today.add(total)
+        loaded = _CachedTotal(day, today, month, 0.0)
+        with self._lock:
+            for (s, k, d), pending in self._unflushed.items():
+                if s == scope and k == key:
+                    loaded.add(d, pending)
+        return loaded
+
+    def _cached(self, key: Tuple[str, str], day: str, now: float) -> Optional[Tuple[UsageTotals, UsageTotals]]:
+        with self._lock:
+            cached = self._totals.get(key)
+            if cached is None or cached.day != day or now - cached.fetched_at > self.refresh_interval:
+                return None
+            self._totals.move_to_end(key)
+            return cached.today.copy(), cached.month.copy()
+
+    def _store(self, key: Tuple[str, str], loaded: _CachedTotal, now: float) -> Tuple[UsageTotals, UsageTotals]:
+        loaded.fetched_at = now
+        with self._lock:
+            self._totals[key] = loaded
+            self._totals.move_to_end(key)
+            while len(self._totals) > self.max_users:
+                self._totals.popitem(last=False)
+            return loaded.today.copy(), loaded.month.copy()
+
+    def totals(self, scope: str, key: str) -> Tuple[UsageTotals, UsageTotals]:
+        """
+        (today, this month) totals of a "user" or "tenant", UTC; the rollups are read at most
+        once per refresh_interval.
+        """
+        day, now = usage_day(), time.monotonic()
+        totals = self._cached((scope, key), day, now)
+        if totals is None:
+            totals = self._store((scope, key), self._load(scope, key, day), now)
+        return totals
+
+    async def atotals(self, scope: str, key: str) -> Tuple[UsageTotals, UsageTotals]:
+        """
+        totals() for the event loop: a rollup reload runs in a worker thread.
+        """
+        day, now = usage_day(), time.monotonic()
+        totals = self._cached((scope, key), day, now)
+        if totals is None:
+            totals = self._store((scope, key), await asyncio.to_thread(self._load, scope, key, day), now)
+        return totals
+
+    def usage_today(self, user_id: str) -> UsageTotals:
+        """
+        The user's totals for the current UTC day.
+        """
+        return self.totals("user", user_id)[0]
+
+    async def ausage_today(self, user_id: str) -> UsageTotals:
+        return (await self.atotals("user", user_id))[0]
+
+    @staticmethod
+    def quota(today: UsageTotals, month: UsageTotals, max_tokens: Optional[int] = None,
+              max_cost: Optional[float] = None) -> QuotaStatus:
+        """
+        Compare totals with optional limits (None or 0 = unlimited): tokens per day, cost per month.
+        """
+        remaining_tokens = max(0, max_tokens - today.tokens) if max_tokens else None
+        remaining_cost = max(0.0, max_cost - month.cost) if max_cost else None
+        allowed = (remaining_tokens is None or remaining_tokens > 0) and (remaining_cost is None or remaining_cost > 0)
+        return QuotaStatus(allowed, today.tokens, month.cost, remaining_tokens, remaining_cost)
+
+    def check(self, user_id: str, max_tokens: Optional[int] = None, max_cost: Optional[float] = None) -> QuotaStatus:
+        return self.quota(*self.totals("user", user_id), max_tokens, max_cost)
+
+    async def acheck(self, user_id: str, max_tokens: Optional[int] = None,
+                     max_cost: Optional[float] = None) -> QuotaStatus:
+        return self.quota(*(await self.atotals("user", user_id)), max_tokens, max_cost)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"buffered": self._buffered(), "users_cached": len(self._totals), "dropped": self.dropped}
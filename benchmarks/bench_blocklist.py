@@ -0,0 +1,59 @@
+"""
+Blocklist matcher benchmark: per-message scan cost and automaton memory as the
+list grows from 10 to 100k terms.
+
+    python -m benchmarks.bench_blocklist [--messages 2000]
+
+Per-message cost should stay flat across list sizes (the scan is linear in the
+message length); build time and automaton size grow with the number of trie nodes.
+"""
+import argparse
+import random
+import string
+import sys
+import time
+
+from backend.preprocessor.blocklist import Blocklist
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+
+
+def random_terms(count: int, rng: random.Random):
+    terms = set()
+    while len(terms) < count:
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+        if rng.random() < 0.1:
+            word += " " + "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 7)))
+        terms.add(word)
+    return sorted(terms)
+
+
+def random_messages(count: int, rng: random.Random):
+    words = ["the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog", "hello", "server",
+             "b4dw0rd", "data", "please", "explain", "this", "function", "error", "thanks"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(10, 60))) for _ in range(count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+    messages = random_messages(args.messages, rng)
+    print(f"{'terms':>8} {'build s':>9} {'automaton KiB':>14} {'us/msg':>8}")
+    for size in SIZES:
+        terms = random_terms(size, rng) + ["badword"]
+        start = time.perf_counter()
+        blocklist = Blocklist(terms)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        for message in messages:
+            blocklist.find_all(message)
+        per_message = (time.perf_counter() - start) / len(messages) * 1e6
+        print(f"{size:>8} {build:>9.2f} {blocklist.nbytes / 1024:>14.0f} {per_message:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+End-to-end load scenarios against the FastAPI app, fully offline: Mongo is replaced
+by mongomock (in process) and the LLM by MockLLMProvider with a configurable
+latency and streaming rate, or by the simulated provider (providers/simulated.py,
+configured with the SIM_* environment variables) for realistic latency
+distributions and injected failures. Requests go through httpx's ASGI transport, so the
+middleware, routing, validation and the whole chat/context pipeline run as in
+production, without sockets.
+
+Each scenario sends `requests` requests with at most `concurrency` in flight and
+reports the per-request latency distribution and the overall throughput.
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+from functools import partial
+from typing import Awaitable, Callable, Dict, List
+
+from .bench_micro import ANSWER, MESSAGE, random_document
+from .harness import Result, summarize
+
+SCENARIOS = ("chat_message", "chat_stream", "context_upload", "context_search")
+USERS = 50
+
+
+def offline_app(latency: float = 0.05, chunk_size: int = 16, chunk_delay: float = 0.005, provider: str = "mock"):
+    """
+    Import backend.main wired to mongomock and `provider`: "mock" (a MockLLMProvider
+    answering ANSWER with the given timing) or "simulated". Must run before anything else imports backend.main (the settings and the Mongo
+    client are created at import time).
+    """
+    import mongomock
+    import pymongo
+
+    os.environ.update({
+        "LLM_PROVIDER": provider,
+        "RATE_LIMIT_BACKEND": "memory",
+        "RATE_LIMIT_COUNT": str(10 ** 9),
+        "LOG_LEVEL": "ERROR",  # slow-request warnings would flood the output
+        "TRACE_EXPORTER": "",
+    })
+    pymongo.MongoClient = mongomock.MongoClient
+    from backend.orchestrator.orchestrator import PROVIDER_REGISTRY
+    from backend.providers.mock import MockLLMProvider
+    PROVIDER_REGISTRY["mock"] = partial(MockLLMProvider, latency=latency, chunk_size=chunk_size,
+                                        chunk_delay=chunk_delay, response=ANSWER)
+    from backend import main
+    main.UPLOAD_FOLDER = tempfile.mkdtemp(prefix="bench_uploads_")
+    return main
+
+
+async def drive(request: Callable[[int], Awaitable[None]], requests: int, concurrency: int) -> Result:
+    """
+    Run request(i) for i in range(requests), `concurrency` at a time.
+    """
+    samples: List[float] = []
+    next_index = iter(range(requests))
+
+    async def worker():
+        for i in next_index:
+            begin = time.perf_counter()
+            await request(i)
+            samples.append(time.perf_counter() - begin)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples, time.perf_counter() - start)
+
+
+def _check(response, expected: int = 200):
+    if response.status_code != expected:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path} returned "
+                           f"{response.status_code}: {response.text[:200]}")
+
+
+async def run_scenarios(main, scenarios=SCENARIOS, requests: int = 200, concurrency: int = 16,
+                        seed: int = 5) -> Dict[str, Result]:
+    import httpx
+
+    rng = random.Random(seed)
+    documents = [random_document(800, rng) for _ in range(8)]
+    transport = httpx.ASGITransport(app=main.app)
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def chat_message(i):
+                _check(await client.post("/api/chat/message", json={"user_id": f"bench{i % USERS}", "text": MESSAGE}))
+
+            async def chat_stream(i):
+                async with client.stream("POST", "/api/chat/message",
+                                         json={"user_id": f"bench{i % USERS}", "text": MESSAGE, "stream": True}) as r:
+                    _check(r)
+                    async for _ in r.aiter_lines():
+                        pass
+
+            async def context_upload(i):
+                files = {"file": (f"notes{i % 8}.txt", documents[i % 8].encode(), "text/plain")}
+                _check(await client.post("/api/context/upload", data={"user_id": f"bench{i % USERS}"}, files=files))
+
+            async def context_search(i):
+                query = " ".join(rng.sample(documents[i % 8].split(), 4))
+                _check(await client.post("/api/context/search", json={"user_id": f"bench{i % USERS}", "query": query}))
+
+            requests_by_name = {"chat_message": chat_message, "chat_stream": chat_stream,
+                                "context_upload": context_upload, "context_search": context_search}
+            for name in scenarios:
+                if name == "context_search":
+                    # The same indexed documents whatever ran before: one upload per user
+                    main.context_collection.delete_many({})
+                    await drive(context_upload, USERS, concurrency)
+                await drive(requests_by_name[name], min(requests, 10), concurrency)  # warm-up
+                results[f"load.{name}"] = await drive(requests_by_name[name], requests, concurrency)
+    return results
@@ -0,0 +1,96 @@
+"""
+Microbenchmarks for the per-request building blocks, timed call by call:
+sanitizer, screening, chunking, keyword indexing, search scoring, markdown
+rendering and the full postprocessing pipeline.
+
+Search and indexing run against mongomock (in process), so they time the query
+construction and result handling, not a real Mongo server.
+"""
+import random
+from typing import Callable, Dict
+
+from backend.context.indexer import chunk_text, index_chunks, search_chunks
+from backend.postprocessor.pipeline import chat_pipeline
+from backend.postprocessor.render import get_renderer
+from backend.preprocessor.core import sanitize_input, screen_text
+
+from .harness import Result, measure
+
+WORDS = ["the", "server", "returns", "an", "error", "when", "the", "request", "body", "is", "empty",
+         "python", "function", "database", "index", "query", "latency", "cache", "token", "response",
+         "please", "explain", "how", "to", "configure", "retry", "policy", "for", "uploads", "paris"]
+
+MESSAGE = ("Hi! Can you <b>explain</b> why my <i>FastAPI</i> endpoint returns 500 when the body is "
+           "empty &amp; how to fix it? I tried adding a default value but it still fails.")
+
+ANSWER = """## Fixing the empty body error
+
+FastAPI validates the body **before** your handler runs, so an empty body fails with a 422 or,
+behind some proxies, a 500. Give the parameter a default:
+
+```python
+from fastapi import Body
+
+@app.post("/items")
+async def create_item(payload: dict = Body(default={})):
+    if not payload:
+        return {"detail": "empty body"}
+    return {"ok": True}
+```
+
+- Check the `Content-Type` header is `application/json`.
+- See [the docs](https://fastapi.tiangolo.com/tutorial/body/) for details.
+
+| Case | Status |
+|------|--------|
+| empty body | 422 |
+| valid JSON | 200 |
+"""
+
+# Cases going through the Mongo stand-in, which is much slower per call: fewer iterations
+STAND_IN_CASES = {"micro.index_chunks", "micro.search_chunks"}
+
+
+def random_document(words: int, rng: random.Random) -> str:
+    sentences, current = [], []
+    for _ in range(words):
+        current.append(rng.choice(WORDS))
+        if len(current) >= rng.randint(6, 18):
+            sentences.append(" ".join(current).capitalize() + ".")
+            current = []
+    return " ".join(sentences)
+
+
+def cases(seed: int = 3) -> Dict[str, Callable[[], object]]:
+    """
+    {benchmark name: zero-argument callable}.
+    """
+    import mongomock
+
+    rng = random.Random(seed)
+    document = random_document(2000, rng)
+    chunks = chunk_text(document)
+    collection = mongomock.MongoClient().bench.context_chunks
+    for user in range(20):
+        index_chunks(chunk_text(random_document(1000, rng)), f"doc{user}.txt", f"user{user}", collection)
+    index_target = mongomock.MongoClient().bench.index_target
+    renderer = get_renderer()
+    pipeline = chat_pipeline()
+    return {
+        "micro.sanitize_input": lambda: sanitize_input(MESSAGE),
+        "micro.screen_text": lambda: screen_text(MESSAGE),
+        "micro.chunk_text_12kb": lambda: chunk_text(document),
+        "micro.index_chunks": lambda: (index_chunks(chunks, "doc.txt", "indexer", index_target),
+                                       index_target.delete_many({})),
+        "micro.search_chunks": lambda: search_chunks("how to configure the retry policy", "user7", collection),
+        "micro.render_markdown": lambda: renderer.render(ANSWER),
+        "micro.postprocess_pipeline": lambda: pipeline.run(ANSWER, provider="mock", query_type="qa"),
+    }
+
+
+def run(iterations: int = 500, seed: int = 3) -> Dict[str, Result]:
+    results = {}
+    for name, fn in cases(seed).items():
+        count = max(20, iterations // 10) if name in STAND_IN_CASES else iterations
+        results[name] = measure(fn, count)
+    return results
@@ -0,0 +1,137 @@
+"""
+Sanitizer fuzz and complexity harness.
+
+    python -m benchmarks.bench_sanitizer [--fuzz 20000] [--max-size 128000]
+
+1. Fuzz: random markup-heavy inputs must give the same output however they are
+   split into chunks, must never leave a complete "<...>" in the output, and must
+   match the legacy regex sanitizer wherever its semantics apply (no entities,
+   script/style elements or comments).
+2. Complexity: adversarial inputs (unclosed "<", repeated "<script>", partial
+   closing tags, nested entities, ...) are timed at doubling sizes. Linear code
+   roughly doubles its time per step; the exit status is non-zero if any family
+   grows by more than --max-ratio per doubling. The legacy regexes are timed on
+   the smaller sizes for comparison.
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from html import unescape
+
+from backend.preprocessor.sanitizer import HtmlSanitizer, sanitize_html
+
+LEGACY_SCRIPT_TAG_RE = re.compile(r"<script.*?>.*?</script>", re.IGNORECASE | re.DOTALL)
+LEGACY_HTML_TAG_RE = re.compile(r"<.*?>", re.DOTALL)
+
+FUZZ_TOKENS = ["<", ">", "/", " ", "a", "b", "\n", "<b>", "</b>", "<script>", "</script>", "<SCRIPT ",
+               "</scr", "ipt>", "<style>", "</style>", "<!--", "-->", "-", "&", "&lt;", "&gt;", "&amp;",
+               "lt;", "#60;", "&#", "x3c;", ";", "é", "​"]
+
+# Tags and entities without script/style/comment openers, which would swallow the rest
+MIXED_TOKENS = ["<", ">", "</", "a", " ", "&", "&amp;", "&lt;", "<b", "lt;"]
+
+ADVERSARIAL = {
+    "unclosed_lt": lambda n: "<" * n,
+    "unclosed_tags": lambda n: "<a " * (n // 3),
+    "open_scripts": lambda n: "<script>" * (n // 8),
+    "partial_close": lambda n: "<script>" + "</scrip" * (n // 7),
+    "open_comments": lambda n: "<!--" * (n // 4),
+    "comment_dashes": lambda n: "<!--" + "-" * n,
+    "nested_entities": lambda n: "&amp;" * (n // 5),
+    "bare_ampersands": lambda n: "&" * n,
+    "long_entity_names": lambda n: ("&" + "a" * 39) * (n // 40),
+    "mixed": lambda n: "".join(random.Random(0).choice(MIXED_TOKENS) for _ in range(n // 3)),
+}
+
+
+def legacy_sanitize(text: str) -> str:
+    text = unescape(text)
+    text = LEGACY_SCRIPT_TAG_RE.sub("", text)
+    text = LEGACY_HTML_TAG_RE.sub("", text)
+    return text
+
+
+def chunked(text: str, rng: random.Random) -> str:
+    sanitizer = HtmlSanitizer()
+    out, i = [], 0
+    while i < len(text):
+        step = rng.randint(1, 8)
+        out.append(sanitizer.feed(text[i:i + step]))
+        i += step
+    out.append(sanitizer.close())
+    return "".join(out)
+
+
+def has_complete_tag(text: str) -> bool:
+    lt = text.find("<")
+    return lt >= 0 and text.find(">", lt) >= 0
+
+
+def fuzz(samples: int, seed: int) -> int:
+    rng = random.Random(seed)
+    failures = 0
+    compared = 0
+    for _ in range(samples):
+        text = "".join(rng.choice(FUZZ_TOKENS) for _ in range(rng.randint(0, 40)))
+        whole = sanitize_html(text)
+        problems = []
+        if chunked(text, rng) != whole:
+            problems.append("chunking changes output")
+        if has_complete_tag(whole):
+            problems.append("complete tag left in output")
+        if not re.search(r"&|<script|<style|<!--", text, re.IGNORECASE):
+            compared += 1
+            if legacy_sanitize(text) != whole:
+                problems.append("differs from legacy sanitizer")
+        if problems:
+            failures += 1
+            if failures <= 10:
+                print(f"FAIL {text!r} -> {whole!r}: {', '.join(problems)}")
+    print(f"fuzz: {samples} samples, {compared} compared with legacy, {failures} failures")
+    return failures
+
+
+def timed(fn, text: str) -> float:
+    start = time.perf_counter()
+    fn(text)
+    return time.perf_counter() - start
+
+
+def complexity(max_size: int, max_ratio: float, legacy_max: int) -> int:
+    sizes = []
+    size = 1000
+    while size <= max_size:
+        sizes.append(size)
+        size *= 2
+    print(f"{'input':<18} " + " ".join(f"{s:>9}" for s in sizes) + "  worst ratio")
+    bad = 0
+    for name, make in ADVERSARIAL.items():
+        times = [min(timed(sanitize_html, make(s)) for _ in range(3)) for s in sizes]
+        # Ignore timer noise on the tiny sizes
+        ratios = [b / a for a, b in zip(times, times[1:]) if a > 1e-4]
+        worst = max(ratios, default=0.0)
+        flag = "  <-- superlinear" if worst > max_ratio else ""
+        bad += bool(flag)
+        print(f"{name:<18} " + " ".join(f"{t * 1000:>7.2f}ms" for t in times) + f"  {worst:>5.2f}{flag}")
+        legacy = [timed(legacy_sanitize, make(s)) for s in sizes if s <= legacy_max]
+        print(f"{'  legacy regex':<18} " + " ".join(f"{t * 1000:>7.2f}ms" for t in legacy))
+    return bad
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fuzz", type=int, default=20000, help="number of fuzz samples")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-size", type=int, default=128000, help="largest adversarial input (chars)")
+    parser.add_argument("--max-ratio", type=float, default=3.0, help="allowed time growth per size doubling")
+    parser.add_argument("--legacy-max", type=int, default=8000, help="largest input timed with the legacy regexes")
+    args = parser.parse_args(argv)
+    failures = fuzz(args.fuzz, args.seed)
+    superlinear = complexity(args.max_size, args.max_ratio, args.legacy_max)
+    return 1 if failures or superlinear else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
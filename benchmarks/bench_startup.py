@@ -0,0 +1,137 @@
+"""
+Startup profile: how long a fresh worker takes to import backend.main and to become
+ready, and which imports that time goes to.
+
+Each run is a new interpreter started with `python -X importtime`, wired offline like
+the load scenarios (mongomock, mock provider; see bench_load.offline_app). It imports
+backend.main, runs the app's lifespan once and reports the app's own startup profile
+(telemetry/startup.py). Results, one sample per run:
+- startup.import: backend.main's import phase;
+- startup.ready: import plus lifespan, until the worker is ready;
+- startup.<phase>: each lifespan phase (database, preload, background);
+- startup.module.<name>: cumulative import time of the modules backend.main imports
+  directly, for the `top` slowest ones taking at least MIN_MODULE_MS.
+
+Importing backend.main must not import LAZY_MODULES (document parsers, Markdown,
+Pygments): those are loaded on first use or while the lifespan warms the caches.
+Any that are imported eagerly are reported, and make benchmarks.run fail.
+
+pymongo is imported by mongomock before backend.main, so it is not in the import phase.
+"""
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Tuple
+
+from .harness import Result, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ("PyPDF2", "docx", "markdown", "pygments")
+MARKER = "STARTUP_PROFILE "
+# Faster imports are left out: at a few milliseconds, run-to-run noise exceeds any tolerance
+MIN_MODULE_MS = 5.0
+
+# Same wiring as bench_load.offline_app, which is not imported here: the benchmark
+# modules import parts of the backend, which would then be missing from the profile
+CHILD = f"""
+import asyncio, json, os, sys, tempfile
+import mongomock, pymongo
+os.environ.update({{"LLM_PROVIDER": "mock", "RATE_LIMIT_BACKEND": "memory", "LOG_LEVEL": "ERROR",
+                   "TRACE_EXPORTER": ""}})
+pymongo.MongoClient = mongomock.MongoClient
+from backend import main
+main.UPLOAD_FOLDER = tempfile.mkdtemp(prefix="bench_uploads_")
+eager = sorted({{m.split(".")[0] for m in sys.modules}} & set({LAZY_MODULES!r}))
+async def lifespan():
+    async with main.app.router.lifespan_context(main.app):
+        pass
+asyncio.run(lifespan())
+print({MARKER!r} + json.dumps({{"profile": main.startup.to_dict(), "eager": eager}}))
+"""
+
+
+class ImportTime(NamedTuple):
+    level: int  # nesting depth in the import tree (0 = imported by the script itself)
+    name: str
+    self_us: int
+    cumulative_us: int
+
+
+def parse_importtime(stderr: str) -> List[ImportTime]:
+    """
+    The `-X importtime` lines of a process' stderr, in the order printed (children before their parent).
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header line
+        name = fields[2].rstrip()
+        indent = len(name) - len(name.lstrip(" "))
+        entries.append(ImportTime((indent - 1) // 2, name.strip(), int(fields[0]), int(fields[1])))
+    return entries
+
+
+def direct_imports(entries: List[ImportTime], parent: str) -> List[ImportTime]:
+    """
+    Modules first imported by `parent` itself (one level below it in the import tree).
+    """
+    for i, entry in enumerate(entries):
+        if entry.name == parent:
+            children = []
+            for child in reversed(entries[:i]):
+                if child.level <= entry.level:
+                    break
+                if child.level == entry.level + 1:
+                    children.append(child)
+            return children[::-1]
+    return []
+
+
+def profile_once() -> Tuple[dict, List[ImportTime], List[str]]:
+    """
+    Start one worker in a new interpreter: (startup profile, import times, eagerly imported lazy modules).
+    """
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD], cwd=ROOT, env=env,
+                          capture_output=True, text=True, timeout=120)
+    report = next((line[len(MARKER):] for line in proc.stdout.splitlines() if line.startswith(MARKER)), None)
+    if proc.returncode != 0 or report is None:
+        raise RuntimeError(f"startup profile failed (exit {proc.returncode}): {proc.stderr[-2000:]}")
+    report = json.loads(report)
+    return report["profile"], parse_importtime(proc.stderr), report["eager"]
+
+
+def run(runs: int = 5, top: int = 10) -> Tuple[Dict[str, Result], List[str]]:
+    """
+    Startup results over `runs` fresh workers, and the lazy modules backend.main imported eagerly.
+    """
+    samples: Dict[str, List[float]] = {}
+    eager = set()
+    for _ in range(runs):
+        profile, imports, eager_modules = profile_once()
+        eager.update(eager_modules)
+        samples.setdefault("startup.ready", []).append(profile["total_ms"] / 1000)
+        for phase, ms in profile["phases_ms"].items():
+            samples.setdefault(f"startup.{phase}", []).append(ms / 1000)
+        for entry in direct_imports(imports, "backend.main"):
+            samples.setdefault(f"startup.module.{entry.name}", []).append(entry.cumulative_us / 1e6)
+    modules = sorted((name for name in samples if name.startswith("startup.module.")
+                      and sum(samples[name]) / len(samples[name]) * 1000 >= MIN_MODULE_MS),
+                     key=lambda name: -sum(samples[name]))
+    keep = [name for name in samples if not name.startswith("startup.module.")] + modules[:top]
+    # Throughput is starts per second of that phase alone (1 / mean)
+    return {name: summarize(samples[name], sum(samples[name])) for name in keep}, sorted(eager)
+
+
+if __name__ == "__main__":
+    from .harness import format_table
+
+    results, eager = run()
+    print(format_table(results))
+    for module in eager:
+        print(f"EAGER IMPORT {module} (imported by backend.main, expected on first use)")
+    sys.exit(1 if eager else 0)
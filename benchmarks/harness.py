@@ -0,0 +1,114 @@
+"""
+Shared pieces of the benchmark suite (see benchmarks/run.py): timing, latency
+percentiles and the comparison against a stored baseline.
+
+A result is a dict of plain numbers so it can be written to and read from JSON:
+{"count", "seconds", "throughput" (ops/s), "mean", "p50", "p95", "p99" (ms)}.
+"""
+import json
+import math
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+Result = Dict[str, float]
+
+# Lower is better for latencies, higher for throughput
+LATENCY_KEYS = ("p50", "p95", "p99")
+DEFAULT_COMPARE = ("p50", "p95", "throughput")
+
+
+def percentile(sorted_samples: Sequence[float], q: float) -> float:
+    """
+    Nearest-rank percentile (q in 0..100) of already sorted samples.
+    """
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+def summarize(samples: List[float], seconds: float) -> Result:
+    """
+    Result for per-operation durations (seconds) measured over `seconds` of wall time.
+    """
+    ordered = sorted(samples)
+    ms = 1000.0
+    return {
+        "count": len(ordered),
+        "seconds": round(seconds, 4),
+        "throughput": round(len(ordered) / seconds, 2) if seconds > 0 else 0.0,
+        "mean": round(sum(ordered) / len(ordered) * ms, 4) if ordered else 0.0,
+        "p50": round(percentile(ordered, 50) * ms, 4),
+        "p95": round(percentile(ordered, 95) * ms, 4),
+        "p99": round(percentile(ordered, 99) * ms, 4),
+    }
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int = 10, rounds: int = 3) -> Result:
+    """
+    Time `iterations` sequential calls of fn, after `warmup` untimed ones. Repeated
+    `rounds` times, keeping the round with the lowest median: interference from the
+    rest of the machine only ever makes a round slower.
+    """
+    for _ in range(warmup):
+        fn()
+    best = None
+    for _ in range(rounds):
+        samples = []
+        start = time.perf_counter()
+        for _ in range(iterations):
+            begin = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - begin)
+        result = summarize(samples, time.perf_counter() - start)
+        if best is None or result["p50"] < best["p50"]:
+            best = result
+    return best
+
+
+def load_baseline(path: str) -> Dict[str, Result]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def save_baseline(path: str, results: Dict[str, Result], meta: Optional[dict] = None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta or {}, "results": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results: Dict[str, Result], baseline: Dict[str, Result], tolerance: float,
+            keys: Sequence[str] = DEFAULT_COMPARE) -> List[Tuple[str, str, float, float, float]]:
+    """
+    Regressions as (benchmark, key, baseline value, current value, change ratio):
+    latencies more than `tolerance` (e.g. 0.25 = 25%) above the baseline, throughput
+    more than `tolerance` below it. Benchmarks missing on either side are skipped.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in keys:
+            old, new = base.get(key), result.get(key)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            worse = change > tolerance if key in LATENCY_KEYS or key == "mean" else -change > tolerance
+            if worse:
+                regressions.append((name, key, old, new, change))
+    return regressions
+
+
+def format_table(results: Dict[str, Result], baseline: Optional[Dict[str, Result]] = None) -> str:
+    width = max([28, *map(len, results)])
+    lines = [f"{'benchmark':<{width}} {'count':>7} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+             + ("  p95 vs baseline" if baseline else "")]
+    for name, r in results.items():
+        line = (f"{name:<{width}} {r['count']:>7} {r['throughput']:>10.1f} {r['p50']:>9.3f} "
+                f"{r['p95']:>9.3f} {r['p99']:>9.3f}")
+        base = (baseline or {}).get(name)
+        if base and base.get("p95"):
+            line += f"  {(r['p95'] / base['p95'] - 1) * 100:>+7.1f}%"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,94 @@
+"""
+Benchmark suite: microbenchmarks, end-to-end load scenarios and the worker startup
+profile, fully offline (mongomock for Mongo, MockLLMProvider for the LLM), compared
+with a stored baseline.
+
+    python -m benchmarks.run [--suite micro|load|startup|all] [--baseline benchmarks/baseline.json]
+                             [--tolerance 0.25] [--update-baseline] [--json results.json]
+
+Prints throughput and p50/p95/p99 latency per benchmark. With a baseline, the exit
+status is non-zero when a p50/p95 latency is more than --tolerance above the
+baseline or a throughput more than --tolerance below it. Baselines are machine
+specific: record one (--update-baseline) on the machine that runs the comparison.
+The startup suite also fails when importing backend.main imports a module that should
+be loaded lazily (see bench_startup.LAZY_MODULES).
+"""
+import argparse
+import asyncio
+import os
+import platform
+import sys
+
+from . import bench_load, bench_micro, bench_startup
+from .harness import compare, format_table, load_baseline, save_baseline
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--suite", choices=["micro", "load", "startup", "all"], default="all")
+    parser.add_argument("--iterations", type=int, default=500, help="calls per microbenchmark")
+    parser.add_argument("--requests", type=int, default=200, help="requests per load scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight per load scenario")
+    parser.add_argument("--scenarios", default=",".join(bench_load.SCENARIOS),
+                        help="comma-separated load scenarios")
+    parser.add_argument("--provider", choices=["mock", "simulated"], default="mock",
+                        help="LLM for the load scenarios (simulated: see providers/simulated.py)")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="mock provider latency (s)")
+    parser.add_argument("--stream-chunk", type=int, default=16, help="mock provider stream chunk size (chars)")
+    parser.add_argument("--stream-delay", type=float, default=0.005, help="delay between streamed chunks (s)")
+    parser.add_argument("--startup-runs", type=int, default=5, help="fresh worker processes started")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    eager = []
+    if args.suite in ("startup", "all"):
+        # Fresh interpreters, so it does not matter that the load suite imports backend.main here
+        startup_results, eager = bench_startup.run(args.startup_runs)
+        results.update(startup_results)
+    if args.suite in ("load", "all"):
+        # Imports backend.main, so it goes first (see bench_load.offline_app)
+        app = bench_load.offline_app(args.llm_latency, args.stream_chunk, args.stream_delay, args.provider)
+        scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+        unknown = set(scenarios) - set(bench_load.SCENARIOS)
+        if unknown:
+            parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+        results.update(asyncio.run(bench_load.run_scenarios(app, scenarios, args.requests, args.concurrency)))
+    if args.suite in ("micro", "all"):
+        results = {**bench_micro.run(args.iterations), **results}
+
+    meta = {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+            "iterations": args.iterations, "startup_runs": args.startup_runs, "requests": args.requests, "concurrency": args.concurrency,
+            "provider": args.provider, "llm_latency": args.llm_latency, "stream_chunk": args.stream_chunk, "stream_delay": args.stream_delay}
+    if args.json:
+        save_baseline(args.json, results, meta)
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            baseline = load_baseline(args.baseline)
+        save_baseline(args.baseline, {**baseline, **results}, meta)
+        print(format_table(results))
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline) if os.path.exists(args.baseline) else None
+    print(format_table(results, baseline))
+    for module in eager:
+        print(f"REGRESSION startup: backend.main imports {module} eagerly")
+    if baseline is None:
+        print(f"no baseline at {args.baseline} (record one with --update-baseline)")
+        return 1 if eager else 0
+    regressions = compare(results, baseline, args.tolerance)
+    for name, key, old, new, change in regressions:
+        print(f"REGRESSION {name} {key}: {old:g} -> {new:g} ({change * 100:+.1f}%)")
+    print(f"{len(regressions)} regressions (tolerance {args.tolerance * 100:.0f}%)")
+    return 1 if regressions or eager else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import asyncio
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+from orchestrator.batch import checkpoint_name
+from orchestrator.orchestrator import LLMOrchestrator, PROVIDER_REGISTRY
+from providers.mock import MockLLMProvider
+
+class CountingProvider(MockLLMProvider):
+    calls = []
+    active = 0
+    peak = 0
+    async def agenerate(self, prompt: str, **kwargs):
+        CountingProvider.calls.append(prompt)
+        CountingProvider.active += 1
+        CountingProvider.peak = max(CountingProvider.peak, CountingProvider.active)
+        await asyncio.sleep(0.005)
+        CountingProvider.active -= 1
+        return f"answer: {prompt}"
+    def name(self):
+        return "counting"
+
+def collect(orch, items, **kwargs):
+    async def main():
+        return [r async for r in orch.agenerate_batch(items, **kwargs)]
+    return asyncio.run(main())
+
+def setup_function(_):
+    PROVIDER_REGISTRY["counting"] = CountingProvider
+    CountingProvider.calls = []
+    CountingProvider.peak = 0
+
+def teardown_function(_):
+    del PROVIDER_REGISTRY["counting"]
+
+def test_batch_dedupes_and_bounds_concurrency():
+    orch = LLMOrchestrator(["counting"])
+    items = [{"id": i, "prompt": f"p{i % 5}"} for i in range(20)]
+    results = collect(orch, items, concurrency=2)
+    assert len(results) == 20
+    assert sorted(CountingProvider.calls) == [f"p{i}" for i in range(5)]
+    assert CountingProvider.peak <= 2
+    by_id = {r["id"]: r for r in results}
+    assert by_id[7]["response"] == "answer: p2"
+    assert sum(r["deduplicated"] for r in results) == 15
+
+def test_batch_resumes_from_checkpoint(tmp_path):
+    orch = LLMOrchestrator(["counting"])
+    checkpoint = str(tmp_path / "batch.jsonl")
+    prompts_file = tmp_path / "prompts.jsonl"
+    prompts_file.write_text("\n".join(json.dumps({"id": i, "prompt": f"q{i}"}) for i in range(4)))
+    first = collect(orch, str(prompts_file), checkpoint_path=checkpoint)
+    assert all(r["status"] == "ok" and not r["resumed"] for r in first)
+    CountingProvider.calls = []
+    second = collect(orch, str(prompts_file), checkpoint_path=checkpoint)
+    assert CountingProvider.calls == []
+    assert all(r["resumed"] for r in second)
+    assert {r["id"]: r["response"] for r in second} == {r["id"]: r["response"] for r in first}
+
+def test_checkpoint_names_do_not_collide():
+    assert checkpoint_name("a_b", "c") != checkpoint_name("a", "b_c")
+    assert checkpoint_name("a/b", "c") != checkpoint_name("a_b", "c")
+    assert checkpoint_name("a", "b") == checkpoint_name("a", "b")
+    assert os.path.basename(checkpoint_name("../../etc", "x")) == checkpoint_name("../../etc", "x")
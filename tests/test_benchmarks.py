@@ -0,0 +1,55 @@
+import os
+import sys
+import asyncio
+import subprocess
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchmarks.bench_startup import LAZY_MODULES, ROOT, direct_imports, parse_importtime
+from benchmarks.harness import compare, measure, percentile, summarize
+from backend.providers.mock import MockLLMProvider
+
+def test_percentiles():
+    samples = [i / 1000 for i in range(1, 101)]  # 1..100 ms
+    assert percentile(samples, 50) == 0.05
+    assert percentile(samples, 99) == 0.099
+    result = summarize(samples, 2.0)
+    assert result["count"] == 100 and result["throughput"] == 50.0
+    assert (result["p50"], result["p95"], result["p99"]) == (50.0, 95.0, 99.0)
+
+def test_measure_counts_calls():
+    calls = []
+    result = measure(lambda: calls.append(1), iterations=20, warmup=5, rounds=2)
+    assert result["count"] == 20 and len(calls) == 45
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = {"load.chat": {"p50": 10.0, "p95": 20.0, "throughput": 100.0}}
+    assert compare({"load.chat": {"p50": 12.0, "p95": 24.0, "throughput": 90.0}}, baseline, 0.25) == []
+    regressions = compare({"load.chat": {"p50": 10.0, "p95": 30.0, "throughput": 70.0},
+                           "load.new": {"p50": 1.0}}, baseline, 0.25)
+    assert [(name, key) for name, key, *_ in regressions] == [("load.chat", "p95"), ("load.chat", "throughput")]
+
+def test_mock_provider_streams_in_chunks():
+    provider = MockLLMProvider(latency=0.01, chunk_size=4, response="abcdefghij")
+    async def collect():
+        return [chunk async for chunk in provider.astream("hi")]
+    assert asyncio.run(collect()) == ["abcd", "efgh", "ij"]
+    assert asyncio.run(provider.agenerate("hi")) == "abcdefghij"
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |     encodings.idna
+import time:       300 |        400 |   fastapi
+import time:       200 |        200 |     PyPDF2
+import time:        50 |        250 |   backend.context.file_utils
+import time:       500 |       1150 | backend.main
+"""
+
+def test_parse_importtime():
+    entries = parse_importtime("unrelated output\n" + IMPORTTIME)
+    assert [(e.level, e.name, e.cumulative_us) for e in entries][-1] == (0, "backend.main", 1150)
+    assert [e.name for e in direct_imports(entries, "backend.main")] == ["fastapi", "backend.context.file_utils"]
+    assert direct_imports(entries, "missing") == []
+
+def test_heavy_dependencies_are_imported_lazily():
+    code = ("import sys, backend.context.file_utils, backend.postprocessor.pipeline, backend.postprocessor.render;"
+            "print(sorted({m.split('.')[0] for m in sys.modules}))")
+    loaded = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert not [m for m in LAZY_MODULES if repr(m) in loaded]
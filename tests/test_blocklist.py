@@ -0,0 +1,66 @@
+import os
+import sys
+import string
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.preprocessor.blocklist import Blocklist, normalize
+from backend.preprocessor.core import ScreeningEngine
+
+TERMS = ["badword", "anotherbadword", "ass", "bad guy"]
+
+def test_normalization_catches_obfuscation():
+    blocklist = Blocklist(TERMS)
+    for text in ["BADWORD!", "b4dw0rd", "b@dword", "b.a.d.w.o.r.d", "b a d w o r d here",
+                 "baaaadwooord", "Bádword", "ba​dword", "that bad   guy"]:
+        assert blocklist.contains(text), text
+
+def test_whole_words_only():
+    blocklist = Blocklist(TERMS)
+    for text in ["badwords", "zbadword", "class act", "glass", "as you wish", "hello"]:
+        assert not blocklist.contains(text), text
+    # Repeats may be stretched but not shortened below the term's own double letters
+    assert blocklist.contains("asss")
+
+def test_numbers_are_not_leetspeak():
+    blocklist = Blocklist(TERMS)
+    for text in ["I paid 455 dollars", "order #455", "455", "call 455-8 4 0"]:
+        assert not blocklist.contains(text), text
+    assert blocklist.contains("a55") and blocklist.contains("4ss")
+
+def test_match_offsets_point_into_original_text():
+    blocklist = Blocklist(TERMS)
+    text = "my b.a.d.w.o.r.d is here"
+    [match] = blocklist.find_all(text)
+    assert match.term == "badword"
+    assert text[match.start:match.end] == "b.a.d.w.o.r.d"
+    assert normalize("Bá  d").text == "ba d"
+
+def test_overlapping_terms_all_reported():
+    blocklist = Blocklist(["bad", "bad guy", "guy"])
+    assert sorted(m.term for m in blocklist.find_all("bad guy")) == ["bad", "bad guy", "guy"]
+
+def _letters(i):
+    word = ""
+    for _ in range(4):
+        i, r = divmod(i, 26)
+        word += string.ascii_lowercase[r]
+    return word
+
+def test_large_list_and_file(tmp_path):
+    path = tmp_path / "blocklist.txt"
+    terms = [f"zq{_letters(i)}x" for i in range(20000)]
+    path.write_text("# comment\n\n" + "\n".join(terms))
+    blocklist = Blocklist.from_file(str(path), extra_terms=["badword"])
+    # Terms that normalize identically ("zqaabax" / "zqabax") are stored once
+    assert len(blocklist) == len({normalize(t).text for t in terms}) + 1
+    assert blocklist.contains(f"has zq{_letters(1234)}x inside")
+    assert blocklist.contains("badword")
+    assert not blocklist.contains(f"zq{_letters(1234)}xy")
+    assert blocklist.nbytes < 2_000_000
+
+def test_engine_uses_blocklist_for_words(tmp_path):
+    path = tmp_path / "blocklist.txt"
+    path.write_text("smeg\n")
+    engine = ScreeningEngine({"profanity": {"words": ["frak"], "words_file": str(path)},
+                              "sql_injection": {"patterns": [r"\bdrop\b"]}})
+    assert engine.screen("fr4k and SMEG; drop") == ["profanity", "sql_injection"]
+    assert [m.text for m in engine.scan("s m e g")] == ["s m e g"]
@@ -1,4 +1,5 @@
 import sys
+import json
 import os
 import pytest
 from fastapi.testclient import TestClient
@@ -50,8 +51,8 @@ def test_message_validation():
 
 def test_rate_limiting():
     # Reset rate limiter for this user
-    from main import user_message_times
-    user_message_times[USER_ID].clear()
+    from main import rate_limiter
+    rate_limiter.reset(USER_ID)
     # Send 10 messages quickly
     for i in range(10):
         resp = client.post("/api/chat/message", json={"user_id": USER_ID, "text": f"msg{i}"})
@@ -60,3 +61,18 @@ def test_rate_limiting():
     resp = client.post("/api/chat/message", json={"user_id": USER_ID, "text": "overflow"})
     assert resp.status_code == 429
     assert "Rate limit" in resp.json()["detail"]
+    assert resp.headers["RateLimit-Remaining"] == "0"
+    assert "Retry-After" in resp.headers
+
+def test_batch_reports_malformed_items():
+    from main import rate_limiter
+    rate_limiter.reset(USER_ID)
+    items = ["What is Python?", 42, None, ["a"], {"text": "hi", "query_type": ["qa"]}]
+    resp = client.post("/api/chat/batch", json={"user_id": USER_ID, "items": items})
+    assert resp.status_code == 200
+    records = {r["id"]: r for r in map(json.loads, resp.text.splitlines())}
+    assert records[0]["status"] == "ok"
+    assert [records[i]["error"] for i in (1, 2, 3)] == ["item must be a string or an object"] * 3
+    assert records[4]["error"] == "query_type must be a string"
+    assert client.post("/api/chat/batch", json=[{"user_id": USER_ID}]).status_code == 400
+    assert client.post("/api/chat/batch", json={"user_id": USER_ID, "items": "text"}).status_code == 400
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import asyncio
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+from orchestrator.circuit import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from orchestrator.orchestrator import LLMOrchestrator, PROVIDER_REGISTRY
+from providers.mock import MockLLMProvider
+
+def test_breaker_opens_on_error_rate():
+    breaker = CircuitBreaker("p", min_calls=4, error_threshold=0.5)
+    breaker.record_success(0.01)
+    breaker.record_success(0.01)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+def test_breaker_half_open_probe_closes_on_success():
+    breaker = CircuitBreaker("p", min_calls=1, open_seconds=0.01)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    time.sleep(0.02)
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    assert not breaker.allow_request()
+    breaker.record_success(0.01)
+    assert breaker.state == CLOSED
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker("p", min_calls=2, slow_call_seconds=0.1)
+    breaker.record_success(0.5)
+    breaker.record_success(0.5)
+    assert breaker.state == OPEN
+
+def test_open_breaker_skips_dead_provider():
+    calls = []
+    class Dead(MockLLMProvider):
+        def generate(self, prompt: str, **kwargs):
+            calls.append(prompt)
+            raise RuntimeError("down")
+        def name(self):
+            return "dead"
+    PROVIDER_REGISTRY["dead"] = Dead
+    orch = LLMOrchestrator(["dead", "mock"], max_retries=2, backoff_base=0.001,
+                           breaker_options={"min_calls": 2, "open_seconds": 60})
+    asyncio.run(orch.agenerate("first"))
+    assert orch.breakers["dead"].state == OPEN
+    calls.clear()
+    start = time.monotonic()
+    response = asyncio.run(orch.agenerate("second"))
+    assert response in MockLLMProvider().responses
+    assert calls == []
+    assert time.monotonic() - start < 0.5
+    states = {s["provider"]: s["state"] for s in orch.provider_status()}
+    assert states == {"dead": OPEN, "mock": CLOSED}
+    del PROVIDER_REGISTRY["dead"]
+
+def test_all_circuits_open_fails_fast():
+    orch = LLMOrchestrator(["mock"], breaker_options={"min_calls": 1})
+    orch.breakers["mock"].record_failure()
+    with pytest.raises(RuntimeError):
+        asyncio.run(orch.agenerate("nothing available"))
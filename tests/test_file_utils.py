@@ -0,0 +1,24 @@
+import os
+import sys
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.context import file_utils
+from backend.context.file_utils import ALLOWED_EXTENSIONS, allowed_file, extract_text, register_extractor
+
+def test_extractors_are_registered_by_extension():
+    assert set(ALLOWED_EXTENSIONS) == {"pdf", "docx", "txt", "md"}
+    assert allowed_file("notes.MD") and not allowed_file("notes.exe") and not allowed_file("README")
+    assert extract_text("a.txt", b"plain text") == "plain text"
+    with pytest.raises(ValueError):
+        extract_text("a.exe", b"")
+
+def test_register_extractor():
+    @register_extractor(".CSV", "tsv")
+    def extract_table(file_bytes: bytes) -> str:
+        return file_bytes.decode().replace(",", " ")
+    try:
+        assert allowed_file("data.csv") and "tsv" in ALLOWED_EXTENSIONS
+        assert extract_text("data.csv", b"a,b") == "a b"
+    finally:
+        del file_utils.EXTRACTORS["csv"], file_utils.EXTRACTORS["tsv"]
+    assert not allowed_file("data.csv")
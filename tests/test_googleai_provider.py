@@ -32,3 +32,22 @@ def test_googleai_stream():
     print(f"Total chunks: {len(chunks)}")
     print(f"All chunks: {chunks}")
     assert sum(len(c) for c in chunks) > 0
+
+def test_requests_are_bounded_and_timeouts_are_retryable(monkeypatch):
+    import requests
+    from orchestrator.orchestrator import LLMOrchestrator, PROVIDER_REGISTRY
+    from orchestrator.retry import is_retryable
+    from providers.base import ProviderError
+    seen = {}
+    def hung(endpoint, timeout=None, **kwargs):
+        seen["timeout"] = timeout
+        raise requests.ReadTimeout("read timed out")
+    monkeypatch.setattr(requests, "post", hung)
+    monkeypatch.setitem(PROVIDER_REGISTRY, "googleai", GoogleAIProvider)
+    provider = LLMOrchestrator(["googleai"], attempt_timeout=7.0).providers[0]
+    with pytest.raises(ProviderError) as exc:
+        provider.generate("hi")
+    assert seen["timeout"] == (provider.connect_timeout, 7.0)
+    assert is_retryable(exc.value)
+    with pytest.raises(ProviderError):
+        list(provider._stream_response({}, {}, {}))
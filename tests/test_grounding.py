@@ -0,0 +1,43 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.postprocessor.hallucination import (GroundingIndex, GroundingIndexCache, basic_hallucination_detection,
+                                                 check_grounding)
+
+CONTEXT = [
+    {"filename": "geo.txt", "chunk_id": 0, "text": "The capital of France is Paris. It lies on the Seine."},
+    {"filename": "geo.txt", "chunk_id": 1, "text": "Berlin is the capital of Germany."},
+]
+
+def test_sentence_scores_and_chunk_ids():
+    report = check_grounding("The capital of France is Paris! The moon is made of cheese. Berlin is the capital of Spain.",
+                             CONTEXT)
+    paris, moon, berlin = report.sentences
+    assert paris.score == 1.0 and paris.chunk_ids == ["geo.txt:0", "geo.txt:1"]  # "the capital of" is in both
+    assert moon.score == 0.0 and moon.chunk_ids == []
+    assert berlin.score == 0.75 and berlin.chunk_ids[0] == "geo.txt:1"
+    assert [s.text for s in report.unsupported()] == ["The moon is made of cheese."]
+    assert report.sentences[1].start == report.sentences[0].end + 1
+
+def test_shared_trigram_reports_every_chunk():
+    index = GroundingIndex(["the capital of x", "is the capital of y"])
+    assert index.check("Rome, the capital of Italy.").sentences[0].chunk_ids == [0, 1]
+
+def test_punctuation_and_case_ignored_and_short_sentences_unscored():
+    report = check_grounding("PARIS, the capital... Yes.", ["paris the capital"])
+    assert report.sentences[0].score == 1.0
+    assert report.sentences[1].score is None
+    assert report.unsupported() == []
+
+def test_index_reused_across_turns():
+    cache = GroundingIndexCache(max_entries=2)
+    first = cache.get(CONTEXT)
+    assert cache.get([dict(c) for c in CONTEXT]) is first
+    assert cache.get(CONTEXT[:1]) is not first
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.get(["other"], key="conv-1") is cache.get([], key="conv-1")
+
+def test_legacy_api():
+    flagged = basic_hallucination_detection("The capital of France is Paris. The moon is made of cheese.",
+                                            ["The capital of France is Paris."])
+    assert flagged == ["The moon is made of cheese."]
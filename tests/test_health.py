@@ -14,3 +14,13 @@ def test_health_check():
     assert "status" in data
     assert data["status"] == "ok"
     assert data["db"] == "connected"
+
+def test_liveness_and_readiness_probes():
+    response = client.get("/api/health/live")
+    assert response.status_code == 200 and response.json() == {"status": "ok"}
+    response = client.get("/api/health/ready")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "ready" and data["mongo"]["ok"]
+    assert set(data["queues"]) == {"ingestion", "usage"}
+    assert all(state in ("closed", "open", "half_open") for state in data["providers"].values())
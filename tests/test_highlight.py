@@ -0,0 +1,69 @@
+import os
+import sys
+import asyncio
+import markdown
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.postprocessor.highlight import CodeHighlighter
+from backend.postprocessor.render import MarkdownRenderer
+
+DOCS = [
+    "# T\n\nText\n```python\ndef f(x):\n    return x < 1\n```\nafter",
+    "~~~js\nconsole.log('a')\n~~~\n\n- item\n\n```sql\nSELECT 1;\n```\n",
+    "```{.python}\nx = 1\n```\n",
+    "    indented\n    code\n",
+    "```python\n\n\nx = 1\n\n```",
+    "```\nplain <b>text</b>\n```\n",
+]
+
+@pytest.mark.parametrize("doc", DOCS)
+def test_cached_highlighting_matches_codehilite(doc):
+    plain = markdown.Markdown(extensions=["extra", "codehilite", "nl2br"])
+    if doc.startswith("```\n"):
+        # Blocks without a language are plain text instead of a guessed lexer
+        plain = markdown.Markdown(extensions=["extra", "codehilite", "nl2br"],
+                                  extension_configs={"codehilite": {"guess_lang": False}})
+    renderer = MarkdownRenderer(highlighter=CodeHighlighter())
+    assert renderer.render(doc) == plain.convert(doc)
+
+def test_repeated_blocks_hit_cache():
+    highlighter = CodeHighlighter()
+    renderer = MarkdownRenderer(highlighter=highlighter)
+    doc = "```python\nprint('hi')\n```\n"
+    first = renderer.render(doc)
+    assert renderer.render("Intro\n\n" + doc).endswith(first)
+    assert highlighter.cache_info()["misses"] == 1
+    assert highlighter.cache_info()["hits"] == 1
+    # Same code, different language: separate entry
+    highlighter.highlight("print('hi')\n", "text")
+    assert highlighter.cache_info()["misses"] == 2
+
+def test_cache_is_bounded():
+    highlighter = CodeHighlighter(max_entries=3)
+    for i in range(10):
+        highlighter.highlight(f"x = {i}\n", "python")
+    assert highlighter.cache_info()["size"] == 3
+    assert highlighter.cached("x = 9\n", "python") is not None
+    assert highlighter.cached("x = 0\n", "python") is None
+
+def test_unknown_language_and_preload():
+    highlighter = CodeHighlighter()
+    assert highlighter.preload(["python", "js"]) == 2
+    assert "<code>a &lt; b\n</code>" in highlighter.highlight("a < b\n", "nosuchlang")
+
+def test_large_blocks_highlighted_in_pool():
+    threads = []
+
+    class Recording(CodeHighlighter):
+        def _render(self, code, lang):
+            import threading
+            threads.append(threading.current_thread().name)
+            return super()._render(code, lang)
+
+    highlighter = Recording(offload_chars=100)
+    renderer = MarkdownRenderer(highlighter=highlighter)
+    doc = "```python\n" + "x = 1\n" * 50 + "```\n\n```python\ny = 2\n```\n"
+    html = asyncio.run(renderer.arender(doc))
+    assert html == renderer.render(doc)
+    assert threads[0].startswith("highlight")
+    assert all(not name.startswith("highlight") for name in threads[1:])
@@ -0,0 +1,120 @@
+import os
+import sys
+import random
+import re
+import time
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.postprocessor.links import (ALLOWED, DENIED, UNKNOWN, UNVERIFIED_NOTE, REMOVED_LINK,
+                                         LinkVerifier, context_hosts, hold_point)
+from backend.postprocessor.pipeline import LinkStage, Pipeline, chat_pipeline
+
+TEXT = (
+    "See [docs](https://docs.python.org/3/) and https://evil.com/x. "
+    "Also [click](javascript:alert(1)) or <https://unknown.io/a>.\n"
+    "`https://evil.com/in-code` stays, a[0] = 1 here\n"
+    "```\nhttps://evil.com/fenced\n```\n"
+    "and https://ctx.org/page, done [a](https://x.y/z \"t\").\n"
+)
+CONTEXT = ["Our site is https://ctx.org/home"]
+
+def verifier(**kwargs):
+    return LinkVerifier(deny=["evil.com"], known_good=["python.org"], **kwargs)
+
+def test_verdicts():
+    v = verifier(allow="intranet.example")
+    assert v.verdict("https://docs.python.org/3/") == ALLOWED
+    assert v.verdict("https://wiki.intranet.example/page") == ALLOWED
+    assert v.verdict("https://sub.evil.com/") == DENIED
+    assert v.verdict("javascript:alert(1)") == DENIED
+    assert v.verdict("mailto:someone@example.com") == ALLOWED
+    assert v.verdict("https://unknown.io/") == UNKNOWN
+    assert v.verdict("https://ctx.org/a", context_hosts(CONTEXT)) == ALLOWED
+
+def test_verdict_cache_and_ttl():
+    v = verifier(ttl=0.05)
+    v.verdict("https://unknown.io/a")
+    v.verdict("https://unknown.io/b")
+    assert v.cache_info()["hits"] == 1
+    time.sleep(0.06)
+    v.verdict("https://unknown.io/c")
+    assert v.cache_info()["misses"] == 2
+
+def test_resolver_runs_in_background():
+    v = verifier(resolver=lambda host: host.endswith(".io"))
+    assert v.verdict("https://unknown.io/") == UNKNOWN  # not blocked on the resolver
+    v._executor.shutdown(wait=True)
+    assert v.verdict("https://unknown.io/") == ALLOWED
+
+def test_rewrite_actions():
+    kept = Pipeline([LinkStage(verifier())]).run(TEXT, context=CONTEXT)
+    assert "[docs](https://docs.python.org/3/)" in kept.text
+    assert f"and {REMOVED_LINK}. Also click or <https://unknown.io/a>." in kept.text
+    assert "`https://evil.com/in-code`" in kept.text
+    assert "```\nhttps://evil.com/fenced\n```" in kept.text
+    assert "https://ctx.org/page" in kept.text
+    assert ("https://evil.com/x", DENIED) in kept.links
+
+    annotated = Pipeline([LinkStage(verifier(), "annotate")]).run(TEXT, context=CONTEXT)
+    assert "<https://unknown.io/a>" + UNVERIFIED_NOTE + "." in annotated.text
+    assert "https://ctx.org/page," in annotated.text
+
+    stripped = Pipeline([LinkStage(verifier(), "strip")]).run(TEXT, context=CONTEXT)
+    assert "https://unknown.io" not in stripped.text
+    assert "done a." in stripped.text
+
+def test_hold_point():
+    assert hold_point("see [docs](https://docs.py") == 4
+    assert hold_point("see https://docs.py") == 4
+    assert hold_point("see htt") == 4
+    assert hold_point("a[0] = 1 and more") == len("a[0] = 1 and more")
+    assert hold_point("``") == 0  # may become a fence
+
+def test_stream_matches_full_run():
+    for action in ("keep", "annotate", "strip"):
+        pipeline = Pipeline([LinkStage(verifier(), action)])
+        full = pipeline.run(TEXT, context=CONTEXT)
+        for seed in range(50):
+            rng = random.Random(seed)
+            stream = pipeline.stream(context=CONTEXT)
+            pos, text = 0, ""
+            while pos < len(TEXT):
+                step = rng.randint(1, 9)
+                text += stream.feed(TEXT[pos:pos + step]).text
+                pos += step
+            stream.close()
+            assert text + stream.flushed == full.text
+
+@pytest.mark.parametrize("doc", [
+    "[a](<javascript:alert(1)>)",
+    "[a][r]\n\n[r]: javascript:alert(1)",
+    "[a]( javascript:alert(1))",
+    "[a](java&#115;cript:alert(1))",
+    '<a href="javascript:alert(1)">a</a>',
+    "[a](https://python.org){: onclick=\"alert(1)\"}",
+])
+def test_unsafe_urls_never_rendered(doc):
+    html = chat_pipeline().run(doc).html
+    assert not re.search(r'<[a-z][^<>]*(href="javascript|onclick=)', html)
+
+@pytest.mark.parametrize("doc", [
+    '<svg><a><animate attributeName="href" values="javascript:alert(1)"/><text x="20" y="20">click</text></a></svg>',
+    '<svg><a xlink:href="javascript:alert(1)"><set attributeName="href" to="javascript:alert(1)"/>x</a></svg>',
+    'text <img src=x onerror=alert(1)> more',
+    '<div markdown="1">\n<iframe srcdoc="<script>alert(1)</script>"></iframe>\n</div>',
+])
+def test_raw_html_is_escaped(doc):
+    html = chat_pipeline().run(doc).html
+    assert not re.search(r"<(svg|a|animate|set|img|div|iframe)\b", html)
+    assert "&lt;" in html
+
+def test_scheme_checks_after_normalizing():
+    v = verifier()
+    assert v.verdict("<javascript:alert(1)>") == DENIED
+    assert v.verdict(" java&#115;cript:alert(1)") == DENIED
+    assert v.verdict("java\tscript:alert(1)") == DENIED
+    assert v.verdict("docs/setup.md#x") == UNKNOWN
+    assert v.verdict("//evil.com/x") == DENIED
+    html = chat_pipeline().run("[rel](docs/setup.md) [ok](https://python.org/a?b=1&c=2) <me@example.com>").html
+    assert 'href="docs/setup.md"' in html and 'href="https://python.org/a?b=1&amp;c=2"' in html
+    assert html.count("<a href=") == 3
@@ -0,0 +1,135 @@
+import os
+import sys
+import io
+import json
+import logging
+import threading
+import time
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.telemetry.logs import AsyncLogHandler, SamplingFilter, parse_sampling, request_context
+from backend.telemetry.tracing import InMemoryExporter, configure_tracing, span
+
+def make_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+def lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+def test_json_lines_with_correlation_ids_and_extras():
+    stream = io.StringIO()
+    handler = AsyncLogHandler(stream)
+    logger = make_logger("test.logs.json", handler)
+    configure_tracing(InMemoryExporter(), sample_ratio=1.0)
+    try:
+        with request_context("req-1"):
+            with span("op") as op:
+                logger.info("hello %s", "world", extra={"status": 200})
+        logger.info("outside")
+    finally:
+        configure_tracing(None)
+    handler.flush()
+    handler.close()
+    first, second = lines(stream)
+    assert first["msg"] == "hello world" and first["level"] == "INFO" and first["logger"] == "test.logs.json"
+    assert first["request_id"] == "req-1" and first["status"] == 200
+    assert first["trace_id"] == op.context.trace_id and first["span_id"] == op.context.span_id
+    assert "request_id" not in second and "trace_id" not in second
+
+def test_formatting_happens_on_the_writer_thread():
+    seen = []
+    class Arg:
+        def __str__(self):
+            seen.append(threading.current_thread().name)
+            return "arg"
+    stream = io.StringIO()
+    handler = AsyncLogHandler(stream)
+    logger = make_logger("test.logs.lazy", handler)
+    logger.info("value %s", Arg())
+    handler.flush()
+    handler.close()
+    assert seen == ["log-writer"]
+    assert lines(stream)[0]["msg"] == "value arg"
+
+def test_exceptions_are_rendered():
+    stream = io.StringIO()
+    handler = AsyncLogHandler(stream)
+    logger = make_logger("test.logs.exc", handler)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed")
+    handler.flush()
+    handler.close()
+    assert "ValueError: boom" in lines(stream)[0]["exc"]
+
+def test_sampling_never_drops_warnings():
+    assert parse_sampling("access=0.1, backend.main=2") == {"access": 0.1, "backend.main": 1.0}
+    sampler = SamplingFilter({"access": 0.0})
+    def record(name, level):
+        return logging.LogRecord(name, level, __file__, 1, "msg", (), None)
+    assert not sampler.filter(record("access", logging.INFO))
+    assert not sampler.filter(record("access.child", logging.INFO))
+    assert sampler.filter(record("access", logging.WARNING))
+    assert sampler.filter(record("accessory", logging.INFO))
+
+def test_full_queue_drops_info_but_keeps_warnings():
+    class SlowStream(io.StringIO):
+        def __init__(self):
+            super().__init__()
+            self.release = threading.Event()
+        def write(self, text):
+            self.release.wait(5)
+            return super().write(text)
+    stream = SlowStream()
+    handler = AsyncLogHandler(stream, queue_size=2, batch_size=1)
+    logger = make_logger("test.logs.full", handler)
+    for i in range(20):
+        logger.info("info %d", i)
+    threading.Timer(0.2, stream.release.set).start()
+    logger.warning("security warning")
+    handler.flush()
+    handler.close()
+    records = lines(stream)
+    assert any(r["msg"] == "security warning" for r in records)
+    assert any("log records dropped" in r["msg"] for r in records)
+    assert sum(r["msg"].startswith("info") for r in records) < 20
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_worker_gets_its_own_writer():
+    read_fd, write_fd = os.pipe()
+    handler = AsyncLogHandler(io.StringIO())
+    pid = os.fork()
+    if pid == 0:  # a worker forked from a preloading master
+        stream = io.StringIO()
+        handler.stream = stream
+        make_logger("test.logs.fork", handler).info("from the worker")
+        handler.flush(timeout=2.0)
+        os.write(write_fd, stream.getvalue().encode())
+        os._exit(0)
+    os.waitpid(pid, 0)
+    os.close(write_fd)
+    assert json.loads(os.read(read_fd, 4096))["msg"] == "from the worker"
+    os.close(read_fd)
+    handler.close()
+
+def test_emit_does_not_wait_for_a_slow_stream():
+    class SlowStream(io.StringIO):
+        def write(self, text):
+            time.sleep(0.5)
+            return super().write(text)
+    stream = SlowStream()
+    handler = AsyncLogHandler(stream, batch_size=1)
+    logger = make_logger("test.logs.slow", handler)
+    logger.info("first")  # picked up by the writer, which then sits in write()
+    time.sleep(0.05)
+    start = time.perf_counter()
+    logger.info("second")
+    assert time.perf_counter() - start < 0.1
+    handler.flush()
+    handler.close()
+    assert [r["msg"] for r in lines(stream)] == ["first", "second"]
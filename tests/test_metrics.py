@@ -0,0 +1,86 @@
+import os
+import sys
+import asyncio
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.telemetry import metrics
+from backend.telemetry.metrics import Counter, FunctionMetric, Gauge, Histogram, Registry
+
+def test_counter_and_gauge_exposition():
+    registry = Registry()
+    requests = Counter("requests", "Requests", ["route", "status"], registry=registry)
+    requests.labels("/api/chat/message", 200).inc()
+    requests.labels("/api/chat/message", 200).inc(2)
+    depth = Gauge("queue_depth", "Queue depth", registry=registry)
+    depth.set(3)
+    text = registry.render()
+    assert "# TYPE requests counter" in text
+    assert 'requests_total{route="/api/chat/message",status="200"} 3' in text
+    assert "queue_depth 3" in text
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = Histogram("latency_seconds", "Latency", ["stage"], buckets=(0.1, 1.0), registry=registry)
+    child = latency.labels("render")
+    for value in (0.05, 0.1, 0.5, 2.0):
+        child.observe(value)
+    text = registry.render()
+    assert 'latency_seconds_bucket{stage="render",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{stage="render",le="1.0"} 3' in text
+    assert 'latency_seconds_bucket{stage="render",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{stage="render"} 4' in text
+    assert 'latency_seconds_sum{stage="render"} 2.65' in text
+
+def test_label_values_are_escaped_and_checked():
+    registry = Registry()
+    errors = Counter("errors", "Errors", ["kind"], registry=registry)
+    errors.labels('bad "quote"\n').inc()
+    assert 'errors_total{kind="bad \\"quote\\"\\n"} 1' in registry.render()
+    try:
+        errors.labels("a", "b")
+        assert False, "wrong label count must raise"
+    except ValueError:
+        pass
+
+def test_function_metric_and_broken_callback():
+    registry = Registry()
+    FunctionMetric("hit_ratio", "Hit ratio", lambda: {("highlight",): 0.5}, labelnames=["cache"], registry=registry)
+    FunctionMetric("broken", "Broken", lambda: 1 / 0, registry=registry)
+    text = registry.render()
+    assert 'hit_ratio{cache="highlight"} 0.5' in text
+    assert "collection failed" in text
+
+def test_cache_metrics():
+    metrics.register_cache("test_cache", lambda: {"hits": 3, "misses": 1})
+    text = metrics.scrape()
+    assert 'cache_hits_total{cache="test_cache"} 3' in text
+    assert 'cache_hit_ratio{cache="test_cache"} 0.75' in text
+
+def test_error_kind():
+    class HTTPError(Exception):
+        def __init__(self, status_code):
+            self.status_code = status_code
+    assert metrics.error_kind(asyncio.TimeoutError()) == "timeout"
+    assert metrics.error_kind(HTTPError(429)) == "rate_limited"
+    assert metrics.error_kind(HTTPError(503)) == "http_5xx"
+    assert metrics.error_kind(ValueError()) == "ValueError"
+
+def test_event_loop_lag_is_measured():
+    async def main():
+        monitor = asyncio.create_task(metrics.monitor_event_loop(0.01))
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)  # block the loop
+        await asyncio.sleep(0.03)
+        monitor.cancel()
+    before = metrics.EVENT_LOOP_LAG._children[()].count
+    asyncio.run(main())
+    assert metrics.EVENT_LOOP_LAG._children[()].count > before
+    assert metrics.EVENT_LOOP_LAG_MAX.get() >= 0.05
+
+def test_stage_timings_are_observed_in_seconds():
+    registry = Registry()
+    latency = Histogram("stage_seconds", "Stage latency", ["stage"], registry=registry)
+    metrics.record_timings(latency, {"render": 250.0, "links": 1500.0})  # PostprocessContext.timings, in ms
+    text = registry.render()
+    assert 'stage_seconds_sum{stage="render"} 0.25' in text
+    assert 'stage_seconds_sum{stage="links"} 1.5' in text
@@ -0,0 +1,87 @@
+import os
+import sys
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.server.migrations import LOCK_ID, Migration, MigrationTimeout, MongoLock, run_migrations
+from backend.server.readiness import Readiness, connect_with_retry
+from backend.telemetry.metrics import STARTUP_DURATION
+from backend.telemetry.startup import StartupProfile
+
+@pytest.fixture
+def db():
+    mongomock = pytest.importorskip("mongomock")
+    return mongomock.MongoClient().db
+
+def test_migrations_apply_once_in_order(db):
+    calls = []
+    migrations = [Migration("0001_a", lambda: calls.append("a")), Migration("0002_b", lambda: calls.append("b"))]
+    assert run_migrations(db, migrations) == ["0001_a", "0002_b"]
+    assert run_migrations(db, migrations) == []  # every later worker: one query, nothing applied
+    assert calls == ["a", "b"]
+    migrations.append(Migration("0003_c", lambda: calls.append("c")))
+    assert run_migrations(db, migrations) == ["0003_c"]
+    assert db.locks.count_documents({}) == 0
+    assert db.migrations.find_one({"_id": "0003_c"})["applied_by"]
+
+def test_worker_waits_for_the_lock_holder(db):
+    calls = []
+    migrations = [Migration("0001_a", lambda: calls.append("a"))]
+    holder = MongoLock(db.locks, LOCK_ID)
+    assert holder.acquire()
+    def finish():
+        db.migrations.insert_one({"_id": "0001_a"})
+        holder.release()
+    threading.Timer(0.1, finish).start()
+    assert run_migrations(db, migrations, poll_interval=0.02) == []
+    assert calls == []
+
+def test_expired_lock_is_taken_over(db):
+    db.locks.insert_one({"_id": LOCK_ID, "owner": "dead-worker",
+                         "expire_at": datetime.now(timezone.utc) - timedelta(seconds=1)})
+    assert run_migrations(db, [Migration("0001_a", lambda: None)], poll_interval=0.01) == ["0001_a"]
+
+def test_live_lock_times_out(db):
+    assert MongoLock(db.locks, LOCK_ID, ttl=60).acquire()
+    assert not MongoLock(db.locks, LOCK_ID).acquire()
+    with pytest.raises(MigrationTimeout):
+        run_migrations(db, [Migration("0001_a", lambda: None)], wait_timeout=0.05, poll_interval=0.01)
+
+def test_failed_migration_releases_the_lock(db):
+    def broken():
+        raise RuntimeError("index build failed")
+    with pytest.raises(RuntimeError):
+        run_migrations(db, [Migration("0001_a", lambda: None), Migration("0002_broken", broken)])
+    assert db.locks.count_documents({}) == 0
+    assert [d["_id"] for d in db.migrations.find()] == ["0001_a"]
+
+def test_startup_profile_phases():
+    profile = StartupProfile()
+    profile.mark("import")
+    with profile.phase("migrations"):
+        pass
+    assert not profile.to_dict()["ready"]
+    profile.ready()
+    report = profile.to_dict()
+    assert report["ready"] and list(report["phases_ms"]) == ["import", "migrations"]
+    assert report["total_ms"] >= sum(report["phases_ms"].values())
+    assert STARTUP_DURATION.labels("total").value == pytest.approx(profile.total)
+
+def test_connect_is_retried_until_ready():
+    readiness = Readiness("mongo")
+    assert readiness.serving and not readiness.ready  # idle: not started by a lifespan
+    attempts = []
+    async def connect():
+        attempts.append(readiness.to_dict())
+        if len(attempts) < 3:
+            raise ConnectionError("refused")
+    async def start():
+        task = asyncio.create_task(connect_with_retry(readiness, connect, initial_delay=0.01))
+        await asyncio.sleep(0)
+        assert readiness.state == "connecting" and not readiness.serving
+        await task
+    asyncio.run(start())
+    assert readiness.ready and readiness.serving and readiness.attempts == 3
+    assert attempts[-1]["error"] == "ConnectionError: refused" and readiness.error is None
@@ -38,3 +38,114 @@ def test_all_providers_fail():
     with pytest.raises(RuntimeError):
         orch.generate("Should fail")
     del PROVIDER_REGISTRY["alwaysfail"]
+
+def test_non_retryable_error_is_not_retried():
+    import asyncio
+    from providers.base import ProviderError
+    calls = []
+    class BadRequest(MockLLMProvider):
+        def generate(self, prompt: str, **kwargs):
+            calls.append(prompt)
+            raise ProviderError("bad request", status_code=400)
+        def name(self):
+            return "badrequest"
+    from orchestrator.orchestrator import PROVIDER_REGISTRY
+    PROVIDER_REGISTRY["badrequest"] = BadRequest
+    orch = LLMOrchestrator(["badrequest", "mock"], max_retries=3, backoff_base=0.01)
+    response = asyncio.run(orch.agenerate("4xx"))
+    assert response in MockLLMProvider().responses
+    assert len(calls) == 1
+    del PROVIDER_REGISTRY["badrequest"]
+
+def test_async_retry_does_not_block_event_loop():
+    import asyncio
+    from providers.base import ProviderError
+    class Flaky(MockLLMProvider):
+        attempts = 0
+        async def agenerate(self, prompt: str, **kwargs):
+            Flaky.attempts += 1
+            if Flaky.attempts < 3:
+                raise ProviderError("unavailable", status_code=503)
+            return "recovered"
+        def name(self):
+            return "flaky"
+    from orchestrator.orchestrator import PROVIDER_REGISTRY
+    PROVIDER_REGISTRY["flaky"] = Flaky
+    orch = LLMOrchestrator(["flaky"], max_retries=3, backoff_base=0.05)
+
+    async def main():
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.001)
+                ticks += 1
+        t = asyncio.create_task(ticker())
+        result = await orch.agenerate("retry me")
+        t.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(main())
+    assert result == "recovered"
+    assert ticks > 0
+    del PROVIDER_REGISTRY["flaky"]
+
+def test_hedged_request_uses_faster_provider():
+    import asyncio
+    class Slow(MockLLMProvider):
+        async def agenerate(self, prompt: str, **kwargs):
+            await asyncio.sleep(1.0)
+            return "slow"
+        def name(self):
+            return "slow"
+    from orchestrator.orchestrator import PROVIDER_REGISTRY
+    PROVIDER_REGISTRY["slow"] = Slow
+    orch = LLMOrchestrator(["slow", "mock"], hedge=True, hedge_delay=0.05)
+    response = asyncio.run(orch.agenerate("hedge"))
+    assert response in MockLLMProvider().responses
+    del PROVIDER_REGISTRY["slow"]
+
+def test_stream_fails_over_before_first_chunk_only():
+    import asyncio
+    from orchestrator.orchestrator import PROVIDER_REGISTRY
+    class Chunked(MockLLMProvider):
+        async def astream(self, prompt, **kwargs):
+            for word in ["one ", "two ", "three"]:
+                yield word
+        def name(self):
+            return "chunked"
+    class BreaksMidway(MockLLMProvider):
+        async def astream(self, prompt, **kwargs):
+            yield "partial "
+            raise RuntimeError("connection reset")
+        def name(self):
+            return "midway"
+    PROVIDER_REGISTRY.update({"failing": FailingProvider, "chunked": Chunked, "midway": BreaksMidway})
+
+    async def collect(orch):
+        return [chunk async for chunk in orch.astream("hi", user_id="u1")]
+
+    try:
+        assert asyncio.run(collect(LLMOrchestrator(["failing", "chunked"]))) == ["one ", "two ", "three"]
+        got = []
+        async def partial():
+            async for chunk in LLMOrchestrator(["midway", "chunked"]).astream("hi"):
+                got.append(chunk)
+        with pytest.raises(RuntimeError, match="connection reset"):
+            asyncio.run(partial())
+        assert got == ["partial "]
+    finally:
+        for name in ("failing", "chunked", "midway"):
+            del PROVIDER_REGISTRY[name]
+
+def test_long_stream_is_not_a_slow_call():
+    import asyncio
+    orch = LLMOrchestrator(["mock"], breaker_options={"min_calls": 1, "slow_call_seconds": 0.1})
+    orch.providers[0] = MockLLMProvider(chunk_size=5, chunk_delay=0.03, response="0123456789" * 5)
+    async def collect():
+        return [chunk async for chunk in orch.astream("hi")]
+    for _ in range(2):
+        assert "".join(asyncio.run(collect())) == "0123456789" * 5  # ~0.3s per stream
+    breaker = orch.breakers["mock"]
+    assert breaker.errors == 0 and breaker.available()
+    assert orch.latency["mock"].percentile(0.95) < 0.1  # time to first chunk, not the whole stream
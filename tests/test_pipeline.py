@@ -0,0 +1,105 @@
+import os
+import sys
+import asyncio
+import random
+import re
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.postprocessor.core import postprocess_output
+from backend.postprocessor.md_utils import FenceHinter
+from backend.postprocessor.pipeline import (FenceHintStage, Pipeline, RenderStage, TruncateStage,
+                                            chat_pipeline)
+from backend.postprocessor.truncate import open_fence, truncate_markdown
+
+DOCS = [
+    "Intro paragraph.\n\n```\nplain code\n```\n\n- a\n- b\n\nEnd.",
+    "Answer:\n```python\n" + "x = 1\n" * 30 + "```\nAfter the code " + "word " * 60,
+    "Tildes\n~~~\nno lang\n~~~\n````\nfour ```\n````\n",
+    "Short.",
+]
+
+def squash(html):
+    # Incremental rendering differs only in blank lines between blocks
+    return re.sub(r"\n+", "\n", html).strip()
+
+def chunked(text, seed):
+    rng = random.Random(seed)
+    pos = 0
+    while pos < len(text):
+        step = rng.randint(1, 12)
+        yield text[pos:pos + step]
+        pos += step
+
+@pytest.mark.parametrize("doc", DOCS)
+@pytest.mark.parametrize("max_length", [60, 150, 2048])
+def test_stream_matches_full_run(doc, max_length):
+    pipeline = chat_pipeline(max_length)
+    full = pipeline.run(doc)
+    for seed in range(3):
+        stream = pipeline.stream()
+        text = "".join(stream.feed(chunk).text for chunk in chunked(doc, seed))
+        ctx = stream.close()
+        assert ctx.text == full.text
+        assert text + stream.flushed == full.text
+        assert squash(ctx.html) == squash(full.html)
+        assert ctx.truncated == full.truncated
+
+def test_fence_hints_streaming():
+    doc = "```\ncode\n```\n  ```js\nx\n  ```\n```"
+    whole = FenceHinter().annotate(doc)
+    assert whole == "```plaintext\ncode\n```\n  ```js\nx\n  ```\n```plaintext"
+    hinter = FenceHinter()
+    assert "".join(hinter.feed(c) for c in doc) + hinter.close() == whole
+    # Ordinary text is not held back
+    assert FenceHinter().feed("Hello wor") == "Hello wor"
+
+def test_truncation_closes_code_fence():
+    doc = "Intro\n\n```python\n" + "print('x')\n" * 20 + "```\nafter"
+    out = truncate_markdown(doc, 80)
+    assert out.endswith("```\n...") and len(out) <= 83
+    assert open_fence(out, len(out)) is None
+    assert out.count("print('x')\n") == out.count("print('x')")
+
+def test_truncation_keeps_graphemes():
+    assert truncate_markdown("é" * 10, 5) == "éé..."
+    assert truncate_markdown("\U0001f44d\U0001f3fd" * 5, 3) == "\U0001f44d\U0001f3fd..."
+    assert truncate_markdown("ab\r\ncd", 3) == "ab..."
+
+def test_token_budget_and_stream_stops_early():
+    pipeline = Pipeline([TruncateStage(max_length=10_000, max_tokens=5)])
+    doc = "one two three four five six seven\neight nine ten\n"
+    full = pipeline.run(doc)
+    assert full.truncated and full.text == "one two three four five..."
+    stream = pipeline.stream()
+    fed = 0
+    for chunk in chunked(doc * 3, 1):
+        stream.feed(chunk)
+        fed += 1
+        if stream.done:
+            break
+    assert stream.done and stream.close().text.startswith("one two three four five")
+
+def test_timings_and_shared_tokenization():
+    ctx = asyncio.run(chat_pipeline().arun("Some **markdown** text."))
+    assert set(ctx.timings) == {"fence_hints", "links", "truncate", "render", "hallucination"}
+    assert ctx.html == "<p>Some <strong>markdown</strong> text.</p>"
+    first = ctx.offsets()
+    assert ctx.offsets() is first and ctx.token_count == len(first)
+
+def test_non_streaming_stage_runs_after_stream():
+    class Upper(FenceHintStage):
+        name = "upper"
+        streaming = False
+        def run(self, ctx):
+            ctx.text = ctx.text.upper()
+    pipeline = Pipeline([Upper(), RenderStage()])
+    stream = pipeline.stream()
+    # Stages after a non-streaming one run at close()
+    assert stream.feed("hello").html == ""
+    assert stream.close().html == pipeline.run("hello").html == "<p>HELLO</p>"
+
+def test_postprocess_output_legacy():
+    out = postprocess_output("```\ncode\n```", context=None, max_length=2048)
+    assert out == "```plaintext\ncode\n```"
+    out = postprocess_output("The moon is made of cheese.", context=["Paris is in France."])
+    assert out.endswith("[Warning: Possible hallucinated content detected!]")
@@ -0,0 +1,48 @@
+import os
+import sys
+import asyncio
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.server.health import HealthMonitor
+from backend.telemetry.metrics import DEPENDENCY_UP
+
+class Pinger:
+    def __init__(self):
+        self.calls = 0
+        self.down = False
+    def __call__(self):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("refused")
+
+def test_result_is_cached_between_background_checks():
+    ping = Pinger()
+    monitor = HealthMonitor("probe-test", ping, interval=60)
+    async def probe():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        results = [await monitor.aresult() for _ in range(100)]
+        await monitor.stop()
+        return results
+    results = asyncio.run(probe())
+    assert ping.calls == 1 and all(r.ok for r in results)
+    assert DEPENDENCY_UP.labels("probe-test").value == 1
+
+def test_failures_and_stale_results_are_not_ok():
+    ping = Pinger()
+    monitor = HealthMonitor("probe-test", ping, interval=1, max_age=2)
+    ping.down = True
+    result = monitor.check()
+    assert not result.ok and result.error == "ConnectionError: refused"
+    assert DEPENDENCY_UP.labels("probe-test").value == 0
+    ping.down = False
+    monitor.check()
+    monitor._last = monitor._last._replace(checked_at=time.time() - 5)
+    assert not monitor.last().ok and monitor.last().error.startswith("stale")
+
+def test_refreshed_on_read_without_a_monitor():
+    ping = Pinger()
+    monitor = HealthMonitor("probe-test", ping, interval=60)
+    assert asyncio.run(monitor.aresult()).ok
+    assert asyncio.run(monitor.aresult()).ok
+    assert ping.calls == 1
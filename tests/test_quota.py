@@ -0,0 +1,120 @@
+import os
+import sys
+import asyncio
+from datetime import datetime, timezone
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.orchestrator.orchestrator import LLMOrchestrator, PROVIDER_REGISTRY
+from backend.providers.mock import MockLLMProvider
+from backend.usage.quota import Budget, QuotaExceededError, QuotaManager, parse_budgets, quota_headers
+from backend.usage.tracker import UsageTracker
+
+@pytest.fixture
+def tracker():
+    mongomock = pytest.importorskip("mongomock")
+    db = mongomock.MongoClient().db
+    return UsageTracker(db.usage, db.usage_daily, tenant_collection=db.usage_tenant_daily)
+
+class Priced(MockLLMProvider):
+    calls = 0
+    input_cost_per_1k = 1.0
+    output_cost_per_1k = 1.0
+    def generate(self, prompt: str, **kwargs) -> str:
+        Priced.calls += 1
+        return "answer"
+    def name(self):
+        return "priced"
+
+def setup_function(_):
+    PROVIDER_REGISTRY["priced"] = Priced
+    Priced.calls = 0
+
+def teardown_function(_):
+    del PROVIDER_REGISTRY["priced"]
+
+def test_call_that_would_exceed_the_daily_tokens_is_denied(tracker):
+    quotas = QuotaManager(tracker, user_budget=Budget(tokens_per_day=1000))
+    tracker.record("alice", "mock", 700, 100, 0.0)
+    assert quotas.check("alice", tokens=200).allowed
+    decision = quotas.check("alice", tokens=201)
+    assert not decision.allowed and decision.denied.scope == "user"
+    headers = quota_headers(decision)
+    assert headers["X-Quota-Tokens-Limit"] == "1000" and headers["X-Quota-Tokens-Remaining"] == "200"
+    assert 0 < int(headers["Retry-After"]) <= 86400
+    assert "X-Quota-Cost-Limit" not in headers
+    assert quotas.check("bob", tokens=1000).allowed
+
+def test_monthly_cost_counts_earlier_days(tracker):
+    quotas = QuotaManager(tracker, user_budget=Budget(cost_per_month=1.0))
+    start_of_month = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    tracker.record("alice", "mock", 10, 10, 0.6, timestamp=start_of_month.timestamp())
+    tracker.flush_now()
+    fresh = QuotaManager(UsageTracker(tracker.collection, tracker.daily_collection), user_budget=Budget(cost_per_month=1.0))
+    for q in (quotas, fresh):
+        decision = q.check("alice", cost=0.5)
+        assert not decision.allowed
+        assert decision.denied.status.remaining_cost == pytest.approx(0.4)
+    assert int(quota_headers(decision)["Retry-After"]) > 0
+
+def test_reservations_hold_the_budget_until_released(tracker):
+    quotas = QuotaManager(tracker, user_budget=Budget(tokens_per_day=1000))
+    first = quotas.reserve(quotas.check("alice", tokens=600))
+    with pytest.raises(QuotaExceededError) as exc:
+        quotas.reserve(quotas.check("alice", tokens=600))
+    assert exc.value.retry_after > 0
+    tracker.record("alice", "mock", 100, 50, 0.0)  # actual usage of the first call
+    quotas.release(first)
+    assert quotas.check("alice", tokens=850).allowed
+    assert not quotas.check("alice", tokens=851).allowed
+
+def test_tenant_budget_is_shared_by_its_users(tracker):
+    quotas = QuotaManager(tracker, tenant_budget=Budget(tokens_per_day=500),
+                          overrides=parse_budgets('{"tenant:big": {"tokens_per_day": 100000}}'))
+    tracker.record("alice", "mock", 300, 100, 0.0, tenant_id="acme")
+    decision = quotas.check("bob", "acme", tokens=200)
+    assert not decision.allowed and decision.denied.scope == "tenant"
+    assert quota_headers(decision)["X-Quota-Scope"] == "tenant"
+    assert quotas.check("bob", tokens=200).allowed  # no user budget
+    assert quotas.check("bob", "big", tokens=200).allowed
+    tracker.flush_now()
+    assert tracker.tenant_collection.find_one({"tenant_id": "acme"})["tokens"] == 400
+
+def test_parse_budgets(tmp_path):
+    path = tmp_path / "quotas.json"
+    path.write_text('{"user:alice": {"cost_per_month": 5}}')
+    assert parse_budgets(str(path)) == {"user:alice": Budget(None, 5)}
+    assert parse_budgets("") == {}
+    with pytest.raises(ValueError):
+        parse_budgets('{"alice": {"tokens_per_day": 1}}')
+
+def test_orchestrator_checks_before_calling_and_reconciles(tracker):
+    quotas = QuotaManager(tracker, user_budget=Budget(tokens_per_day=10000, cost_per_month=10.0), output_estimate=100)
+    orch = LLMOrchestrator(["priced"], usage=tracker, quotas=quotas)
+    assert asyncio.run(orch.agenerate("a short prompt", user_id="alice")) == "answer"
+    assert orch.generate("a short prompt", user_id="alice") == "answer"
+    assert quotas._reserved == {}  # estimates replaced by the recorded usage
+    today, month = tracker.totals("user", "alice")
+    assert today.requests == 2 and month.cost == pytest.approx(today.tokens / 1000)
+
+    tracker.record("alice", "priced", 9950, 0, 0.0)
+    with pytest.raises(QuotaExceededError):
+        asyncio.run(orch.agenerate("a short prompt", user_id="alice"))
+    async def stream():
+        return [chunk async for chunk in orch.astream("a short prompt", user_id="alice")]
+    with pytest.raises(QuotaExceededError):
+        asyncio.run(stream())
+    assert Priced.calls == 2
+    assert asyncio.run(orch.agenerate("a short prompt")) == "answer"  # no user, no budget
+
+def test_stream_closed_early_is_charged_and_releases_its_reservation(tracker):
+    quotas = QuotaManager(tracker, user_budget=Budget(tokens_per_day=10000), output_estimate=100)
+    orch = LLMOrchestrator(["mock"], usage=tracker, quotas=quotas)
+    orch.providers[0] = MockLLMProvider(chunk_size=8, response="0123456789" * 10)
+    async def first_chunk():
+        chunks = orch.astream("a short prompt", user_id="alice")
+        await chunks.__anext__()
+        await chunks.aclose()
+    asyncio.run(first_chunk())
+    assert quotas._reserved == {}
+    remaining = quotas.check("alice").subjects[0].status.remaining_tokens
+    assert 10000 - 100 < remaining < 10000  # charged for what was sent, not the estimate
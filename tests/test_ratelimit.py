@@ -0,0 +1,59 @@
+import os
+import sys
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.ratelimit.limiter import InMemoryRateLimiter, MongoRateLimiter, ensure_rate_limit_indexes, rate_limit_headers
+
+def test_in_memory_limit_and_headers():
+    limiter = InMemoryRateLimiter(limit=3, window=60)
+    results = [limiter.hit("alice") for _ in range(4)]
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert results[2].remaining == 0
+    headers = rate_limit_headers(results[3], 60)
+    assert headers["RateLimit-Limit"] == "3"
+    assert headers["RateLimit-Remaining"] == "0"
+    assert int(headers["Retry-After"]) >= 1
+    # Other keys are independent
+    assert limiter.hit("bob").allowed
+
+def test_in_memory_reset():
+    limiter = InMemoryRateLimiter(limit=1, window=60)
+    assert limiter.hit("alice").allowed
+    assert not limiter.hit("alice").allowed
+    limiter.reset("alice")
+    assert limiter.hit("alice").allowed
+
+def test_in_memory_evicts_keys():
+    limiter = InMemoryRateLimiter(limit=5, window=60, max_keys=100)
+    for i in range(1000):
+        limiter.hit(f"user{i}")
+    assert len(limiter) == 100
+
+def test_mongo_limiter_shares_counts():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().db.rate_limits
+    worker_a = MongoRateLimiter(limit=2, window=60, collection=collection)
+    worker_b = MongoRateLimiter(limit=2, window=60, collection=collection)
+    assert worker_a.hit("alice").allowed
+    assert worker_b.hit("alice").allowed
+    assert not worker_a.hit("alice").allowed
+    assert not worker_b.hit("alice").allowed
+    worker_a.reset("alice")
+    assert worker_b.hit("alice").allowed
+
+def test_mongo_reset_leaves_longer_keys_alone():
+    mongomock = pytest.importorskip("mongomock")
+    limiter = MongoRateLimiter(limit=1, window=60, collection=mongomock.MongoClient().db.rate_limits)
+    limiter.hit("user:1")
+    limiter.hit("user:1:tenant")
+    limiter.reset("user:1")
+    assert limiter.hit("user:1").allowed
+    assert not limiter.hit("user:1:tenant").allowed
+
+def test_rate_limit_ttl_index():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().db.rate_limits
+    ensure_rate_limit_indexes(collection)
+    indexes = collection.index_information()
+    assert any(index.get("expireAfterSeconds") == 0 and index["key"] == [("expire_at", 1)]
+               for index in indexes.values())
@@ -0,0 +1,70 @@
+import os
+import re
+import sys
+import random
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.postprocessor.render import IncrementalMarkdown, MarkdownRenderer, get_renderer
+
+DOCS = [
+    "# Title\n\nSome *text* here.\nSecond line.\n\n```python\nprint('hi')\n\nx = 1\n```\n\nAfter code.\n",
+    "- a\n- b\n\n- c\n\n  continued para\n\nNext para\n\n1. one\n2. two\n",
+    "| A | B |\n|---|---|\n| 1 | 2 |\n\nText after table\n\n> quote\n> more\n\nend",
+    "Para with [link][1].\n\nAnother.\n\n[1]: http://example.com\n",
+    "Intro:\n```js\nconsole.log(1)\n```\nright after\n\n~~~\ntilde\n~~~\n",
+    "    indented code\n\n    more code\n\nnormal\n",
+    "Term\n: definition\n\n*[HTML]: Hyper Text\n\nHTML here\n",
+    "- item\n\n    ```\n    code in list\n    ```\n\n- next\n",
+]
+
+def squash(html):
+    # Blank lines between blocks are the only allowed difference
+    return re.sub(r"\n{2,}", "\n", html)
+
+def test_renderer_reuses_instance():
+    renderer = MarkdownRenderer()
+    first = renderer.render("Footnote[^1].\n\n[^1]: note")
+    assert renderer.render("Footnote[^1].\n\n[^1]: note") == first
+    assert "<h1>" in renderer.render("# Title")
+    assert get_renderer() is get_renderer()
+
+@pytest.mark.parametrize("doc", DOCS)
+def test_incremental_matches_full_render(doc):
+    renderer = get_renderer()
+    whole = renderer.render(doc)
+    rng = random.Random(len(doc))
+    for _ in range(10):
+        stream = IncrementalMarkdown(renderer)
+        i = 0
+        while i < len(doc):
+            step = rng.randint(1, 7)
+            stream.feed(doc[i:i + step])
+            i += step
+        assert squash(stream.close()) == squash(whole)
+
+def test_finished_blocks_commit_once():
+    stream = IncrementalMarkdown()
+    update = stream.feed("First paragraph.\n\n")
+    assert update.committed == "" and "First paragraph" in update.tail
+    # Boundaries are decided once the next line is complete
+    update = stream.feed("Second")
+    assert update.committed == ""
+    update = stream.feed(" paragraph.\n")
+    assert update.committed == "<p>First paragraph.</p>"
+    assert update.tail == "<p>Second paragraph.</p>"
+    update = stream.feed("\n```py\nx = 1\n```\n")
+    assert "Second paragraph" in update.committed and "codehilite" in update.committed
+    assert update.tail == ""
+
+def test_streaming_cost_is_linear_in_blocks():
+    renderer = MarkdownRenderer()
+    calls = []
+    original = renderer.render
+    renderer.render = lambda text: calls.append(len(text)) or original(text)
+    stream = IncrementalMarkdown(renderer)
+    doc = "".join(f"Paragraph {i} with some words.\n\n" for i in range(200))
+    for i in range(0, len(doc), 5):
+        stream.feed(doc[i:i + 5])
+    stream.close()
+    # Each render only sees the open block, never the growing document
+    assert max(calls) < 100
@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+import random
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.preprocessor.sanitizer import HtmlSanitizer, sanitize_html
+from backend.preprocessor.core import sanitize_input
+
+def test_strips_tags_scripts_and_comments():
+    assert sanitize_input('<script>alert(1)</script>Hello <b>world</b>') == "Hello world"
+    assert sanitize_input("<SCRIPT src=x></SCRIPT >ok") == "ok"
+    assert sanitize_input("<style>p{}</style>ok") == "ok"
+    assert sanitize_input("<!-- a > b -->ok") == "ok"
+    # An unclosed script drops the rest rather than leaking its body
+    assert sanitize_input("hi <script>alert(1)") == "hi"
+
+def test_literal_angle_brackets_kept():
+    assert sanitize_input("is 3 < 5?") == "is 3 < 5?"
+    assert sanitize_input("こんにちは世界! <b>Привет</b> 🌍") == "こんにちは世界! Привет 🌍"
+
+def test_encoded_and_double_encoded_markup():
+    assert sanitize_input("&lt;script&gt;alert(1)&lt;/script&gt;done") == "done"
+    assert sanitize_input("&amp;lt;b&amp;gt;hi") == "hi"
+    assert sanitize_input("&&#108;t;i&gt;x") == "x"
+    assert sanitize_input("Tom &amp; Jerry") == "Tom & Jerry"
+
+def test_chunked_feed_matches_whole():
+    rng = random.Random(3)
+    tokens = ["<", ">", "a", " ", "<script>", "</script>", "</scr", "<!--", "-->", "&", "&amp;", "lt;", "&#60;"]
+    for _ in range(300):
+        text = "".join(rng.choice(tokens) for _ in range(rng.randint(0, 30)))
+        sanitizer = HtmlSanitizer()
+        out = ""
+        i = 0
+        while i < len(text):
+            step = rng.randint(1, 5)
+            out += sanitizer.feed(text[i:i + step])
+            i += step
+        out += sanitizer.close()
+        assert out == sanitize_html(text), text
+
+def test_adversarial_inputs_are_linear():
+    # Each of these took seconds (or minutes) with the old lazy DOTALL regexes
+    for text in ["<" * 200_000, "<script>" * 25_000, "<script>" + "</scrip" * 25_000, "&amp;" * 40_000]:
+        start = time.perf_counter()
+        sanitize_html(text)
+        assert time.perf_counter() - start < 2.0
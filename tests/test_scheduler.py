@@ -0,0 +1,67 @@
+import os
+import sys
+import asyncio
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+from orchestrator.scheduler import OutboundScheduler, ProviderLimiter, ProviderBusyError, TokenBucket, QUERY_PRIORITIES
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.wait_time(60) == 0
+    bucket.consume(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0, abs=0.05)
+
+def test_concurrency_is_bounded():
+    scheduler = OutboundScheduler(default_limits={"max_concurrency": 2, "max_wait": 5})
+    peak = 0
+    active = 0
+
+    async def call(i):
+        nonlocal peak, active
+        async with scheduler.slot("p", user_id=f"u{i}"):
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    async def main():
+        await asyncio.gather(*(call(i) for i in range(10)))
+
+    asyncio.run(main())
+    assert peak == 2
+
+def test_quota_exhausted_fails_fast():
+    limiter = ProviderLimiter("p", requests_per_minute=1, max_wait=0.5)
+
+    async def main():
+        await limiter.acquire("u", 0, 1)
+        limiter.release()
+        await limiter.acquire("u", 0, 1)
+
+    with pytest.raises(ProviderBusyError) as info:
+        asyncio.run(main())
+    assert info.value.retry_after > 0.5
+
+def test_fair_queue_interleaves_users_and_honours_priority():
+    limiter = ProviderLimiter("p", max_concurrency=1, max_wait=5)
+    order = []
+
+    async def call(user, query_type):
+        await limiter.acquire(user, QUERY_PRIORITIES[query_type], 1)
+        order.append((user, query_type))
+        await asyncio.sleep(0.001)
+        limiter.release()
+
+    async def main():
+        # Hold the only slot so everything below queues up
+        await limiter.acquire("holder", 0, 1)
+        tasks = [asyncio.create_task(call("heavy", "qa")) for _ in range(3)]
+        tasks.append(asyncio.create_task(call("light", "qa")))
+        tasks.append(asyncio.create_task(call("bulk", "batch")))
+        await asyncio.sleep(0.01)
+        limiter.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order[:2] == [("heavy", "qa"), ("light", "qa")]
+    assert order[-1] == ("bulk", "batch")
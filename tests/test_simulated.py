@@ -0,0 +1,87 @@
+import os
+import sys
+import asyncio
+import random
+import time
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+from orchestrator.orchestrator import LLMOrchestrator
+from providers.base import ProviderError
+from providers.mock import MockLLMProvider
+from providers.simulated import SimulatedLLMProvider, parse_distribution
+
+FAST = {"ttfb_ms": "const:0", "token_ms": "const:0"}
+
+def collect(provider, prompt):
+    async def run():
+        return [chunk async for chunk in provider.astream(prompt)]
+    return asyncio.run(run())
+
+def test_distributions():
+    rng = random.Random(1)
+    assert parse_distribution("const:250")(rng) == 0.25
+    assert parse_distribution("40")(rng) == 0.04
+    assert 0.1 <= parse_distribution("uniform:100,200")(rng) <= 0.2
+    samples = sorted(parse_distribution("lognormal:400,0.5")(rng) for _ in range(2001))
+    assert 0.35 < samples[1000] < 0.45  # median
+    with pytest.raises(ValueError):
+        parse_distribution("pareto:1,2")
+
+def test_seeded_runs_are_reproducible_and_streams_match():
+    first = SimulatedLLMProvider(seed="42", **FAST)
+    second = SimulatedLLMProvider(seed="42", **FAST)
+    prompt = "Explain how the retry policy works for uploads"
+    assert first.generate(prompt) == second.generate(prompt)
+    assert "".join(collect(first, prompt)) == asyncio.run(second.agenerate(prompt))
+    assert first.generate(prompt) != first.generate(prompt)  # each call draws anew
+
+def test_length_scales_with_the_prompt():
+    provider = SimulatedLLMProvider(seed="1", min_tokens=1, max_tokens=10_000, **FAST)
+    short = [len(provider.generate("word " * 20).split()) for _ in range(20)]
+    long = [len(provider.generate("word " * 200).split()) for _ in range(20)]
+    assert sum(long) > 5 * sum(short)
+    capped = SimulatedLLMProvider(seed="1", min_tokens=1, max_tokens=30, **FAST)
+    assert len(capped.generate("word " * 200).split()) == 30
+    assert len(capped.generate("word " * 200, max_tokens=5).split()) == 5
+
+def test_streams_token_by_token_with_ttfb():
+    provider = SimulatedLLMProvider(ttfb_ms="const:50", token_ms="const:10", min_tokens=10, max_tokens=10, seed="3")
+    start = time.perf_counter()
+    chunks = collect(provider, "hi")
+    elapsed = time.perf_counter() - start
+    assert len(chunks) == 10
+    assert 0.12 < elapsed < 0.5
+
+def test_injected_errors():
+    limited = SimulatedLLMProvider(rate_limit_rate=1.0, retry_after=2.5, **FAST)
+    with pytest.raises(ProviderError) as info:
+        limited.generate("hi")
+    assert info.value.status_code == 429 and info.value.retry_after == 2.5
+    failing = SimulatedLLMProvider(error_rate=1.0, **FAST)
+    with pytest.raises(ProviderError) as info:
+        collect(failing, "hi")
+    assert info.value.status_code == 503
+    rates = SimulatedLLMProvider(error_rate=0.3, seed="9", **FAST)
+    errors = 0
+    for _ in range(1000):
+        try:
+            rates.generate("hi")
+        except ProviderError:
+            errors += 1
+    assert 250 < errors < 350
+
+def test_selected_through_llm_provider_and_failed_over(monkeypatch):
+    monkeypatch.setenv("SIM_RATE_LIMIT_RATE", "1")
+    monkeypatch.setenv("SIM_RETRY_AFTER", "0")
+    monkeypatch.setenv("SIM_TTFB_MS", "0")
+    monkeypatch.setenv("LLM_PROVIDER", "simulated,mock")
+    orch = LLMOrchestrator(max_retries=2, backoff_base=0.001)
+    assert orch.get_active_provider_names() == ["simulated", "mock"]
+    assert asyncio.run(orch.agenerate("hi")) in MockLLMProvider().responses
+
+def test_slow_first_token_hits_the_attempt_timeout(monkeypatch):
+    monkeypatch.setenv("SIM_TTFB_MS", "const:500")
+    orch = LLMOrchestrator(["simulated", "mock"], max_retries=1, attempt_timeout=0.05)
+    start = time.perf_counter()
+    assert asyncio.run(orch.agenerate("hi")) in MockLLMProvider().responses
+    assert time.perf_counter() - start < 0.4
@@ -0,0 +1,74 @@
+import os
+import sys
+import base64
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.providers import tokenizer as tok
+from backend.providers.tokenizer import BPETokenizer, HeuristicTokenizer, get_tokenizer, register_tokenizer
+from backend.preprocessor.prompt import build_prompt, fit_to_budget, trim_to_max_tokens
+
+def small_vocab():
+    ranks = {bytes([b]): b for b in range(256)}
+    for merge in [b"he", b"ll", b"hell", b"hello", b" w", b"or", b" wor", b"ld", b" world"]:
+        ranks[merge] = len(ranks)
+    return ranks
+
+def test_bpe_merges_by_rank():
+    bpe = BPETokenizer(small_vocab())
+    assert bpe.encode("hello") == [259]
+    assert bpe.encode("hello world") == [259, 264]
+    assert bpe.encode("help") == [256, ord("l"), ord("p")]
+    assert bpe.count("hello world") == 2
+
+def test_bpe_offsets_and_truncation_respect_characters():
+    bpe = BPETokenizer(small_vocab())
+    assert bpe.offsets("hello world") == [5, 11]
+    assert bpe.truncate("hello world", 1) == "hello"
+    # "é" is two bytes (two tokens): cutting after the first byte rounds down to a character boundary
+    text = "héllo"
+    assert bpe.offsets(text)[:3] == [1, 1, 2]
+    assert bpe.truncate(text, 2) == "h"
+
+def test_bpe_vocab_file_roundtrip(tmp_path):
+    path = tmp_path / "vocab.tiktoken"
+    path.write_text("\n".join(f"{base64.b64encode(t).decode()} {r}" for t, r in small_vocab().items()))
+    bpe = BPETokenizer.from_file(str(path))
+    assert bpe.encode("hello world") == [259, 264]
+    assert bpe.encode_batch(["hello", "world"]) == [[259], [ord("w"), 261, 263]]
+
+def test_heuristic_estimates():
+    h = HeuristicTokenizer()
+    assert h.count("hello world") == 2
+    assert h.count("internationalization") == 4
+    assert h.count("こんにちは") == 3
+    assert h.truncate("one two three four", 2) == "one two"
+
+def test_count_cache_keyed_by_text():
+    h = HeuristicTokenizer(cache_size=2)
+    h.count("a b c")
+    h.count("a b c")
+    assert h.cache_info()["hits"] == 1
+    h.count("x")
+    h.count("y")
+    assert h.cache_info()["size"] == 2
+
+def test_per_provider_configuration(tmp_path, monkeypatch):
+    path = tmp_path / "vocab.tiktoken"
+    path.write_text("\n".join(f"{base64.b64encode(t).decode()} {r}" for t, r in small_vocab().items()))
+    monkeypatch.setenv("TOKENIZER_VOCAB_TESTPROV", str(path))
+    monkeypatch.setattr(tok, "_tokenizers", {})
+    assert isinstance(get_tokenizer("testprov"), BPETokenizer)
+    assert isinstance(get_tokenizer("otherprov"), HeuristicTokenizer)
+    register_tokenizer("otherprov", BPETokenizer(small_vocab()))
+    assert get_tokenizer("otherprov").count("hello") == 1
+
+def test_prompt_budget_fitting():
+    text = "word " * 500
+    assert len(trim_to_max_tokens(text, 200).split()) == 200
+    trimmed = fit_to_budget(text.strip(), "qa", 200, 500)
+    assert len(build_prompt(trimmed, "qa")) <= 500
+    assert len(trimmed.split()) <= 200
+    assert fit_to_budget("short question", "qa", 200, 500) == "short question"
+    assert fit_to_budget("x", "qa", 200, 10) is None
+    # Cut between words only: a word that does not fit is dropped, never truncated
+    assert fit_to_budget("x" * 501, "qa", 200, 500) is None
+    assert fit_to_budget("hello " + "x" * 501, "qa", 200, 500) == "hello"
@@ -0,0 +1,95 @@
+import os
+import sys
+import asyncio
+import json
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+from orchestrator.orchestrator import LLMOrchestrator, PROVIDER_REGISTRY
+from providers.mock import MockLLMProvider
+from telemetry.tracing import (STATUS_ERROR, FileExporter, InMemoryExporter, Tracer, configure_tracing,
+                               current_span, format_traceparent, inject, parse_traceparent, span)
+
+@pytest.fixture
+def exporter():
+    exporter = InMemoryExporter()
+    configure_tracing(exporter, sample_ratio=1.0)
+    yield exporter
+    configure_tracing(None)
+
+def test_traceparent_round_trip():
+    header = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    context = parse_traceparent(header)
+    assert context.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+    assert context.sampled and context.remote
+    assert format_traceparent(context) == header
+    assert parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+    assert parse_traceparent("garbage") is None
+
+def test_nested_spans_and_errors(exporter):
+    with pytest.raises(ValueError):
+        with span("outer", {"k": 1}) as outer:
+            with span("inner") as inner:
+                assert current_span() is inner
+                assert inject({})["traceparent"] == inner.traceparent()
+            raise ValueError("boom")
+    assert current_span() is None
+    configure_tracing(None)  # flushes the old tracer
+    by_name = {s.name: s for s in exporter.spans}
+    assert by_name["inner"].parent_id == by_name["outer"].context.span_id
+    assert by_name["inner"].context.trace_id == by_name["outer"].context.trace_id
+    assert by_name["outer"].status == STATUS_ERROR
+    assert by_name["outer"].to_otlp()["attributes"] == [{"key": "k", "value": {"intValue": "1"}}]
+
+def test_head_sampling_follows_the_root():
+    exporter = InMemoryExporter()
+    tracer = Tracer(exporter, sample_ratio=0.0)
+    with tracer.span("root") as root:
+        with tracer.span("child") as child:
+            pass
+    assert not root.recording and not child.recording
+    assert child.context.trace_id == root.context.trace_id  # ids still propagate
+    # A sampled remote parent is followed even with a 0 ratio
+    remote = parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01")
+    with tracer.span("server", parent=remote) as server:
+        pass
+    tracer.flush()
+    assert exporter.names() == ["server"]
+    assert server.parent_id == "00f067aa0ba902b7"
+
+def test_sample_ratio_is_respected():
+    tracer = Tracer(InMemoryExporter(), sample_ratio=0.25)
+    sampled = sum(tracer.start_span("s").recording for _ in range(4000))
+    assert 800 < sampled < 1200
+
+def test_file_exporter_writes_otlp_json(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer(FileExporter(str(path), "test-service"))
+    with tracer.span("op", {"ok": True}):
+        pass
+    tracer.shutdown()
+    record = json.loads(path.read_text().splitlines()[0])
+    assert record["name"] == "op"
+    assert len(record["traceId"]) == 32 and len(record["spanId"]) == 16
+    assert record["attributes"] == [{"key": "ok", "value": {"boolValue": True}}]
+    assert record["resource"] == {"service.name": "test-service"}
+
+def test_provider_attempts_retries_and_failover(exporter):
+    class Flaky(MockLLMProvider):
+        async def agenerate(self, prompt: str, **kwargs):
+            raise RuntimeError("down")
+        def name(self):
+            return "flaky"
+    PROVIDER_REGISTRY["flaky"] = Flaky
+    try:
+        orch = LLMOrchestrator(["flaky", "mock"], max_retries=2, backoff_base=0.001)
+        asyncio.run(orch.agenerate("hi"))
+    finally:
+        del PROVIDER_REGISTRY["flaky"]
+    configure_tracing(None)
+    attempts = [s for s in exporter.spans if s.name == "llm.attempt"]
+    assert [(s.attributes["llm.provider"], s.attributes["llm.attempt"]) for s in attempts] == [
+        ("flaky", 1), ("flaky", 2), ("mock", 1)]
+    assert [s.status for s in attempts] == [STATUS_ERROR, STATUS_ERROR, 0]
+    generate = next(s for s in exporter.spans if s.name == "llm.generate")
+    assert all(s.parent_id == generate.context.span_id for s in attempts)
+    assert generate.attributes["llm.provider"] == "mock"
@@ -0,0 +1,133 @@
+import os
+import sys
+import asyncio
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.orchestrator.orchestrator import LLMOrchestrator
+from backend.providers.mock import MockLLMProvider
+from backend.usage.tracker import UsageTracker, usage_day
+
+@pytest.fixture
+def db():
+    mongomock = pytest.importorskip("mongomock")
+    return mongomock.MongoClient().db
+
+def test_flush_writes_records_and_daily_rollups(db):
+    tracker = UsageTracker(db.usage, db.usage_daily)
+    tracker.record("alice", "mock", 10, 5, 0.01)
+    tracker.record("alice", "mock", 20, 10, 0.02)
+    tracker.record("bob", "mock", 1, 1, 0.0)
+    tracker.record("alice", "mock", 7, 3, 0.0, timestamp=0)  # another day
+    assert db.usage.count_documents({}) == 0  # nothing written on the request path
+    assert tracker.flush_now() == 4
+    assert db.usage.count_documents({}) == 4
+    rollup = db.usage_daily.find_one({"_id": f"alice:{usage_day()}"})
+    assert (rollup["requests"], rollup["prompt_tokens"], rollup["completion_tokens"], rollup["tokens"]) == (2, 30, 15, 45)
+    assert rollup["cost"] == pytest.approx(0.03)
+    assert db.usage_daily.find_one({"_id": "alice:1970-01-01"})["tokens"] == 10
+    assert tracker.flush_now() == 0
+
+def test_totals_include_unflushed_records_and_other_workers(db):
+    worker1 = UsageTracker(db.usage, db.usage_daily)
+    worker2 = UsageTracker(db.usage, db.usage_daily, refresh_interval=0)
+    worker1.record("alice", "mock", 100, 50, 0.5)
+    assert worker1.usage_today("alice").tokens == 150
+    worker1.flush_now()
+    worker1.record("alice", "mock", 10, 0, 0.0)
+    assert worker1.usage_today("alice").tokens == 160
+    assert worker2.usage_today("alice").tokens == 150  # sees what worker1 has written
+    worker2.record("alice", "mock", 5, 5, 0.0)
+    assert worker2.usage_today("alice").tokens == 160
+
+def test_quota_check_reads_the_cached_total(db):
+    tracker = UsageTracker(db.usage, db.usage_daily, refresh_interval=60)
+    tracker.record("alice", "mock", 800, 100, 0.9)
+    status = tracker.check("alice", max_tokens=1000, max_cost=1.0)
+    assert status.allowed and status.remaining_tokens == 100 and status.remaining_cost == pytest.approx(0.1)
+    # Within the refresh interval the rollup is not read again
+    db.usage_daily.update_one({"_id": f"alice:{usage_day()}"}, {"$inc": {"tokens": 10 ** 6}}, upsert=True)
+    tracker.record("alice", "mock", 100, 0, 0.0)
+    status = tracker.check("alice", max_tokens=1000)
+    assert not status.allowed and status.remaining_tokens == 0 and status.remaining_cost is None
+    assert tracker.check("alice").allowed  # no limits
+
+def test_failed_flush_is_retried(db):
+    tracker = UsageTracker(db.usage, db.usage_daily)
+    original = tracker.daily_collection
+    class Down:
+        def update_one(self, *args, **kwargs):
+            raise ConnectionError("down")
+    tracker.daily_collection = Down()
+    tracker.record("alice", "mock", 1, 1, 0.0)
+    assert tracker.flush_now() == 0
+    assert tracker.stats()["buffered"] == 1
+    tracker.daily_collection = original
+    assert tracker.flush_now() == 1  # the records inserted by the failed attempt are not duplicated
+    assert db.usage.count_documents({}) == 1
+    assert db.usage_daily.find_one({"_id": f"alice:{usage_day()}"})["requests"] == 1
+
+def test_retried_flush_does_not_count_rollups_twice(db):
+    tracker = UsageTracker(db.usage, db.usage_daily)
+    original = tracker.daily_collection
+    class FailsSecond:
+        calls = 0
+        def update_one(self, *args, **kwargs):
+            FailsSecond.calls += 1
+            if FailsSecond.calls == 2:
+                raise ConnectionError("down")
+            return original.update_one(*args, **kwargs)
+    tracker.daily_collection = FailsSecond()
+    tracker.record("alice", "mock", 1, 1, 0.0)
+    tracker.record("bob", "mock", 1, 1, 0.0)
+    assert tracker.flush_now() == 0  # alice's rollup was applied, bob's was not
+    tracker.record("alice", "mock", 1, 1, 0.0)
+    assert tracker.flush_now() == 3
+    assert db.usage.count_documents({}) == 3
+    assert db.usage_daily.find_one({"_id": f"alice:{usage_day()}"})["requests"] == 2
+    assert db.usage_daily.find_one({"_id": f"bob:{usage_day()}"})["requests"] == 1
+    assert tracker.stats()["buffered"] == 0
+
+def test_background_writer_flushes_full_batches(db):
+    async def main():
+        tracker = UsageTracker(db.usage, db.usage_daily, batch_size=3, flush_interval=60)
+        tracker.start()
+        for _ in range(3):
+            tracker.record("alice", "mock", 1, 1, 0.0)
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if db.usage.count_documents({}) == 3:
+                break
+        tracker.record("alice", "mock", 1, 1, 0.0)
+        await tracker.stop()
+    asyncio.run(main())
+    assert db.usage.count_documents({}) == 4
+
+def test_provider_cost_covers_input_and_output(db):
+    class Priced(MockLLMProvider):
+        input_cost_per_1k = 1.0
+        output_cost_per_1k = 2.0
+    assert Priced().estimate_cost(1000, 500) == pytest.approx(2.0)
+    assert MockLLMProvider().estimate_cost("hello", "world") == 0.0
+    tracker = UsageTracker(db.usage, db.usage_daily)
+    orch = LLMOrchestrator(["mock"], usage=tracker)
+    response = asyncio.run(orch.agenerate("Tell me something", user_id="alice", query_type="code"))
+    tracker.flush_now()
+    record = db.usage.find_one({"user_id": "alice"})
+    assert record["provider"] == "mock" and record["query_type"] == "code"
+    assert record["prompt_tokens"] > 0 and record["completion_tokens"] == MockLLMProvider().count_tokens(response)
+
+def test_stream_closed_early_records_what_was_sent(db):
+    tracker = UsageTracker(db.usage, db.usage_daily)
+    orch = LLMOrchestrator(["mock"], usage=tracker)
+    orch.providers[0] = provider = MockLLMProvider(latency=0, chunk_size=8, response="0123456789" * 10)
+    async def first_chunk():
+        chunks = orch.astream("Tell me something", user_id="alice")
+        chunk = await chunks.__anext__()
+        await chunks.aclose()  # truncated by the pipeline, or the client went away
+        return chunk
+    chunk = asyncio.run(first_chunk())
+    assert tracker.stats()["buffered"] == 1
+    tracker.flush_now()
+    record = db.usage.find_one({"user_id": "alice"})
+    assert record["prompt_tokens"] == provider.count_tokens("Tell me something")
+    assert record["completion_tokens"] == provider.count_tokens(chunk) > 0